@@ -1,12 +1,17 @@
-import requests
 import base64
 import json
+import logging
+import mimetypes
 import re
 import os
 from dotenv import load_dotenv
 
+from llm_client import LLMClientError, get_client
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
 IMAGE_PATH = "sample_receipt_images/3.png"
@@ -38,6 +43,7 @@ def extract_json_from_response(response_text):
 
 def extract_receipt_details(image_path):
     base64_image = encode_image(image_path)
+    mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
     payload = {
         "model": "llama-3.2-90b-vision-preview",
         "messages": [
@@ -63,7 +69,7 @@ Ensure the extracted details are correctly assigned to the appropriate fields
                     },
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                        "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}
                     }
                 ]
             }
@@ -78,23 +84,19 @@ Ensure the extracted details are correctly assigned to the appropriate fields
         "Content-Type": "application/json"
     }
 
-    response = requests.post(ENDPOINT, headers=headers, json=payload)
-
-    # Check HTTP status code
-    if response.status_code != 200:
-        print("Error from server:", response.status_code)
-        print("Response text:", response.text)
-        return {"error": "API request failed", "status_code": response.status_code}
-
-    response_data = response.json()
+    try:
+        response_data = get_client().post_json(ENDPOINT, payload, headers)
+    except LLMClientError as e:
+        logger.warning("LLM request failed (status %s): %s", e.status_code, e.details)
+        return {"error": "API request failed", "status_code": e.status_code}
 
     # Check if 'choices' is in the response
     if "choices" not in response_data or not response_data["choices"]:
-        print("Unexpected response:", response_data)
+        logger.warning("Unexpected LLM response: %s", response_data)
         return {"error": "No choices in response"}
 
     raw_content = response_data["choices"][0]["message"]["content"]
-    print("Raw API Response:", raw_content)  # for debugging
+    logger.debug("Raw API response: %s", raw_content)
 
     # Extract JSON from response
     data = extract_json_from_response(raw_content)
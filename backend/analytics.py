@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import numpy as np
+
+import db_handler
+
+# Server-side spending analytics. Category x month totals come from the
+# monthly_totals rollup (a few rows per month, not one per expense) and are
+# pivoted into a NumPy matrix, so trends, rolling averages and deltas are
+# whole-array operations. Merchant rankings come from the merchant_totals rollup.
+DEFAULT_MONTHS = 12
+DEFAULT_WINDOW = 3
+DEFAULT_TOP_MERCHANTS = 10
+
+
+def month_range(end_month, count):
+    """The `count` YYYY-MM months ending at `end_month`, oldest first."""
+    year, month = map(int, end_month.split("-"))
+    index = year * 12 + month - 1
+    return [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(index - count + 1, index + 1)]
+
+
+def rolling_mean(values, window):
+    """Trailing mean over up to `window` months (shorter at the start of the series)."""
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def month_over_month(values):
+    """Absolute and percentage change from the previous month (None where undefined)."""
+    delta = np.diff(values, prepend=np.nan)
+    previous = np.concatenate(([np.nan], values[:-1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(previous > 0, delta / previous * 100, np.nan)
+    return delta, pct
+
+
+def _rounded(array):
+    return [None if np.isnan(value) else round(float(value), 2) for value in array]
+
+
+def get_analytics(username, months=DEFAULT_MONTHS, end_month=None, window=DEFAULT_WINDOW,
+                  top_merchants=DEFAULT_TOP_MERCHANTS):
+    """Per-category, per-month and per-merchant spend summaries for a user."""
+    end_month = end_month or datetime.now().strftime("%Y-%m")
+    labels = month_range(end_month, months)
+
+    try:
+        with db_handler.get_connection() as conn:
+            rollup = conn.execute("SELECT month, category, total, count FROM monthly_totals "
+                                  "WHERE username = ? AND month BETWEEN ? AND ?",
+                                  (username, labels[0], labels[-1])).fetchall()
+            merchants = conn.execute("SELECT name, SUM(total), SUM(count) FROM merchant_totals "
+                                     "WHERE username = ? AND month BETWEEN ? AND ? "
+                                     "GROUP BY name ORDER BY 2 DESC LIMIT ?",
+                                     (username, labels[0], labels[-1], top_merchants)).fetchall()
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+    # Pivot the rollup rows into a categories x months matrix in one scatter-add.
+    categories = sorted({row[1] for row in rollup})
+    month_index = {label: i for i, label in enumerate(labels)}
+    category_index = {category: i for i, category in enumerate(categories)}
+    matrix = np.zeros((len(categories), len(labels)))
+    counts = np.zeros(len(labels), dtype=np.int64)
+    if rollup:
+        rows = np.array([category_index[row[1]] for row in rollup])
+        cols = np.array([month_index[row[0]] for row in rollup])
+        np.add.at(matrix, (rows, cols), [row[2] for row in rollup])
+        np.add.at(counts, cols, [row[3] for row in rollup])
+
+    monthly = matrix.sum(axis=0)
+    category_totals = matrix.sum(axis=1)
+    delta, pct = month_over_month(monthly)
+    order = np.argsort(-category_totals)
+    grand_total = category_totals.sum()
+
+    return {
+        "success": True,
+        "months": labels,
+        "monthly_totals": _rounded(monthly),
+        "monthly_counts": counts.tolist(),
+        "rolling_average": _rounded(rolling_mean(monthly, window)),
+        "month_over_month": {"delta": _rounded(delta), "percent": _rounded(pct)},
+        "categories": [
+            {
+                "category": categories[i],
+                "total": round(float(category_totals[i]), 2),
+                "share": round(float(category_totals[i] / grand_total * 100), 2) if grand_total else 0.0,
+                "monthly": _rounded(matrix[i]),
+            }
+            for i in order
+        ],
+        "top_merchants": [{"name": row[0], "total": round(row[1], 2), "count": row[2]} for row in merchants],
+        "total_spent": round(float(grand_total), 2),
+    }
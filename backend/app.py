@@ -1,11 +1,67 @@
-from flask import Flask, request, jsonify
+import os
+import re
+
+import click
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import analytics
+import auth
+import budgets
 import db_handler
-import base64
-from receipt_extractor import extract_receipt_details
+import duplicates
+import exporter
+import idempotency
+import image_preprocess
+import jobs
+import metrics
+import migrations
+import passwords
+import profiler
+import receipt_cache
+import receipt_pipeline
+import response_cache
+import search
+import statement_import
 
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
+profiler.init_app(app)
+auth.init_app(app)
+metrics.register_stats("receipt_cache", receipt_cache.stats)
+metrics.register_stats("response_cache", response_cache.stats)
+metrics.register_stats("image_preprocess", image_preprocess.stats)
+metrics.register_stats("password_hash", passwords.stats)
+
+MAX_BATCH_FILES = 50
+
+
+def init_schema():
+    """Creates or migrates every table; returns the migration versions applied.
+
+    Runs once per start (gunicorn's master, `flask init-db` or `python app.py`),
+    not as an import side effect in every worker.
+    """
+    applied = migrations.migrate()
+    idempotency.purge_expired()
+    return applied
+
+
+def init_worker():
+    """Per-process startup: pick up receipt jobs interrupted by the last shutdown."""
+    started_at = os.getenv("SERVER_STARTED_AT")
+    return jobs.resume_pending(float(started_at) if started_at else None)
+
+
+def shutdown_worker():
+    """Lets running receipt jobs finish (queued ones stay queued for the next start) and closes the DB pool."""
+    jobs.shutdown(wait=True)
+    db_handler.close_connections()
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/api/hello')
 def hello_world():
@@ -23,11 +79,16 @@ def signup():
         return jsonify({"success": False, "message": f"Missing fields: {', '.join(missing_fields)}"}), 400
 
     result = db_handler.signup_user(data['username'], data['name'], data['email'], data['password'])
+    if result.get("busy"):
+        return jsonify(result), 503, {"Retry-After": "1"}
+    if result["success"]:
+        response_cache.invalidate(data['username'], "profile")  # drop a cached "User not found."
     return jsonify(result)
 
 @app.route('/api/get_user_info', methods=['GET'])
+@response_cache.cached("profile")
 def get_user_info():
-    username = request.args.get('username')
+    username = auth.current_user()
 
     if not username:
         return jsonify({"success": False, "message": "Username is required."}), 400
@@ -48,49 +109,155 @@ def signin():
     else:
         result = db_handler.signin_user_by_username(data['username'], data['password'])
 
+    if result.get("busy"):
+        return jsonify(result), 503, {"Retry-After": "1"}
+    if result["success"]:
+        result["token"], result["expires_in"] = auth.issue_token(result["username"])
     return jsonify(result)
 
 
 @app.route('/api/add_expense', methods=['POST'])
+@idempotency.idempotent
 def add_expense():
+    """
+    Add an expense. A likely duplicate (same merchant, date and amount) is
+    flagged by default; send `on_duplicate` "reject" to refuse it (409) or
+    "allow" to skip the check. Send an Idempotency-Key header to make retries safe."""
     data = request.get_json()
+    username = auth.current_user()
 
-    required_fields = ['username', 'name', 'amount', 'category', 'date']
-    missing_fields = [field for field in required_fields if field not in data or not data[field]]
+    required_fields = ['name', 'amount', 'category', 'date']
+    missing_fields = (['username'] if not username else []) + [
+        field for field in required_fields if field not in data or not data[field]]
 
     if missing_fields:
         return jsonify({"success": False, "message": f"Missing fields: {', '.join(missing_fields)}"}), 400
 
-    result = db_handler.add_expense(data['username'], data['name'], data['amount'], data['category'], data['date'])
-    return jsonify(result)
+    on_duplicate = data.get('on_duplicate', duplicates.DEFAULT_POLICY)
+    if on_duplicate not in db_handler.DUPLICATE_POLICIES:
+        return jsonify({"success": False, "message": f"on_duplicate must be one of: "
+                        f"{', '.join(db_handler.DUPLICATE_POLICIES)}."}), 400
+
+    result = db_handler.add_expense(username, data['name'], data['amount'], data['category'], data['date'],
+                                    on_duplicate=on_duplicate)
+    if result["success"]:
+        response_cache.invalidate(username, "expenses")
+    return jsonify(result), (409 if result.get("duplicate") else 200)
 
 @app.route('/api/get_expenses', methods=['GET'])
+@response_cache.cached("expenses")
 def get_expenses():
-    username = request.args.get('username')
+    username = auth.current_user()
 
     if not username:
         return jsonify({"success": False, "message": "Username is required."}), 400
 
-    result = db_handler.get_expenses(username)
-    return jsonify(result)
+    limit = request.args.get('limit')
+    if limit is not None and not limit.isdigit():
+        return jsonify({"success": False, "message": "limit must be a positive integer."}), 400
+
+    result = db_handler.get_expenses(
+        username,
+        limit=int(limit) if limit else None,
+        cursor=request.args.get('cursor'),
+        start_date=request.args.get('start_date'),
+        end_date=request.args.get('end_date'),
+        categories=request.args.getlist('category'),
+        search=request.args.get('q'),
+        sort=request.args.get('sort', 'date_desc'),
+    )
+    return jsonify(result), (200 if result.get("success") else 400)
+
+@app.route('/api/search_expenses', methods=['GET'])
+@response_cache.cached("expenses")
+def search_expenses():
+    """Ranked full-text search over a user's expense names, with prefix and fuzzy matching."""
+    username = auth.current_user()
+    query = request.args.get('q')
+
+    if not username or not query:
+        return jsonify({"success": False, "message": "Username and q are required."}), 400
+
+    limit = request.args.get('limit', '50')
+    if not limit.isdigit():
+        return jsonify({"success": False, "message": "limit must be a positive integer."}), 400
+
+    result = search.search_expenses(
+        username,
+        query,
+        limit=int(limit),
+        cursor=request.args.get('cursor'),
+        sort=request.args.get('sort', 'relevance'),
+        fuzzy=request.args.get('fuzzy', '1') != '0',
+    )
+    return jsonify(result), (200 if result.get("success") else 400)
+
+@app.route('/api/duplicates', methods=['GET'])
+@response_cache.cached("expenses")
+def get_duplicates():
+    """Groups of a user's expenses that look like duplicates of each other."""
+    username = auth.current_user()
+
+    if not username:
+        return jsonify({"success": False, "message": "Username is required."}), 400
+
+    result = duplicates.find_duplicates(username)
+    return jsonify(result), (200 if result.get("success") else 500)
+
+@app.route('/api/export_expenses', methods=['GET'])
+def export_expenses():
+    """
+    Stream a user's expense history as NDJSON, CSV or Parquet, oldest first.
+
+    Optional `start_date` / `end_date` limit the range. Rows are read from the
+    database in batches while the response is being sent."""
+    username = auth.current_user()
+    if not username:
+        return jsonify({"success": False, "message": "Username is required."}), 400
+
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in exporter.available_formats():
+        return jsonify({"success": False,
+                        "message": f"Unsupported format. Use one of: {', '.join(exporter.available_formats())}."}), 400
+
+    rows = db_handler.iter_expenses(username, request.args.get('start_date'), request.args.get('end_date'))
+    body, mimetype, extension = exporter.stream(rows, file_format)
+    return Response(body, mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="expenses-{username}.{extension}"',
+    })
 
 @app.route('/api/delete_expenses', methods=['POST'])
 def delete_expenses():
     data = request.get_json()
+    username = auth.current_user()
     expense_ids = data.get("expense_ids", [])
 
+    if not username:
+        return jsonify({"success": False, "message": "Username is required."}), 400
     if not expense_ids:
         return jsonify({"success": False, "message": "No expenses selected for deletion."}), 400
 
-    result = db_handler.delete_expenses(expense_ids)
+    # Only the user's own expenses among the ids go.
+    result = db_handler.delete_expenses(expense_ids, username)
+    if result["success"]:
+        response_cache.invalidate(result["usernames"], "expenses")
     return jsonify(result)
 
 @app.route('/api/upload_expense', methods=['POST'])
+@idempotency.idempotent
 def upload_expense():
     """
-    Upload a receipt image, extract structured data using LLM, and save it to the expenses database."""
+    Queue a receipt image for LLM extraction; the expense is saved in the background.
+
+    Returns a job id right away (HTTP 202); poll /api/upload_status for the result.
+    Extractions are cached by image content; send `no_cache=1` or a
+    `Cache-Control: no-cache` header to force a fresh LLM call.
+    A receipt file the user already uploaded (byte for byte) fails the job unless
+    `on_duplicate` is "flag" or "allow"; an expense matching another one's
+    merchant, date and amount, or a similar-looking receipt with the same date
+    and amount, is flagged. Send an Idempotency-Key header to make retries safe."""
 
-    username = request.form.get('username') or (request.json.get('username') if request.is_json else None)
+    username = auth.current_user()
     if not username:
         return jsonify({"success": False, "message": "Username is required"}), 400
 
@@ -101,47 +268,154 @@ def upload_expense():
     if image_file.filename == '':
         return jsonify({"success": False, "message": "Empty file name."}), 400
 
-    image_data = image_file.read() 
-    image_base64 = base64.b64encode(image_data).decode('utf-8')
-
-    details = extract_receipt_details(image_base64)
-    if 'error' in details:
-        return jsonify({
-            "success": False,
-            "message": f"Error extracting receipt: {details['error']}",
-            "details": details.get("details")
-        }), 500
-
-    required_fields = ["amount", "category", "date", "name"]
-    for field in required_fields:
-        if field not in details:
-            return jsonify({"success": False, "message": f"Missing '{field}' in extracted data."}), 400
-
-    result = db_handler.add_expense(
-        username=username,
-        name=details["name"],
-        amount=details["amount"],
-        category=details["category"],
-        date=details["date"]
-    )
+    image_data = image_file.read()
+    bypass_cache = request.form.get('no_cache') in ('1', 'true') or 'no-cache' in request.headers.get('Cache-Control', '')
+
+    on_duplicate = request.form.get('on_duplicate', duplicates.RECEIPT_POLICY)
+    if on_duplicate not in db_handler.DUPLICATE_POLICIES:
+        return jsonify({"success": False, "message": f"on_duplicate must be one of: "
+                        f"{', '.join(db_handler.DUPLICATE_POLICIES)}."}), 400
+
+    result = jobs.submit_receipt(username, image_data, bypass_cache, on_duplicate)
+    return jsonify(result), (202 if result.get("success") else 500)
+
+@app.route('/api/upload_expenses_batch', methods=['POST'])
+@idempotency.idempotent
+def upload_expenses_batch():
+    """
+    Extract several receipt images concurrently and save every successful one.
 
+    Files are sent as repeated `files` form fields; the response lists a result
+    per file in upload order, and all extracted expenses are inserted in one transaction.
+    Duplicates are handled as in upload_expense, and a receipt repeated within
+    the batch counts as already uploaded."""
+
+    username = auth.current_user()
+    if not username:
+        return jsonify({"success": False, "message": "Username is required"}), 400
+
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({"success": False, "message": "No image files provided."}), 400
+    if len(files) > MAX_BATCH_FILES:
+        return jsonify({"success": False, "message": f"At most {MAX_BATCH_FILES} files per batch."}), 400
+
+    on_duplicate = request.form.get('on_duplicate', duplicates.RECEIPT_POLICY)
+    if on_duplicate not in db_handler.DUPLICATE_POLICIES:
+        return jsonify({"success": False, "message": f"on_duplicate must be one of: "
+                        f"{', '.join(db_handler.DUPLICATE_POLICIES)}."}), 400
+
+    bypass_cache = request.form.get('no_cache') in ('1', 'true') or 'no-cache' in request.headers.get('Cache-Control', '')
+    images = [f.read() for f in files]
+    fingerprints = [duplicates.receipt_hash(image_data) for image_data in images]
+    known = duplicates.existing_receipts(username, fingerprints) if on_duplicate == "reject" else {}
+
+    # Only receipts not already on file, and not repeated earlier in the batch, go to the extractor.
+    extracted = [None] * len(files)
+    first_seen = {}
+    for i, fingerprint in enumerate(fingerprints):
+        if fingerprint in known:
+            extracted[i] = {"success": False, "message": f"This receipt was already uploaded as expense "
+                            f"{known[fingerprint]}.", "duplicate": True, "duplicate_of": known[fingerprint]}
+        elif on_duplicate == "reject" and fingerprint in first_seen:
+            extracted[i] = {"success": False, "message": f"Same receipt as {files[first_seen[fingerprint]].filename}.",
+                            "duplicate": True}
+        else:
+            first_seen.setdefault(fingerprint, i)
+    pending = [i for i, item in enumerate(extracted) if item is None]
+    for i, item in zip(pending, receipt_pipeline.extract_many([images[i] for i in pending], bypass_cache)):
+        extracted[i] = item
+
+    results = []
+    for image_file, item in zip(files, extracted):
+        results.append({"filename": image_file.filename, **item})
+
+    saved_indexes = [i for i, item in enumerate(extracted) if item["success"]]
+    saved = [{**extracted[i]["details"], "receipt_hash": fingerprints[i],
+              "receipt_phash": duplicates.perceptual_hash(images[i])} for i in saved_indexes]
+    added = 0
+    if saved:
+        insert = db_handler.add_expenses(username, saved, duplicates.field_policy(on_duplicate))
+        if not insert["success"]:
+            return jsonify({**insert, "results": results}), 500
+        for duplicate in insert["duplicates"]:
+            results[saved_indexes[duplicate["index"]]]["duplicate_of"] = duplicate["duplicate_of"]
+        added = insert["count"]
+        response_cache.invalidate(username, "expenses")
+
+    return jsonify({
+        "success": True,
+        "message": f"{added} of {len(files)} receipts added.",
+        "added": added,
+        "failed": len(files) - added,
+        "results": results,
+    })
+
+@app.route('/api/upload_status', methods=['GET'])
+def upload_status():
+    username = auth.current_user()
+    job_id = request.args.get('job_id')
+    if not username or not job_id:
+        return jsonify({"success": False, "message": "Username and job_id are required."}), 400
+
+    result = jobs.get_job(job_id, username)
+    return jsonify(result), (200 if result.get("success") else 404)
+
+@app.route('/api/receipt_stats', methods=['GET'])
+def receipt_stats():
+    return jsonify({"success": True, "cache": receipt_cache.stats(), "preprocess": image_preprocess.stats(),
+                    "responses": response_cache.stats()})
+
+@app.route('/api/import_statement', methods=['POST'])
+def import_statement():
+    """
+    Bulk-import a bank or credit-card statement (CSV or OFX/QFX) as expenses.
+
+    Optional form fields: `format` (csv/ofx, otherwise taken from the file name),
+    `debits_negative` (0 when a CSV lists spending as positive amounts) and
+    `category` (applied to rows without one instead of keyword matching)."""
+
+    username = auth.current_user()
+    if not username:
+        return jsonify({"success": False, "message": "Username is required"}), 400
+
+    statement = request.files.get('file')
+    if statement is None or statement.filename == '':
+        return jsonify({"success": False, "message": "No statement file provided."}), 400
+
+    file_format = request.form.get('format') or statement_import.detect_format(statement.filename)
+    if file_format not in ('csv', 'ofx'):
+        return jsonify({"success": False, "message": "Unsupported format. Use csv or ofx."}), 400
+
+    result = statement_import.import_statement(
+        username,
+        statement_import.open_text(statement.stream),
+        file_format,
+        debits_negative=request.form.get('debits_negative', '1') not in ('0', 'false'),
+        default_category=request.form.get('category') or None,
+    )
+    if result.get("imported"):  # chunks committed before a failure still count
+        response_cache.invalidate(username, "expenses")
     return jsonify(result), (200 if result.get("success") else 400)
 
 @app.route('/api/set_threshold', methods=['POST'])
 def set_threshold():
     data = request.get_json()
-    username = data.get('username')
+    username = auth.current_user()
     amount = data.get('amount')
 
     if not username or amount is None:
         return jsonify({"success": False, "message": "Username and amount are required."}), 400
 
     result = db_handler.set_threshold(username, amount)
+    if result["success"]:
+        response_cache.invalidate(username, "budgets")
     return jsonify(result)
 
 @app.route('/api/get_threshold', methods=['GET'])
+@response_cache.cached("budgets")
 def get_threshold():
-    username = request.args.get('username')
+    username = auth.current_user()
     if not username:
         return jsonify({"success": False, "message": "Username is required."}), 400
 
@@ -149,14 +423,222 @@ def get_threshold():
     return jsonify(result)
 
 @app.route('/api/check_threshold', methods=['GET'])
+@response_cache.cached("expenses", "budgets")
 def check_threshold():
-    username = request.args.get('username')
+    """The monthly threshold and every budget of the user.
+
+    `exceeded` is true when the threshold or any budget is exceeded; the budget
+    that tripped it is the one in `budgets` with `exceeded` set.
+    """
+    username = auth.current_user()
+    if not username:
+        return jsonify({"success": False, "message": "Username is required."}), 400
+
+    result = budgets.check_budgets(username)
+    return jsonify(result)
+
+@app.route('/api/add_budget', methods=['POST'])
+def add_budget():
+    data = request.get_json()
+    username = auth.current_user()
+    amount = data.get('amount')
+    period = data.get('period', 'monthly')
+
+    if not username or amount is None:
+        return jsonify({"success": False, "message": "Username and amount are required."}), 400
+
+    result = budgets.add_budget(username, data.get('name'), amount, period, data.get('category'),
+                                data.get('start_date'), data.get('end_date'))
+    if result["success"]:
+        response_cache.invalidate(username, "budgets")
+    return jsonify(result), (201 if result.get("success") else 400)
+
+@app.route('/api/get_budgets', methods=['GET'])
+@response_cache.cached("budgets")
+def get_budgets():
+    username = auth.current_user()
     if not username:
         return jsonify({"success": False, "message": "Username is required."}), 400
 
-    result = db_handler.check_threshold(username)
+    result = budgets.get_budgets(username)
     return jsonify(result)
 
+@app.route('/api/delete_budget', methods=['POST'])
+def delete_budget():
+    data = request.get_json()
+    username = auth.current_user()
+    budget_id = data.get('id')
+
+    if not username or budget_id is None:
+        return jsonify({"success": False, "message": "Username and id are required."}), 400
+
+    result = budgets.delete_budget(username, budget_id)
+    if result["success"]:
+        response_cache.invalidate(username, "budgets")
+    return jsonify(result), (200 if result.get("success") else 404)
+
+@app.route('/api/analytics', methods=['GET'])
+@response_cache.cached("expenses")
+def get_analytics():
+    """
+    Spending summary for the `months` months ending at `end_month` (YYYY-MM, default current):
+    monthly totals, trailing `window`-month averages, month-over-month deltas,
+    per-category breakdowns and the `top` merchants."""
+    username = auth.current_user()
+    if not username:
+        return jsonify({"success": False, "message": "Username is required."}), 400
+
+    end_month = request.args.get('end_month')
+    if end_month and not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", end_month):
+        return jsonify({"success": False, "message": "end_month must look like YYYY-MM."}), 400
+
+    try:
+        months = int(request.args.get('months', analytics.DEFAULT_MONTHS))
+        window = int(request.args.get('window', analytics.DEFAULT_WINDOW))
+        top = int(request.args.get('top', analytics.DEFAULT_TOP_MERCHANTS))
+    except ValueError:
+        return jsonify({"success": False, "message": "months, window and top must be integers."}), 400
+    if not (1 <= months <= 120 and 1 <= window <= 24 and 0 <= top <= 100):
+        return jsonify({"success": False, "message": "months must be 1-120, window 1-24 and top 0-100."}), 400
+
+    result = analytics.get_analytics(username, months, end_month, window, top)
+    return jsonify(result), (200 if result.get("success") else 500)
+
+@app.route('/api/get_category_totals', methods=['GET'])
+@response_cache.cached("expenses")
+def get_category_totals():
+    username = auth.current_user()
+    if not username:
+        return jsonify({"success": False, "message": "Username is required."}), 400
+
+    result = db_handler.get_category_totals(username, request.args.get('month'))
+    return jsonify(result)
+
+
+@app.cli.command('import-statement')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ofx']), help="Defaults to the file extension.")
+@click.option('--debits-positive', is_flag=True, help="CSV lists spending as positive amounts.")
+@click.option('--category', help="Category for rows without one (default: keyword matching).")
+def import_statement_command(username, path, file_format, debits_positive, category):
+    """Stream a CSV/OFX statement file into USERNAME's expenses."""
+    file_format = file_format or statement_import.detect_format(path)
+    if not file_format:
+        raise click.ClickException("Cannot tell the file format; pass --format.")
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        result = statement_import.import_statement(username, stream, file_format,
+                                                   debits_negative=not debits_positive,
+                                                   default_category=category)
+    if result.get("imported"):
+        response_cache.invalidate(username, "expenses", shared=True)
+    if not result["success"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"{result['message']} parsed={result['parsed']} skipped={result['skipped']} "
+               f"duplicates={result['duplicates']}")
+
+
+@app.cli.command('check-budgets')
+@click.option('--date', 'on_date', type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Evaluate budget windows as of this day (default today).")
+@click.option('--all', 'show_all', is_flag=True, help="List every budget, not only exceeded ones.")
+def check_budgets(on_date, show_all):
+    """Evaluate every user's budgets and thresholds in one pass (for nightly alerts)."""
+    result = budgets.check_all_budgets(on_date.date() if on_date else None, exceeded_only=not show_all)
+    if not result["success"]:
+        raise click.ClickException(result["message"])
+    for budget in result["budgets"]:
+        click.echo(f"{'EXCEEDED' if budget['exceeded'] else 'ok':<8} {budget['username']} {budget['name']!r} "
+                   f"{budget['window']['start']}..{budget['window']['end']}: "
+                   f"{budget['spent']:.2f} of {budget['amount']:.2f}")
+    click.echo(f"{result['exceeded']} of {result['checked']} budgets exceeded.")
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or migrate the database schema."""
+    applied = init_schema()
+    click.echo(f"Applied migrations: {', '.join(map(str, applied)) or 'none'}.")
+    click.echo(f"Schema ready ({db_handler.dialect()}, version {max(migrations.applied_versions())}).")
+
+
+@app.cli.command('migrate')
+@click.option('--target', type=int, default=None, help="Stop after this version (default: the latest).")
+@click.option('--list', 'show_list', is_flag=True, help="Only list migrations and whether each is applied.")
+def migrate_command(target, show_list):
+    """Apply pending schema migrations in order."""
+    if show_list:
+        done = set(migrations.applied_versions())
+        for version, name, _ in migrations.MIGRATIONS:
+            click.echo(f"{version:>4} {name:<30} {'applied' if version in done else 'pending'}")
+        return
+    applied = migrations.migrate(target)
+    click.echo(f"Applied migrations: {', '.join(map(str, applied)) or 'none'}.")
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Recompute the monthly_totals and merchant_totals rollups from the expenses table."""
+    result = db_handler.rebuild_monthly_totals()
+    if result["success"]:
+        response_cache.invalidate(result["usernames"], "expenses", shared=True)
+    click.echo(result.get("message"))
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search():
+    """Rebuild and compact the full-text index over expense names."""
+    result = search.rebuild_index()
+    if not result["success"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"Indexed {result['indexed']} expenses.")
+
+
+@app.cli.command('verify-rollups')
+def verify_rollups():
+    """Check the rollup tables against the expenses table."""
+    result = db_handler.verify_monthly_totals()
+    if not result["success"]:
+        raise click.ClickException(result["message"])
+    for mismatch in result["mismatches"]:
+        key = mismatch.get("category", mismatch.get("name"))
+        click.echo(f"{mismatch['table']} {mismatch['username']} {mismatch['month'] or '(undated)'} {key}: "
+                   f"expected {mismatch['expected']}, found {mismatch['actual']}")
+    if not result["consistent"]:
+        raise click.ClickException(f"{len(result['mismatches'])} rollup rows out of sync; run 'flask rebuild-rollups'.")
+    click.echo("Rollups are consistent with expenses.")
+
+
+@app.cli.command('find-duplicates')
+@click.option('--mark', is_flag=True, help="Set duplicate_of on every copy after the first.")
+@click.option('--limit', default=50, show_default=True, help="Groups to list (0 for none).")
+def find_duplicates_command(mark, limit):
+    """Find duplicate expenses across the whole table and optionally mark them."""
+    result = duplicates.find_duplicates(mark=mark)
+    if not result["success"]:
+        raise click.ClickException(result["message"])
+    for group in result["groups"][:limit]:
+        click.echo(f"{group['username']} {group['date'] or '(undated)'} {group['name']!r} {group['amount']}: "
+                   f"ids {', '.join(map(str, group['ids']))} ({'; '.join(group['reasons'])})")
+    click.echo(f"{len(result['groups'])} groups, {result['duplicates']} duplicates"
+               + (f", {result['marked']} newly marked." if mark else "."))
+    if result["marked"]:
+        response_cache.invalidate(list({group["username"] for group in result["groups"]}), "expenses", shared=True)
+
+
+@app.cli.command('hash-passwords')
+def hash_passwords_command():
+    """Hash every password still stored in plaintext (sign-in also upgrades them one at a time)."""
+    result = db_handler.migrate_password_hashes()
+    if not result["success"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"Hashed {result['migrated']} plaintext passwords.")
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; see gunicorn.conf.py for production serving.
+    import atexit
+
+    init_schema()
+    init_worker()
+    atexit.register(shutdown_worker)
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1")
@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+from flask import g, jsonify, request
+
+import db_handler
+
+# Stateless session tokens handed out by /api/signin.
+#
+# A token is "<payload>.<signature>": the payload is base64url JSON
+# [username, expires_at] and the signature an HMAC-SHA256 of it. Checking one
+# is a few microseconds of hashing with no database read, so every worker can
+# authenticate every request without shared session state. A token can't be
+# revoked before it expires except by rotating the key.
+#
+# The signing key comes from SECRET_KEY. Give several comma-separated keys to
+# rotate: the first signs, all of them verify. Without SECRET_KEY a random key
+# is generated once and kept in the database, so all workers agree on it.
+#
+# Every request needs "Authorization: Bearer <token>" (sign-up, sign-in and
+# /metrics stay open) and acts for the token's user; naming anyone else is a
+# 403. AUTH_REQUIRED=0 lets legacy clients without tokens through, acting for
+# whatever username they name.
+TOKEN_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_TTL", str(7 * 24 * 3600)))
+REQUIRED = os.getenv("AUTH_REQUIRED", "1") != "0"
+PUBLIC_ENDPOINTS = {"hello_world", "signup", "signin", "prometheus_metrics", "static"}
+
+_keys = None
+
+
+def init_auth():
+    # Creates the table holding the generated signing key if it doesn't exist.
+    with db_handler.get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS auth_keys (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                secret TEXT NOT NULL
+            )
+        ''')
+        conn.execute("INSERT INTO auth_keys (id, secret) VALUES (1, ?) ON CONFLICT (id) DO NOTHING",
+                     (secrets.token_hex(32),))
+
+
+def _signing_keys():
+    global _keys
+    if _keys is None:
+        configured = [key.strip() for key in os.getenv("SECRET_KEY", "").split(",") if key.strip()]
+        if not configured:
+            with db_handler.get_connection() as conn:
+                row = conn.execute("SELECT secret FROM auth_keys WHERE id = 1").fetchone()
+            configured = [row[0]]
+        _keys = [key.encode() for key in configured]
+    return _keys
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _sign(key, payload):
+    return _b64(hmac.new(key, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(username, ttl=None):
+    """Returns a signed token for `username` and the number of seconds it stays valid."""
+    ttl = TOKEN_TTL_SECONDS if ttl is None else ttl
+    payload = _b64(json.dumps([username, int(time.time()) + ttl], separators=(",", ":")).encode())
+    return f"{payload}.{_sign(_signing_keys()[0], payload)}", ttl
+
+
+def verify_token(token):
+    """Returns the username a valid, unexpired token was issued to, or None."""
+    payload, _, signature = token.partition(".")
+    if not signature or not any(hmac.compare_digest(_sign(key, payload), signature) for key in _signing_keys()):
+        return None
+    try:
+        username, expires_at = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (TypeError, ValueError):
+        return None
+    return username if expires_at > time.time() else None
+
+
+def request_username():
+    """The username a request acts for, wherever the endpoint reads it from."""
+    if "username" in request.args:
+        return request.args["username"]
+    if "username" in request.form:
+        return request.form["username"]
+    data = request.get_json(silent=True) if request.is_json else None
+    return data.get("username") if isinstance(data, dict) else None
+
+
+def current_user():
+    """The user a request acts for: the token's, or without one (AUTH_REQUIRED=0) the username it names."""
+    return g.user or request_username()
+
+
+def _authenticate():
+    g.user = None
+    if request.method == "OPTIONS" or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        g.user = verify_token(token.strip())
+        if g.user is None:
+            return jsonify({"success": False, "message": "Session expired or invalid, please sign in again."}), 401
+        claimed = request_username()
+        if claimed is not None and claimed != g.user:
+            return jsonify({"success": False, "message": "Not allowed to act for another user."}), 403
+    elif REQUIRED:
+        return jsonify({"success": False, "message": "Sign in required."}), 401
+    return None
+
+
+def init_app(app):
+    app.before_request(_authenticate)
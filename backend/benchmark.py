@@ -0,0 +1,1023 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+# Run against a throwaway database so benchmarks never touch users.db
+LAUNCH_DIR = os.getcwd()
+WORKDIR = tempfile.mkdtemp(prefix="expense-bench-")
+os.chdir(WORKDIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import db_handler  # noqa: E402
+
+db_handler.DATABASE = "users.db"  # in WORKDIR, whatever DATABASE_URL says
+# The load generators act for many users without signing each in (bench_auth times the token checks).
+os.environ.setdefault("AUTH_REQUIRED", "0")
+from app import app, init_schema  # noqa: E402
+
+init_schema()
+
+HOST = "127.0.0.1"
+PORT = 5055
+BASE_URL = f"http://{HOST}:{PORT}"
+CONCURRENCY = 16
+REQUESTS_PER_ENDPOINT = 2000
+BENCH_USER = "bench_user"
+
+# label -> numbers for the benchmark being run, saved / compared with --save / --baseline
+RESULTS = {}
+NOISE_FLOOR_MS = 0.01
+_running = {"name": None}
+
+
+def start_server():
+    """Starts the Flask app on a threaded Werkzeug server in the background."""
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(HOST, PORT, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of an already sorted list."""
+    return samples[min(len(samples) - 1, max(0, int(round(q / 100 * len(samples))) - 1))]
+
+
+def record(label, **numbers):
+    RESULTS[f"{_running['name']}/{label.strip()}"] = {key: round(value, 4) for key, value in numbers.items()}
+
+
+def run_load(label, send, total=REQUESTS_PER_ENDPOINT, concurrency=CONCURRENCY):
+    """Fires `total` calls of `send` across `concurrency` threads; prints requests/sec and p50/p99 latency."""
+    local = threading.local()
+
+    def worker(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = send(local.session, i)
+        return time.perf_counter() - start, response.status_code < 300
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(worker, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    ok = sum(success for _, success in outcomes)
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    print(f"{label:<24} {total / elapsed:10.1f} req/s   p50 {p50:7.2f} ms  p99 {p99:7.2f} ms   "
+          f"({ok}/{total} ok, {concurrency} clients)")
+    record(label, rps=total / elapsed, p50_ms=p50, p99_ms=p99)
+
+
+def bench_add_expense(session, i):
+    return session.post(f"{BASE_URL}/api/add_expense", json={
+        "username": BENCH_USER,
+        "name": f"Store {i % 50}",
+        "amount": round(5 + (i % 200) * 0.75, 2),
+        "category": "Groceries",
+        "date": f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}",
+    })
+
+
+def bench_get_expenses(session, i):
+    return session.get(f"{BASE_URL}/api/get_expenses", params={"username": BENCH_USER})
+
+
+def seed_expenses(rows, users=1000):
+    """Bulk-inserts `rows` synthetic expenses spread over `users` users and ~3 years."""
+    start = datetime(2023, 1, 1)
+    with db_handler.get_connection() as conn:
+        batch = []
+        for i in range(rows):
+            day = start + timedelta(days=i % 1095)
+            batch.append((f"user{i % users}", f"Store {i % 500}", float(i % 300), "Groceries",
+                          day.strftime("%Y-%m-%d"), day.strftime("%Y-%m-%d")))
+            if len(batch) == 50000:
+                conn.executemany("INSERT INTO expenses (username, name, amount, category, date, date_iso) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            conn.executemany("INSERT INTO expenses (username, name, amount, category, date, date_iso) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+
+def time_calls(label, fn, calls):
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    mean = sum(latencies) / calls
+    latencies.sort()
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    print(f"{label:<32} {mean:8.3f} ms/call   p50 {p50:8.3f}  p99 {p99:8.3f}")
+    record(label, mean_ms=mean, p50_ms=p50, p99_ms=p99)
+
+
+def bench_http():
+    db_handler.signup_user(BENCH_USER, "Bench User", "bench@example.com", "bench")
+    server = start_server()
+    try:
+        run_load("POST /api/add_expense", bench_add_expense)
+        run_load("GET /api/get_expenses", bench_get_expenses, total=REQUESTS_PER_ENDPOINT // 4)
+    finally:
+        server.shutdown()
+
+
+def bench_threshold(rows=1_000_000):
+    """Monthly threshold check at `rows` expenses: legacy LIKE scan vs. indexed date_iso range."""
+    import budgets
+
+    seed_expenses(rows)
+    for u in range(1000):
+        db_handler.set_threshold(f"user{u}", 500)
+    month_start, month_end = db_handler.month_bounds(datetime(2024, 6, 15))
+
+    def legacy(i):
+        with db_handler.get_connection() as conn:
+            # NOT INDEXED reproduces the pre-index schema
+            conn.execute("SELECT SUM(amount) FROM expenses NOT INDEXED WHERE username = ? AND date LIKE ?",
+                         (f"user{i % 1000}", "2024-06-%")).fetchone()
+
+    def indexed(i):
+        with db_handler.get_connection() as conn:
+            conn.execute("SELECT SUM(amount) FROM expenses WHERE username = ? AND date_iso BETWEEN ? AND ?",
+                         (f"user{i % 1000}", month_start, month_end)).fetchone()
+
+    print(f"{rows} expense rows")
+    time_calls("LIKE 'YYYY-MM-%' (full scan)", legacy, 20)
+    time_calls("date_iso BETWEEN (index)", indexed, 2000)
+    time_calls("check_budgets() (threshold only)", lambda i: budgets.check_budgets(f"user{i % 1000}"), 2000)
+
+
+def bench_pagination(rows=100_000):
+    """GET /api/get_expenses for one user with `rows` expenses: full list vs. keyset pages."""
+    seed_expenses(rows, users=1)
+    client = app.test_client()
+
+    def measure(label, query_string, calls):
+        start = time.perf_counter()
+        for _ in range(calls):
+            response = client.get("/api/get_expenses", query_string=query_string)
+        elapsed = (time.perf_counter() - start) / calls
+        print(f"{label:<32} {elapsed * 1000:9.2f} ms  {len(response.data) / 1024:10.1f} KiB")
+        return response.get_json()
+
+    print(f"{rows} expenses for one user")
+    measure("full list (no limit)", {"username": "user0"}, 3)
+    page = measure("first page, limit=50", {"username": "user0", "limit": 50}, 200)
+    cursor = page["next_cursor"]
+    for _ in range(1000):  # walk 1000 pages deep
+        cursor = client.get("/api/get_expenses", query_string={
+            "username": "user0", "limit": 50, "cursor": cursor}).get_json()["next_cursor"]
+    measure("page 1000 via cursor", {"username": "user0", "limit": 50, "cursor": cursor}, 200)
+    measure("search + category + range", {"username": "user0", "limit": 50, "q": "Store 42",
+                                           "category": "Groceries", "start_date": "2024-01-01",
+                                           "end_date": "2024-12-31"}, 200)
+    measure("sort=amount_desc, limit=50", {"username": "user0", "limit": 50, "sort": "amount_desc"}, 200)
+
+
+def bench_batch(receipts=32, latency=0.5):
+    """Receipts/minute against the fake LLM: one upload at a time vs. the batch endpoint."""
+    import io
+
+    import receipt_extractor
+    import receipt_pipeline
+    from fake_llm import start_fake_llm
+
+    server, receipt_extractor.ENDPOINT = start_fake_llm(latency=latency)
+    client = app.test_client()
+    images = [f"receipt-{i}".encode("utf-8") for i in range(receipts)]
+    print(f"{receipts} receipts, {latency}s injected LLM latency, {receipt_pipeline.BATCH_WORKERS} workers")
+    try:
+        start = time.perf_counter()
+        for image_data in images:
+            extracted = receipt_pipeline.extract(image_data, bypass_cache=True)
+            db_handler.add_expense(BENCH_USER, **extracted["details"])
+        serial = time.perf_counter() - start
+        print(f"{'serial extract + insert':<32} {receipts / serial * 60:9.1f} receipts/min")
+
+        start = time.perf_counter()
+        response = client.post("/api/upload_expenses_batch", data={
+            "username": BENCH_USER,
+            "no_cache": "1",
+            "files": [(io.BytesIO(image_data), f"{i}.png") for i, image_data in enumerate(images)],
+        })
+        batch = time.perf_counter() - start
+        print(f"{'POST /api/upload_expenses_batch':<32} {receipts / batch * 60:9.1f} receipts/min"
+              f"  ({response.get_json()['added']} added)")
+    finally:
+        server.shutdown()
+
+
+def fake_phone_photo(image_data):
+    """Upscales a sample receipt to a 12 MP RGB JPEG, roughly what a phone camera uploads."""
+    import io
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_data)) as image:
+        photo = image.convert("RGB").resize((3024, 4032))
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def bench_preprocess(latency=0.3, bandwidth=250_000, rounds=5):
+    """Payload bytes and end-to-end extraction latency over sample_receipt_images/, raw vs. preprocessed."""
+    import base64
+    import glob
+
+    import image_preprocess
+    import receipt_extractor
+    from fake_llm import start_fake_llm
+
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample_receipt_images")
+    samples = [open(path, "rb").read() for path in sorted(glob.glob(os.path.join(sample_dir, "*")))]
+    samples.append(fake_phone_photo(samples[0]))
+    server, receipt_extractor.ENDPOINT = start_fake_llm(latency=latency, bandwidth=bandwidth)
+    print(f"{len(samples) - 1} sample receipts + one 12 MP photo, {latency}s LLM latency, {bandwidth // 1000} kB/s uplink")
+    try:
+        for label, prepare in (("raw upload", lambda data: (data, image_preprocess.sniff_mime_type(data))),
+                               ("preprocessed", image_preprocess.preprocess)):
+            sent = 0
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for image_data in samples:
+                    payload, mime_type = prepare(image_data)
+                    encoded = base64.b64encode(payload).decode("utf-8")
+                    sent += len(encoded)
+                    receipt_extractor.extract_receipt_details(encoded, mime_type)
+            elapsed = (time.perf_counter() - start) / (rounds * len(samples))
+            print(f"{label:<32} {sent / (rounds * len(samples)) / 1024:8.1f} KiB/request  {elapsed * 1000:8.1f} ms/receipt")
+        print(f"preprocess stats: {image_preprocess.stats()}")
+    finally:
+        server.shutdown()
+
+
+def bench_llm_client(calls=200, concurrency=8):
+    """Success rate and throughput of a bare requests.post vs. the shared LLM client against a flaky stub."""
+    import llm_client
+    from fake_llm import start_fake_llm
+
+    server, endpoint = start_fake_llm(latency=0.05, throttle_rate=0.15, error_rate=0.15, retry_after=0)
+    client = llm_client.LLMClient()
+    print(f"{calls} calls, {concurrency} threads, stub answers 15% 429 + 15% 503")
+
+    def bare(_):
+        return requests.post(endpoint, json={}).status_code == 200
+
+    def resilient(_):
+        try:
+            client.post_json(endpoint, {})
+            return True
+        except llm_client.LLMClientError:
+            return False
+
+    try:
+        for label, call in (("bare requests.post", bare), ("llm_client.post_json", resilient)):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                ok = sum(pool.map(call, range(calls)))
+            elapsed = time.perf_counter() - start
+            print(f"{label:<32} {ok / calls * 100:6.1f}% ok  {calls / elapsed:8.1f} calls/s")
+    finally:
+        server.shutdown()
+
+
+def bench_streaming(calls=200, concurrency=8, latency=0.3, token_delay=0.02, malformed_rate=0.3):
+    """Time to result and failure rate: whole-completion JSON parsing vs. the streamed, validated extractor."""
+    import llm_client
+    import receipt_extractor
+    from fake_llm import start_fake_llm
+
+    server, endpoint = start_fake_llm(latency=latency, token_delay=token_delay, malformed_rate=malformed_rate)
+    receipt_extractor.ENDPOINT = endpoint
+    image_b64 = "aGVsbG8="
+    print(f"{calls} extractions, {concurrency} threads, stub: {latency}s to first token, {token_delay * 1000:.0f} ms "
+          f"per token, {malformed_rate:.0%} malformed replies")
+
+    def legacy(_):
+        # The extractor before streaming: wait for the whole reply, parse one JSON block, check the keys.
+        payload = {"model": receipt_extractor.MODEL, "messages": [{"role": "user", "content": [
+            {"type": "text", "text": receipt_extractor.PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}}]}]}
+        try:
+            response = llm_client.get_client().post_json(endpoint, payload)
+        except llm_client.LLMClientError:
+            return None
+        details = receipt_extractor.extract_json_from_response(response["choices"][0]["message"]["content"])
+        return details if all(field in details for field in receipt_extractor.FIELDS) else None
+
+    def streamed(_):
+        details = receipt_extractor.extract_receipt_details(image_b64)
+        return None if "error" in details else details
+
+    try:
+        for label, extract in (("full reply + regex JSON", legacy), ("streamed + validated", streamed)):
+            def timed(i):
+                start = time.perf_counter()
+                details = extract(i)
+                return (time.perf_counter() - start) * 1000, details
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(timed, range(calls)))
+            latencies = sorted(ms for ms, _ in outcomes)
+            failed = sum(details is None for _, details in outcomes)
+            # Accepted, but with fields an expense can't use as they are (e.g. "$23.47", "Grocery").
+            invalid = sum(details is not None and receipt_extractor.normalize_details(details)[0] != {
+                field: details[field] for field in receipt_extractor.FIELDS} for _, details in outcomes)
+            mean = sum(latencies) / calls
+            p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+            print(f"{label:<24} {mean:8.1f} ms mean  p50 {p50:7.1f}  p99 {p99:7.1f}   "
+                  f"{failed / calls:6.1%} failed  {invalid / calls:6.1%} accepted unnormalized")
+            record(label, mean_ms=mean, p50_ms=p50, p99_ms=p99, failed=failed / calls, invalid=invalid / calls)
+    finally:
+        server.shutdown()
+
+
+# Hand-checked answers for sample_receipt_images/
+SAMPLE_TRUTH = {
+    "1.png": {"amount": 66.66, "date": "2021-09-19", "category": "Groceries"},
+    "2.png": {"amount": 8.10, "date": "2022-12-08", "category": "Dining & Restaurants"},
+    "3.png": {"amount": 120.67, "date": "2023-06-26", "category": "Groceries"},
+}
+
+
+def score_extraction(details, truth):
+    """Fraction of amount/date/category fields that match the expected answer."""
+    hits = 0
+    try:
+        hits += abs(float(details.get("amount")) - truth["amount"]) < 0.01
+    except (TypeError, ValueError):
+        pass
+    hits += db_handler.normalize_date(details.get("date")) == truth["date"]
+    hits += details.get("category") == truth["category"]
+    return hits / 3
+
+
+def bench_ocr():
+    """Accuracy and latency over sample_receipt_images/: local OCR tier, LLM tier, and the tiered pipeline."""
+    import base64
+
+    import local_ocr
+    import receipt_pipeline
+    from receipt_extractor import GROQ_API_KEY, extract_receipt_details
+
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample_receipt_images")
+    samples = {name: open(os.path.join(sample_dir, name), "rb").read() for name in SAMPLE_TRUTH}
+
+    tiers = []
+    if local_ocr.available():
+        tiers.append(("local OCR", lambda data: local_ocr.extract(data)[0] or {}))
+    else:
+        print("local OCR unavailable (install pytesseract and the tesseract binary)")
+    if GROQ_API_KEY:
+        tiers.append(("LLM", lambda data: extract_receipt_details(base64.b64encode(data).decode("utf-8"),
+                                                                  "image/png")))
+        tiers.append(("tiered pipeline", lambda data: receipt_pipeline.extract(data, bypass_cache=True)
+                      .get("details", {})))
+    else:
+        print("LLM tiers skipped (GROQ_API_KEY not set)")
+
+    for label, extract in tiers:
+        accuracy = 0.0
+        start = time.perf_counter()
+        for name, data in samples.items():
+            accuracy += score_extraction(extract(data), SAMPLE_TRUTH[name])
+        elapsed = (time.perf_counter() - start) / len(samples)
+        print(f"{label:<32} {accuracy / len(samples) * 100:6.1f}% fields correct  {elapsed * 1000:8.1f} ms/receipt")
+
+
+def bench_import(rows=1_000_000):
+    """Streams a `rows`-line CSV statement through statement_import and reports time and peak memory."""
+    import random
+    import tracemalloc
+
+    import statement_import
+
+    path = os.path.join(WORKDIR, "statement.csv")
+    merchants = ["STARBUCKS", "SHELL OIL", "KROGER", "AMAZON MKTP", "UBER TRIP", "CVS PHARMACY", "NETFLIX.COM"]
+    start_day = datetime(2015, 1, 1)
+    with open(path, "w") as f:
+        f.write("Transaction Date,Description,Amount\n")
+        for i in range(rows):
+            day = start_day + timedelta(days=i // 300)
+            f.write(f"{day:%m/%d/%Y},{random.choice(merchants)} #{i % 997},-{random.uniform(1, 300):.2f}\n")
+    size_mb = os.path.getsize(path) / 1e6
+
+    start = time.perf_counter()
+    with open(path, newline="") as stream:
+        result = statement_import.import_statement(BENCH_USER, stream, "csv")
+    elapsed = time.perf_counter() - start
+    print(f"{rows} rows ({size_mb:.0f} MB CSV): imported {result['imported']}, duplicates {result['duplicates']}")
+    print(f"{'import_statement':<32} {elapsed:8.1f} s  {rows / elapsed:10.0f} rows/s")
+
+    # Second pass under tracemalloc (slower) to show the Python heap stays flat.
+    tracemalloc.start()
+    with open(path, newline="") as stream:
+        result = statement_import.import_statement(BENCH_USER, stream, "csv")
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{'re-import (all duplicates)':<32} peak Python heap {peak / 1e6:.1f} MB, "
+          f"duplicates {result['duplicates']}")
+
+
+def bench_export(rows=1_000_000):
+    """Time to first byte, throughput and peak Python heap of /api/export_expenses for one user."""
+    import tracemalloc
+
+    import exporter
+
+    seed_expenses(rows, users=1)
+    client = app.test_client()
+    print(f"{rows} expenses for one user")
+    for file_format in exporter.available_formats():
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get("/api/export_expenses", query_string={"username": "user0", "format": file_format},
+                              buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        first_byte = time.perf_counter() - start
+        for chunk in chunks:
+            size += len(chunk)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        response.close()
+        print(f"{file_format:<10} first byte {first_byte * 1000:7.1f} ms  total {elapsed:6.1f} s  "
+              f"{size / 1e6:7.1f} MB  peak heap {peak / 1e6:6.1f} MB")
+
+
+def python_analytics(username, labels, window):
+    """The pre-analytics approach: pull every row and aggregate in Python loops."""
+    with db_handler.get_connection() as conn:
+        rows = conn.execute("SELECT name, amount, category, date_iso FROM expenses WHERE username = ?",
+                            (username,)).fetchall()
+    wanted = set(labels)
+    by_month, by_category, by_merchant = {}, {}, {}
+    for name, amount, category, date_iso in rows:
+        month = date_iso[:7]
+        if month not in wanted:
+            continue
+        by_month[month] = by_month.get(month, 0) + amount
+        by_category.setdefault(category, {})
+        by_category[category][month] = by_category[category].get(month, 0) + amount
+        by_merchant[name] = by_merchant.get(name, 0) + amount
+    monthly = [by_month.get(label, 0) for label in labels]
+    rolling = [sum(monthly[max(0, i - window + 1):i + 1]) / min(i + 1, window) for i in range(len(monthly))]
+    deltas = [None] + [monthly[i] - monthly[i - 1] for i in range(1, len(monthly))]
+    top = sorted(by_merchant.items(), key=lambda item: -item[1])[:10]
+    return monthly, rolling, deltas, by_category, top
+
+
+def bench_analytics(rows=1_000_000, months=36):
+    """Three-year spending summary for one user with `rows` expenses: Python loops vs. rollup + NumPy."""
+    import analytics
+
+    seed_expenses(rows, users=1)
+    labels = analytics.month_range("2025-12", months)
+    print(f"{rows} expenses for one user, {months} months")
+    time_calls("python loop", lambda i: python_analytics("user0", labels, 3), 3)
+    time_calls("rollup + numpy", lambda i: analytics.get_analytics("user0", months, "2025-12", 3), 3)
+
+
+def bench_budgets(rows=1_000_000, users=1000):
+    """Six budgets per user: one query per budget vs. budgets.check_budgets, then the nightly batch."""
+    from datetime import date
+
+    import budgets
+
+    seed_expenses(rows, users)
+    today = date(2024, 6, 15)
+    for u in range(users):
+        username = f"user{u}"
+        db_handler.set_threshold(username, 500)
+        budgets.add_budget(username, "Groceries", 150, "weekly", "Groceries")
+        budgets.add_budget(username, "Groceries", 400, "monthly", "Groceries")
+        budgets.add_budget(username, "Travel", 300, "monthly", "Travel")
+        budgets.add_budget(username, "Year", 5000, "yearly")
+        budgets.add_budget(username, "Summer", 2000, "custom", None, "2024-05-20", "2024-08-10")
+
+    def per_budget(username):
+        with db_handler.get_connection() as conn:
+            rows = [row for row in conn.execute("SELECT category, period, start_date, end_date, amount "
+                                                "FROM budgets WHERE username = ?", (username,))]
+            rows.append((None, "monthly", None, None, 500))
+            for category, period, start_date, end_date, amount in rows:
+                first, last = budgets.budget_window(period, today, start_date, end_date)
+                conn.execute("SELECT SUM(amount) FROM expenses WHERE username = ? AND date_iso BETWEEN ? AND ? "
+                             "AND (? IS NULL OR category = ?)", (username, first, last, category, category)).fetchone()
+
+    print(f"{rows} expense rows, {users} users x 6 budgets")
+    time_calls("one query per budget", lambda i: per_budget(f"user{i % users}"), 2000)
+    time_calls("check_budgets()", lambda i: budgets.check_budgets(f"user{i % users}", today), 2000)
+    time_calls("nightly: per user, per budget", lambda i: [per_budget(f"user{u}") for u in range(users)], 1)
+    time_calls("nightly: check_all_budgets()", lambda i: budgets.check_all_budgets(today), 1)
+
+
+def bench_response_cache(rows=100_000, page=50):
+    """GET /api/get_expenses and /api/get_user_info: uncached vs. cache hit vs. ETag 304."""
+    import response_cache
+
+    seed_expenses(rows, users=100)
+    db_handler.signup_user("user0", "User Zero", "user0@example.com", "secret")
+    client = app.test_client()
+    requests_ = [("/api/get_expenses", {"username": "user0"}),
+                 ("/api/get_expenses", {"username": "user0", "limit": page}),
+                 ("/api/get_user_info", {"username": "user0"})]
+
+    print(f"{rows} expense rows over 100 users ({rows // 100} for user0)")
+    for path, query in requests_:
+        label = f"{path.rsplit('/', 1)[-1]}{' limit=' + str(page) if 'limit' in query else ''}"
+        response_cache.ENABLED = False
+        time_calls(f"{label}: uncached", lambda i: client.get(path, query_string=query), 200)
+        response_cache.ENABLED = True
+        etag = client.get(path, query_string=query).headers["ETag"]
+        time_calls(f"{label}: cache hit", lambda i: client.get(path, query_string=query), 200)
+        time_calls(f"{label}: 304", lambda i: client.get(path, query_string=query,
+                                                          headers={"If-None-Match": etag}), 200)
+    print(response_cache.stats())
+
+
+def bench_metrics(calls=20000):
+    """Instrumentation overhead: a primary-key SELECT on a plain vs. timed connection, and a request with metrics on/off."""
+    import metrics
+    import response_cache
+    import storage
+
+    db_handler.signup_user("user0", "User Zero", "user0@example.com", "secret")
+    plain = sqlite3.connect(db_handler.DATABASE, check_same_thread=False)
+    timed = sqlite3.connect(db_handler.DATABASE, check_same_thread=False, factory=storage.TimedConnection)
+    query = "SELECT name, email FROM users WHERE username = ?"
+    time_calls("plain connection", lambda i: plain.execute(query, ("user0",)).fetchone(), calls)
+    time_calls("TimedConnection", lambda i: timed.execute(query, ("user0",)).fetchone(), calls)
+
+    response_cache.ENABLED = False
+    client = app.test_client()
+    for enabled in (False, True):
+        metrics.ENABLED = enabled
+        time_calls(f"get_user_info, metrics {'on' if enabled else 'off'}",
+                   lambda i: client.get("/api/get_user_info", query_string={"username": "user0"}), calls // 10)
+
+
+def bench_db(rows=int(os.getenv("BENCH_ROWS", "1000000")), users=1000):
+    """Micro-benchmarks of every db_handler function over a datagen dataset (BENCH_ROWS expenses)."""
+    import budgets
+    import datagen
+
+    start = time.perf_counter()
+    datagen.generate(users, rows)
+    print(f"{rows} expenses for {users} users generated in {time.perf_counter() - start:.1f} s")
+    heavy, light = "user0", f"user{users - 1}"  # Zipf activity: user0 has the most rows
+    with db_handler.get_connection() as conn:
+        counts = dict(conn.execute("SELECT username, COUNT(*) FROM expenses WHERE username IN (?, ?) "
+                                   "GROUP BY username", (heavy, light)).fetchall())
+    print(f"{heavy}: {counts.get(heavy, 0)} expenses, {light}: {counts.get(light, 0)} expenses")
+
+    time_calls("normalize_date (uncached)", lambda i: db_handler.normalize_date.__wrapped__("03/14/25"), 20000)
+    # Sign-up and sign-in are one scrypt hash each (see the auth benchmark), so fewer calls.
+    time_calls("signup_user", lambda i: db_handler.signup_user(f"new{i}", "New", f"new{i}@example.com", "pw"), 50)
+    time_calls("signin_user_by_email", lambda i: db_handler.signin_user_by_email(
+        f"user{i % users}@example.com", "password"), 50)
+    time_calls("signin_user_by_username", lambda i: db_handler.signin_user_by_username(
+        f"user{i % users}", "password"), 50)
+    time_calls("get_user_info", lambda i: db_handler.get_user_info(f"user{i % users}"), 5000)
+    time_calls("add_expense", lambda i: db_handler.add_expense(
+        light, "Bench", 9.99, "Groceries", "2025-06-01"), 2000)
+    batch = [{"name": "Bench", "amount": 1.5, "category": "Groceries", "date": "2025-06-02"}] * 100
+    time_calls("add_expenses (100 rows)", lambda i: db_handler.add_expenses(light, batch), 200)
+    for username in (heavy, light):
+        time_calls(f"get_expenses page 50 ({username})", lambda i: db_handler.get_expenses(username, 50), 1000)
+    time_calls(f"get_expenses full list ({heavy})", lambda i: db_handler.get_expenses(heavy), 10)
+    time_calls(f"get_expenses search+sort ({heavy})", lambda i: db_handler.get_expenses(
+        heavy, 50, search="star", sort="amount_desc"), 200)
+    time_calls(f"iter_expenses 2025 ({heavy})", lambda i: sum(1 for _ in db_handler.iter_expenses(
+        heavy, "2025-01-01", "2025-12-31")), 10)
+    time_calls("set_threshold", lambda i: db_handler.set_threshold(f"user{i % users}", 1000), 2000)
+    time_calls("get_threshold", lambda i: db_handler.get_threshold(f"user{i % users}"), 5000)
+    time_calls("check_budgets (threshold only)", lambda i: budgets.check_budgets(f"user{i % users}"), 5000)
+    time_calls("get_category_totals (month)", lambda i: db_handler.get_category_totals(
+        f"user{i % users}", "2025-06"), 5000)
+    time_calls("get_category_totals (all time)", lambda i: db_handler.get_category_totals(
+        f"user{i % users}"), 2000)
+
+    with db_handler.get_connection() as conn:
+        doomed = [row[0] for row in conn.execute(
+            "SELECT id FROM expenses WHERE username = ? AND name = 'Bench' LIMIT 10000", (light,))]
+    time_calls("delete_expenses (10 ids)", lambda i: db_handler.delete_expenses(doomed[i * 10:(i + 1) * 10]),
+               len(doomed) // 10)
+
+
+def bench_load(users=200, rows=200_000, latency=0.2):
+    """HTTP load over a threaded server: signup, signin, add, get, delete and upload (stubbed LLM), then a mix."""
+    import io
+    import itertools
+    import random
+
+    import datagen
+    import receipt_extractor
+    from fake_llm import start_fake_llm
+
+    datagen.generate(users, rows)
+    llm, receipt_extractor.ENDPOINT = start_fake_llm(latency=latency)
+    server = start_server()
+    ids = itertools.count()
+    print(f"{rows} expenses for {users} users, fake LLM latency {latency}s, {CONCURRENCY} clients")
+
+    def signup(session, i):
+        n = next(ids)
+        return session.post(f"{BASE_URL}/api/signup", json={
+            "username": f"load{n}", "name": "Load", "email": f"load{n}@example.com", "password": "password"})
+
+    def signin(session, i):
+        return session.post(f"{BASE_URL}/api/signin", json={"username": f"user{i % users}", "password": "password"})
+
+    def add(session, i):
+        return session.post(f"{BASE_URL}/api/add_expense", json={
+            "username": f"user{i % users}", "name": "Load test", "amount": 12.5,
+            "category": "Groceries", "date": "2025-06-15"})
+
+    def get(session, i):
+        return session.get(f"{BASE_URL}/api/get_expenses", params={"username": f"user{i % users}", "limit": 50})
+
+    def delete(session, i):
+        page = session.get(f"{BASE_URL}/api/get_expenses", params={
+            "username": f"user{i % users}", "limit": 1, "q": "Load test"}).json()
+        return session.post(f"{BASE_URL}/api/delete_expenses", json={
+            "username": f"user{i % users}", "expense_ids": [e["id"] for e in page["expenses"]] or [-1]})
+
+    def upload(session, i):
+        return session.post(f"{BASE_URL}/api/upload_expense", data={"username": f"user{i % users}", "no_cache": "1"},
+                            files={"file": (f"{i}.png", io.BytesIO(f"receipt-{i}".encode()), "image/png")})
+
+    mix = [get] * 50 + [add] * 20 + [signin] * 10 + [delete] * 10 + [upload] * 5 + [signup] * 5
+
+    def mixed(session, i):
+        return random.Random(i).choice(mix)(session, i)
+
+    try:
+        run_load("POST /api/signup", signup, total=200)
+        run_load("POST /api/signin", signin, total=200)
+        run_load("POST /api/add_expense", add)
+        run_load("GET /api/get_expenses", get)
+        run_load("delete (get id + delete)", delete, total=1000)
+        run_load("POST /api/upload_expense", upload, total=500)
+        run_load("mixed", mixed, total=4000)
+    finally:
+        server.shutdown()
+        llm.shutdown()
+
+
+def bench_auth(users=200, burst=300):
+    """Hash cost per scrypt work factor, token checks, and sign-in bursts with a bounded vs. unbounded hash pool."""
+    import auth
+    import datagen
+    import passwords
+    import response_cache
+
+    salt = bytes(passwords.SALT_BYTES)
+    for log2_n in range(12, 17):
+        marker = "  (current)" if log2_n == passwords.LOG2_N else ""
+        time_calls(f"scrypt n=2**{log2_n}{marker}", lambda i: passwords._scrypt(
+            "password", salt, log2_n, passwords.BLOCK_SIZE, passwords.PARALLELISM), 10)
+    token, _ = auth.issue_token("user0")
+    time_calls("issue_token", lambda i: auth.issue_token("user0"), 20000)
+    time_calls("verify_token", lambda i: auth.verify_token(token), 20000)
+
+    with db_handler.get_connection() as conn:
+        conn.executemany("INSERT INTO users (username, name, email, password) VALUES (?, ?, ?, 'password')",
+                         ((f"legacy{u}", "Legacy", f"legacy{u}@example.com") for u in range(users)))
+    start = time.perf_counter()
+    migrated = db_handler.migrate_password_hashes()["migrated"]
+    elapsed = time.perf_counter() - start
+    print(f"migrated {migrated} plaintext passwords in {elapsed:.2f} s ({migrated / elapsed:.0f}/s)")
+    record("migrate_password_hashes", rps=migrated / elapsed)
+
+    datagen.generate(users, 0)
+    response_cache.ENABLED = False  # every profile read below does real work
+    tokens = [auth.issue_token(f"user{u}")[0] for u in range(users)]
+    server = start_server()
+
+    def signin(session, i):
+        return session.post(f"{BASE_URL}/api/signin", json={"username": f"user{i % users}", "password": "password"})
+
+    def profile(session, i):
+        return session.get(f"{BASE_URL}/api/get_user_info", params={"username": f"user{i % users}"},
+                           headers={"Authorization": f"Bearer {tokens[i % users]}"})
+
+    try:
+        run_load("get_user_info, idle", profile, total=1000, concurrency=4)
+        # CONCURRENCY hash threads is what hashing on the request threads would do.
+        for workers in (passwords.WORKERS, CONCURRENCY):
+            passwords.WORKERS, passwords._executor = workers, None
+            print(f"-- {workers} hash thread(s), cost n=2**{passwords.LOG2_N}")
+            run_load(f"signin, {workers} hash threads", signin, total=burst // 2)
+            signins = threading.Thread(target=run_load, args=(f"signin burst, {workers} hash threads", signin),
+                                       kwargs={"total": burst})
+            signins.start()
+            run_load(f"get_user_info during burst, {workers} hash threads", profile, total=500, concurrency=4)
+            signins.join()
+    finally:
+        server.shutdown()
+
+
+def bench_search(rows=1_000_000, users=1000):
+    """Name search at `rows` expenses: LIKE '%term%' (get_expenses) vs. the FTS5 index (search_expenses)."""
+    import datagen
+    import search
+
+    start = time.perf_counter()
+    datagen.generate(users, rows)
+    print(f"{rows} expenses for {users} users generated and indexed in {time.perf_counter() - start:.1f} s")
+    with db_handler.get_connection() as conn:
+        try:
+            size = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'expenses_fts%'").fetchone()[0]
+            print(f"FTS index size: {size / 2**20:.1f} MiB")
+        except sqlite3.Error:
+            pass  # SQLite built without dbstat
+
+    like = "SELECT id FROM expenses WHERE name LIKE ? ESCAPE '\\'"
+    with db_handler.get_connection() as conn:
+        time_calls("LIKE '%star%', all users", lambda i: conn.execute(like, ("%star%",)).fetchall(), 5)
+    # user0 has the most expenses; "zzz" matches nothing, the worst case for LIKE
+    for term in ("star", "home depot", "zzz"):
+        time_calls(f"LIKE {term!r}, page 50", lambda i: db_handler.get_expenses("user0", 50, search=term), 50)
+        time_calls(f"LIKE {term!r}, all matches", lambda i: db_handler.get_expenses("user0", search=term), 20)
+        time_calls(f"FTS {term!r}, page 50", lambda i: search.search_expenses("user0", term, fuzzy=False), 50)
+        time_calls(f"FTS {term!r}, page 50 by date", lambda i: search.search_expenses(
+            "user0", term, sort="date_desc", fuzzy=False), 50)
+        time_calls(f"FTS {term!r}, all matches", lambda i: search.search_expenses(
+            "user0", term, limit=db_handler.MAX_PAGE_SIZE, fuzzy=False), 20)
+    time_calls("FTS 'sta' (prefix)", lambda i: search.search_expenses("user0", "sta", fuzzy=False), 50)
+    search.suggest("warmup")
+    time_calls("FTS 'starbuks' (fuzzy)", lambda i: search.search_expenses("user0", "starbuks"), 50)
+    batch = [{"name": "Bench", "amount": 1.5, "category": "Groceries", "date": "2025-06-02"}] * 100
+    time_calls("add_expenses (100 rows), indexed", lambda i: db_handler.add_expenses("user1", batch), 100)
+
+
+def bench_duplicates(rows=1_000_000, users=1000):
+    """Duplicate checks at `rows` expenses: insert cost per policy, receipt fingerprints, the table-wide scan, idempotency."""
+    import datagen
+    import duplicates
+
+    datagen.generate(users, rows)
+    # Each call adds a new expense for a day no other call used, so "reject" never short-circuits.
+    for offset, policy in enumerate(db_handler.DUPLICATE_POLICIES):
+        time_calls(f"add_expense, {policy}", lambda i: db_handler.add_expense(
+            "user0", "Corner Store", 4.25, "Groceries",
+            (datetime(2026 + 3 * offset, 1, 1) + timedelta(days=i)).strftime("%Y-%m-%d"), on_duplicate=policy), 1000)
+    time_calls("add_expense, reject (duplicate)", lambda i: db_handler.add_expense(
+        "user0", "Corner Store", 4.25, "Groceries", "2026-01-01", on_duplicate="reject"), 1000)
+    for k, policy in enumerate(db_handler.DUPLICATE_POLICIES):
+        # 100 new rows for user1 per call, one of them repeated within the batch.
+        time_calls(f"add_expenses (100 rows), {policy}", lambda i: db_handler.add_expenses("user1", [
+            {"name": f"Batch {n % 99}", "amount": 2.5 + n % 99, "category": "Groceries",
+             "date": (datetime(2040, 1, 1) + timedelta(days=i + 1000 * k)).strftime("%Y-%m-%d")}
+            for n in range(100)],
+            on_duplicate=policy), 200)
+    with db_handler.get_connection() as conn:
+        time_calls("find_duplicate (hit)", lambda i: db_handler.find_duplicate(
+            conn, "user0", "CORNER STORE", 4.25, "2026-01-01"), 5000)
+        time_calls("find_duplicate (miss)", lambda i: db_handler.find_duplicate(
+            conn, "user0", "Corner Store", 4.26, "2026-01-01", "sha256:00", "dhash:00000000ffffffff"), 5000)
+
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample_receipt_images")
+    with open(os.path.join(sample_dir, "1.png"), "rb") as stream:
+        sample = stream.read()
+    photo = fake_phone_photo(sample)
+    time_calls(f"perceptual_hash, sample PNG ({len(sample) // 1024} KiB)",
+               lambda i: duplicates.perceptual_hash(sample), 50)
+    time_calls(f"perceptual_hash, 12 MP JPEG ({len(photo) // 1024} KiB)",
+               lambda i: duplicates.perceptual_hash(photo), 10)
+    time_calls(f"receipt_hash, 12 MP JPEG ({len(photo) // 1024} KiB)", lambda i: duplicates.receipt_hash(photo), 10)
+
+    start = time.perf_counter()
+    result = duplicates.find_duplicates()
+    elapsed = time.perf_counter() - start
+    print(f"find_duplicates over {rows} rows: {len(result['groups'])} groups, "
+          f"{result['duplicates']} duplicates in {elapsed * 1000:.0f} ms")
+    record("find_duplicates, whole table", mean_ms=elapsed * 1000)
+    time_calls("find_duplicates, one user (user0)", lambda i: duplicates.find_duplicates("user0"), 10)
+
+    client = app.test_client()
+    expense = {"username": "user1", "name": "Retry", "amount": 9.5, "category": "Groceries", "date": "2025-06-01"}
+    time_calls("POST add_expense, no key", lambda i: client.post("/api/add_expense", json=expense), 500)
+    time_calls("POST add_expense, new key", lambda i: client.post(
+        "/api/add_expense", json=expense, headers={"Idempotency-Key": f"new-{i}"}), 500)
+    time_calls("POST add_expense, replayed key", lambda i: client.post(
+        "/api/add_expense", json=expense, headers={"Idempotency-Key": "new-0"}), 500)
+
+
+def bench_storage(users=50, rows=50_000):
+    """SQLite vs. PostgreSQL (BENCH_POSTGRES_URL): the same workload on each, results compared call by call."""
+    import storage_parity
+
+    url = os.getenv("BENCH_POSTGRES_URL")
+    if not url:
+        print("Set BENCH_POSTGRES_URL=postgresql://... to compare against PostgreSQL; skipped.")
+        return
+
+    with storage_parity.postgres_schema(url) as postgres_url:
+        try:
+            db_handler.DATABASE = "storage.db"
+            sqlite_outcomes = storage_parity.run_workload(users, rows)
+            db_handler.DATABASE = postgres_url
+            postgres_outcomes = storage_parity.run_workload(users, rows)
+        finally:
+            db_handler.DATABASE = "users.db"
+
+    print(f"{'':<36} {'SQLite':>10} {'PostgreSQL':>12}")
+    mismatches = []
+    for label, (expected, sqlite_ms) in sqlite_outcomes.items():
+        actual, postgres_ms = postgres_outcomes[label]
+        same = expected == actual
+        if not same:
+            mismatches.append(label)
+        print(f"{label:<36} {sqlite_ms:8.2f} ms {postgres_ms:9.2f} ms   {'ok' if same else 'MISMATCH'}")
+        record(label, sqlite_ms=sqlite_ms, postgres_ms=postgres_ms)
+    for label in mismatches:
+        print(f"== {label}\n  sqlite:     {sqlite_outcomes[label][0]}\n  postgresql: {postgres_outcomes[label][0]}")
+    print(f"{len(sqlite_outcomes) - len(mismatches)}/{len(sqlite_outcomes)} results identical")
+    if mismatches:
+        sys.exit(f"{len(mismatches)} call(s) returned different results on SQLite and PostgreSQL")
+
+
+def start_gunicorn(port, workers, worker_class="gthread", env=None):
+    """Starts gunicorn with gunicorn.conf.py on `port` and waits until it answers."""
+    import subprocess
+
+    backend = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(backend, "gunicorn.conf.py"),
+         "--pythonpath", backend, "app:app"],
+        env={**os.environ, "BIND": f"{HOST}:{port}", "WEB_CONCURRENCY": str(workers),
+             "WORKER_CLASS": worker_class, "ACCESS_LOG": "/dev/null", **(env or {})},
+        stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            requests.get(f"http://{HOST}:{port}/api/hello", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def stop_gunicorn(process):
+    process.terminate()  # SIGTERM: graceful shutdown
+    process.wait(timeout=60)
+
+
+def bench_workers(users=200, rows=200_000, latency=1.0):
+    """Requests/sec per gunicorn worker count, and batch uploads on sync threads vs. gevent workers."""
+    import io
+
+    import datagen
+    from fake_llm import start_fake_llm
+
+    datagen.generate(users, rows)
+    port = PORT + 1
+    print(f"{rows} expenses for {users} users, {os.cpu_count()} CPU(s), gthread workers x 4 threads")
+
+    def get(session, i):
+        return session.get(f"http://{HOST}:{port}/api/get_expenses",
+                           params={"username": f"user{i % users}", "limit": 50})
+
+    def add(session, i):
+        return session.post(f"http://{HOST}:{port}/api/add_expense", json={
+            "username": f"user{i % users}", "name": "Load test", "amount": 12.5,
+            "category": "Groceries", "date": "2025-06-15"})
+
+    for workers in (1, 2, 4):
+        process = start_gunicorn(port, workers, env={"RESPONSE_CACHE_ENABLED": "0"})
+        try:
+            run_load(f"{workers}w GET get_expenses", get)
+            run_load(f"{workers}w POST add_expense", add)
+        finally:
+            stop_gunicorn(process)
+
+    llm, llm_url = start_fake_llm(latency=latency)
+    print(f"batch uploads (4 receipts each), fake LLM latency {latency}s, 1 worker, LLM concurrency 64")
+
+    def batch(session, i):
+        return session.post(f"http://{HOST}:{port}/api/upload_expenses_batch",
+                            data={"username": f"user{i % users}", "no_cache": "1"},
+                            files=[("files", (f"{i}-{n}.png", io.BytesIO(f"receipt-{i}-{n}".encode()), "image/png"))
+                                   for n in range(4)])
+
+    try:
+        for worker_class in ("gthread", "gevent"):
+            process = start_gunicorn(port, 1, worker_class,
+                                     env={"GROQ_ENDPOINT": llm_url, "LLM_MAX_CONCURRENCY": "64"})
+            try:
+                run_load(f"{worker_class} upload_expenses_batch", batch, total=64, concurrency=32)
+            finally:
+                stop_gunicorn(process)
+    finally:
+        llm.shutdown()
+
+
+BENCHMARKS = {
+    "http": bench_http,
+    "threshold": bench_threshold,
+    "pagination": bench_pagination,
+    "batch": bench_batch,
+    "preprocess": bench_preprocess,
+    "llm_client": bench_llm_client,
+    "streaming": bench_streaming,
+    "ocr": bench_ocr,
+    "import": bench_import,
+    "export": bench_export,
+    "analytics": bench_analytics,
+    "budgets": bench_budgets,
+    "response_cache": bench_response_cache,
+    "metrics": bench_metrics,
+    "db": bench_db,
+    "load": bench_load,
+    "auth": bench_auth,
+    "search": bench_search,
+    "duplicates": bench_duplicates,
+    "storage": bench_storage,
+    "workers": bench_workers,
+}
+
+
+def compare(baseline, tolerance):
+    """Prints each result against the baseline; returns the labels that regressed by more than `tolerance`."""
+    regressions = []
+    print(f"== compared with baseline ({baseline.get('created', 'unknown date')}, tolerance {tolerance:.0%})")
+    for label, numbers in RESULTS.items():
+        before = baseline.get("results", {}).get(label)
+        if not before:
+            print(f"{label:<48} (new)")
+            continue
+        changes = []
+        for key, value in numbers.items():
+            if not before.get(key):
+                continue
+            change = value / before[key] - 1
+            changes.append(f"{key} {change:+7.1%}")
+            # Only throughput and median latency gate: p99 and means of a few
+            # hundred calls are too noisy, as are microsecond-scale differences.
+            if key == "rps":
+                regressed = -change > tolerance
+            else:
+                regressed = key == "p50_ms" and change > tolerance and value - before[key] > NOISE_FLOOR_MS
+            if regressed and label not in regressions:
+                regressions.append(label)
+        flag = "  REGRESSION" if label in regressions else ""
+        print(f"{label:<48} {'  '.join(changes)}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmarks; runs against a throwaway database.")
+    parser.add_argument("names", nargs="*", default=["http"], help=f"any of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative p50 / throughput slowdown that counts as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    print(f"Benchmark database: {os.path.join(WORKDIR, db_handler.DATABASE)}")
+    for name in args.names:
+        print(f"== {name}")
+        _running["name"] = name
+        BENCHMARKS[name]()
+
+    if args.save:
+        with open(os.path.join(LAUNCH_DIR, args.save), "w") as out:
+            json.dump({
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "machine": platform.machine(),
+                "results": RESULTS,
+            }, out, indent=2)
+        print(f"Saved {len(RESULTS)} results to {args.save}")
+    if args.baseline:
+        with open(os.path.join(LAUNCH_DIR, args.baseline)) as stream:
+            regressions = compare(json.load(stream), args.tolerance)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmark(s) regressed beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import json
+from datetime import date, datetime, timedelta
+
+import db_handler
+
+# Budgets: any number per user, each with an amount, an optional category
+# (None = all spending) and a period - the current week (Mon-Sun), calendar
+# month or year, or a custom start/end window. The legacy per-user threshold
+# is evaluated as an implicit all-category monthly budget.
+#
+# Every budget window is split into whole months, answered from the
+# monthly_totals rollup, and leftover days at either end, answered from the
+# (username, date_iso) index on expenses. The pieces for all budgets being
+# checked go to the database as one JSON parameter and are summed in a single query,
+# whether that is one user's budgets or every budget in the database.
+PERIODS = ("weekly", "monthly", "yearly", "custom")
+THRESHOLD_BUDGET_NAME = "Monthly threshold"
+
+
+def init_budgets():
+    # Creates the budgets table if it doesn't exist.
+    with db_handler.get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS budgets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                name TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT,
+                period TEXT NOT NULL,
+                start_date TEXT,
+                end_date TEXT,
+                FOREIGN KEY(username) REFERENCES users(username) ON DELETE CASCADE
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_budgets_username ON budgets(username)")
+
+
+def budget_window(period, today, start_date=None, end_date=None):
+    """The (first, last) ISO dates a budget covers on `today`."""
+    if period == "weekly":
+        monday = today - timedelta(days=today.weekday())
+        return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+    if period == "monthly":
+        return db_handler.month_bounds(today)
+    if period == "yearly":
+        return f"{today.year}-01-01", f"{today.year}-12-31"
+    return start_date, end_date
+
+
+def split_window(first, last):
+    """Splits an ISO date range into ("month", YYYY-MM, YYYY-MM) and ("day", ISO, ISO) pieces."""
+    start, end = date.fromisoformat(first), date.fromisoformat(last)
+    # First day of the first whole month, and first day of the month after the last whole month.
+    month_start = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    after_end = end + timedelta(days=1)
+    month_end = after_end if after_end.day == 1 else end.replace(day=1)
+    if month_start >= month_end:
+        return [("day", first, last)]
+
+    pieces = [("month", month_start.strftime("%Y-%m"), (month_end - timedelta(days=1)).strftime("%Y-%m"))]
+    if start < month_start:
+        pieces.append(("day", first, (month_start - timedelta(days=1)).isoformat()))
+    if month_end <= end:
+        pieces.append(("day", month_end.isoformat(), last))
+    return pieces
+
+
+# Sums every piece of every budget in one statement. Each piece is a range
+# seek on the monthly_totals primary key or the expenses (username, date_iso) index.
+PIECES_SQL = {
+    "sqlite": '''
+        SELECT json_extract(value, '$[0]') AS budget, json_extract(value, '$[1]') AS username,
+               json_extract(value, '$[2]') AS category, json_extract(value, '$[3]') AS kind,
+               json_extract(value, '$[4]') AS first, json_extract(value, '$[5]') AS last
+        FROM json_each(?)
+    ''',
+    "postgresql": '''
+        SELECT CAST(value ->> 0 AS INTEGER) AS budget, value ->> 1 AS username, value ->> 2 AS category,
+               value ->> 3 AS kind, value ->> 4 AS first, value ->> 5 AS last
+        FROM jsonb_array_elements(CAST(? AS JSONB))
+    ''',
+}
+EVALUATE_SQL = '''
+    WITH pieces AS ({pieces})
+    SELECT p.budget, SUM(m.total)
+    FROM pieces p
+    JOIN monthly_totals m ON m.username = p.username AND m.month BETWEEN p.first AND p.last
+        AND (p.category IS NULL OR m.category = p.category)
+    WHERE p.kind = 'month'
+    GROUP BY p.budget
+    UNION ALL
+    SELECT p.budget, SUM(e.amount)
+    FROM pieces p
+    JOIN expenses e ON e.username = p.username AND e.date_iso BETWEEN p.first AND p.last
+        AND (p.category IS NULL OR e.category = p.category)
+    WHERE p.kind = 'day'
+    GROUP BY p.budget
+'''
+
+
+def evaluate(budgets, today=None):
+    """Adds window, spent, remaining, percent and exceeded to each budget dict.
+
+    `budgets` need username, amount, category, period and (for custom
+    budgets) start_date / end_date. All of them are summed in one query.
+    """
+    today = today or datetime.now().date()
+    pieces = []
+    for index, budget in enumerate(budgets):
+        first, last = budget_window(budget["period"], today, budget.get("start_date"), budget.get("end_date"))
+        budget["window"] = {"start": first, "end": last}
+        pieces.extend([index, budget["username"], budget.get("category"), *piece]
+                      for piece in split_window(first, last))
+
+    spent = [0.0] * len(budgets)
+    if pieces:
+        with db_handler.get_connection() as conn:
+            sql = EVALUATE_SQL.format(pieces=PIECES_SQL[db_handler.dialect()])
+            for index, total in conn.execute(sql, (json.dumps(pieces),)):
+                spent[index] += total or 0
+
+    for budget, total in zip(budgets, spent):
+        total = round(total, 2)
+        budget["spent"] = total
+        budget["remaining"] = round(budget["amount"] - total, 2)
+        budget["percent"] = round(total / budget["amount"] * 100, 1) if budget["amount"] else None
+        budget["exceeded"] = total > budget["amount"]
+    return budgets
+
+
+def _budget_from_row(row):
+    return {"id": row[0], "username": row[1], "name": row[2], "amount": row[3], "category": row[4],
+            "period": row[5], "start_date": row[6], "end_date": row[7]}
+
+
+def _threshold_budget(username, amount):
+    return {"id": None, "username": username, "name": THRESHOLD_BUDGET_NAME, "amount": amount,
+            "category": None, "period": "monthly", "start_date": None, "end_date": None}
+
+
+def add_budget(username, name, amount, period, category=None, start_date=None, end_date=None):
+    """Creates a budget. Custom budgets need start_date and end_date."""
+    if period not in PERIODS:
+        return {"success": False, "message": f"period must be one of {', '.join(PERIODS)}."}
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return {"success": False, "message": "amount must be a number."}
+    if amount <= 0:
+        return {"success": False, "message": "amount must be positive."}
+
+    if period == "custom":
+        start_date, end_date = db_handler.normalize_date(start_date), db_handler.normalize_date(end_date)
+        if not start_date or not end_date or start_date > end_date:
+            return {"success": False, "message": "Custom budgets need a valid start_date on or before end_date."}
+    else:
+        start_date = end_date = None
+
+    try:
+        with db_handler.get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO budgets (username, name, amount, category, period, start_date, end_date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id",
+                (username, name or f"{period.capitalize()} budget", amount, category or None, period,
+                 start_date, end_date))
+            return {"success": True, "message": "Budget added successfully.", "id": cursor.fetchone()[0]}
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+
+def get_budgets(username):
+    """Lists a user's budgets (not including the legacy threshold)."""
+    try:
+        with db_handler.get_connection() as conn:
+            rows = conn.execute("SELECT id, username, name, amount, category, period, start_date, end_date "
+                                "FROM budgets WHERE username = ? ORDER BY id", (username,)).fetchall()
+        return {"success": True, "budgets": [_budget_from_row(row) for row in rows]}
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+
+def delete_budget(username, budget_id):
+    """Deletes one of a user's budgets."""
+    try:
+        with db_handler.get_connection() as conn:
+            deleted = conn.execute("DELETE FROM budgets WHERE id = ? AND username = ?",
+                                   (budget_id, username)).rowcount
+        if not deleted:
+            return {"success": False, "message": "Budget not found."}
+        return {"success": True, "message": "Budget deleted successfully."}
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+
+def check_budgets(username, today=None):
+    """Evaluates the legacy threshold and every budget a user has in one query.
+
+    Keeps the old check_threshold fields (total_spent and threshold for the
+    current month) alongside the per-budget results, but `exceeded` now means
+    the threshold or any budget is exceeded.
+    """
+    try:
+        with db_handler.get_connection() as conn:
+            threshold = conn.execute("SELECT amount FROM thresholds WHERE username = ?", (username,)).fetchone()
+            rows = conn.execute("SELECT id, username, name, amount, category, period, start_date, end_date "
+                                "FROM budgets WHERE username = ? ORDER BY id", (username,)).fetchall()
+        budgets = [_budget_from_row(row) for row in rows]
+        if not threshold and not budgets:
+            return {"success": False, "message": "No threshold set."}
+
+        # The month's all-category total is needed for total_spent even without a threshold.
+        month = _threshold_budget(username, threshold[0] if threshold else 0)
+        evaluate([month, *budgets], today)
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+    return {
+        "success": True,
+        "exceeded": (bool(threshold) and month["exceeded"]) or any(budget["exceeded"] for budget in budgets),
+        "total_spent": month["spent"],
+        "threshold": threshold[0] if threshold else None,
+        "budgets": ([month] if threshold else []) + budgets,
+    }
+
+
+def check_all_budgets(today=None, exceeded_only=True):
+    """Batch mode for nightly alerting: evaluates every user's budgets and thresholds in one query."""
+    try:
+        with db_handler.get_connection() as conn:
+            budgets = [_budget_from_row(row) for row in conn.execute(
+                "SELECT id, username, name, amount, category, period, start_date, end_date FROM budgets")]
+            budgets.extend(_threshold_budget(username, amount)
+                           for username, amount in conn.execute("SELECT username, amount FROM thresholds"))
+        evaluate(budgets, today)
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+    results = [budget for budget in budgets if budget["exceeded"] or not exceeded_only]
+    return {"success": True, "checked": len(budgets), "exceeded": sum(b["exceeded"] for b in budgets),
+            "budgets": results}
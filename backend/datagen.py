@@ -0,0 +1,130 @@
+import argparse
+import math
+import random
+from datetime import date, timedelta
+
+import db_handler
+import migrations
+import passwords
+
+# Reproducible synthetic data for benchmarks and local load testing. Every
+# user pays rent and two utility bills each month, and everything else is drawn
+# from per-category merchant lists and log-normal amounts. Weekends are busier
+# than weekdays, and a few heavy users account for most rows (Zipf-like
+# activity). The same seed always produces the same rows.
+#
+#   python datagen.py --users 1000 --rows 1000000    # fills DATABASE_URL, by default users.db here
+
+# category -> (share of discretionary spend rows, median amount, log-normal sigma, merchants)
+CATEGORY_PROFILE = {
+    "Groceries": (0.22, 45.0, 0.6, ["Trader Joe's", "Kroger", "Safeway", "Whole Foods", "Aldi", "Costco"]),
+    "Dining & Restaurants": (0.17, 22.0, 0.7, ["Chipotle", "Olive Garden", "Panera Bread", "Local Diner",
+                                               "Sushi House", "Taco Bell"]),
+    "Food & Beverage": (0.10, 6.5, 0.5, ["Starbucks", "Dunkin'", "Blue Bottle", "Jamba Juice"]),
+    "Transportation": (0.12, 35.0, 0.8, ["Shell", "Chevron", "Uber", "Lyft", "City Parking"]),
+    "Entertainment": (0.06, 30.0, 0.7, ["AMC Theatres", "Netflix", "Steam", "Ticketmaster"]),
+    "Healthcare": (0.04, 40.0, 1.0, ["CVS Pharmacy", "Walgreens", "City Clinic"]),
+    "Personal Care": (0.04, 25.0, 0.6, ["Great Clips", "Sephora", "Ulta Beauty"]),
+    "Household Maintenance & Repairs": (0.04, 60.0, 0.9, ["Home Depot", "Lowe's", "Ace Hardware"]),
+    "Travel": (0.03, 250.0, 1.0, ["Delta Air Lines", "Marriott", "Airbnb"]),
+    "Gifts & Donations": (0.03, 40.0, 0.8, ["Red Cross", "Etsy", "1-800-Flowers"]),
+    "Pets": (0.03, 35.0, 0.6, ["Petco", "PetSmart"]),
+    "Education": (0.02, 80.0, 0.9, ["Coursera", "Campus Bookstore"]),
+    "Miscellaneous": (0.10, 20.0, 1.0, ["Amazon", "Target", "Walmart", "Dollar Tree"]),
+}
+# (category, merchant, day of month, median amount) billed to every user every month
+RECURRING = (
+    ("Rent/Mortgage", "Rent", 1, 1600.0),
+    ("Utilities", "City Power & Light", 12, 95.0),
+    ("Utilities", "Comcast", 20, 70.0),
+)
+WEEKEND_WEIGHT = 1.4
+ZIPF_EXPONENT = 0.8
+BATCH_SIZE = 50000
+
+
+def _days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def iter_expenses(users, rows, start=date(2023, 1, 1), end=date(2025, 12, 31), seed=42):
+    """Yields (username, name, amount, category, date, date_iso) tuples, `rows` in total.
+
+    Recurring bills come first (they're capped at `rows` too), then random
+    discretionary spending for the rest.
+    """
+    rng = random.Random(seed)
+    produced = 0
+    days = _days(start, end)
+    months = sorted({(day.year, day.month) for day in days})
+
+    for u in range(users):
+        monthly_scale = 0.6 + rng.random() * 0.8  # cheaper and pricier households
+        for year, month in months:
+            for category, merchant, day, median in RECURRING:
+                if produced >= rows:
+                    return
+                iso = date(year, month, day).isoformat()
+                amount = round(median * monthly_scale * (1 + rng.gauss(0, 0.05)), 2)
+                yield f"user{u}", merchant, amount, category, iso, iso
+                produced += 1
+
+    categories = list(CATEGORY_PROFILE)
+    category_weights = [CATEGORY_PROFILE[c][0] for c in categories]
+    day_weights = [WEEKEND_WEIGHT if day.weekday() >= 5 else 1.0 for day in days]
+    user_weights = [1 / math.pow(rank + 1, ZIPF_EXPONENT) for rank in range(users)]
+    iso_days = [day.isoformat() for day in days]
+
+    while produced < rows:
+        batch = min(BATCH_SIZE, rows - produced)
+        picked_users = rng.choices(range(users), weights=user_weights, k=batch)
+        picked_categories = rng.choices(categories, weights=category_weights, k=batch)
+        picked_days = rng.choices(iso_days, weights=day_weights, k=batch)
+        for u, category, iso in zip(picked_users, picked_categories, picked_days):
+            _, median, sigma, merchants = CATEGORY_PROFILE[category]
+            amount = round(max(0.5, rng.lognormvariate(math.log(median), sigma)), 2)
+            yield f"user{u}", rng.choice(merchants), amount, category, iso, iso
+        produced += batch
+
+
+def generate(users=1000, rows=1_000_000, seed=42, start=date(2023, 1, 1), end=date(2025, 12, 31)):
+    """Inserts `users` users (password "password") and `rows` expenses; returns the counts."""
+    password_hash = passwords.hash_password("password")  # one shared hash: scrypt per user would dominate
+    with db_handler.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (username, name, email, password) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            ((f"user{u}", f"User {u}", f"user{u}@example.com", password_hash) for u in range(users)))
+
+    db_handler.ensure_partitions((start + timedelta(days=day)).isoformat() for day in range((end - start).days + 1))
+    inserted = 0
+    batch = []
+    for row in iter_expenses(users, rows, start, end, seed):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            inserted += _insert(batch)
+            batch = []
+    if batch:
+        inserted += _insert(batch)
+    return {"users": users, "expenses": inserted}
+
+
+def _insert(batch):
+    with db_handler.get_connection() as conn:
+        conn.executemany("INSERT INTO expenses (username, name, amount, category, date, date_iso) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", batch)
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill users.db with synthetic users and expenses.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    migrations.migrate()
+    result = generate(args.users, args.rows, args.seed)
+    print(f"Inserted {result['expenses']} expenses for {result['users']} users into {db_handler.DATABASE}")
+
+
+if __name__ == "__main__":
+    main()
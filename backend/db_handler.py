@@ -1,13 +1,133 @@
-import sqlite3
-from datetime import datetime
+import base64
+import functools
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import passwords
+import storage
+from storage import DatabaseError, IntegrityError
+
+# A SQLite file path (or sqlite:/// URL), or a postgresql:// URL; see storage.
+DATABASE = os.getenv("DATABASE_URL", "users.db")  # Load from local DB for now
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# get_expenses sort keys -> (column, descending). Each column is covered by a
+# (username, column) index, whose implicit trailing rowid makes (column, id)
+# keyset seeks a single index range scan.
+SORT_ORDERS = {
+    "date_desc": ("date_iso", True),
+    "date_asc": ("date_iso", False),
+    "amount_desc": ("amount", True),
+    "amount_asc": ("amount", False),
+}
+MAX_PAGE_SIZE = 500
+
+# An expense duplicates another of the same user with the same date, amount
+# (to the cent) and merchant, compared ignoring case, surrounding spaces,
+# apostrophes, periods and commas ("TRADER JOE'S" = "Trader Joes"), or with
+# the same receipt file. Policies for a new duplicate: "allow" inserts it
+# silently, "flag" inserts it with duplicate_of set, "reject" refuses it.
+# "flag" also matches a similar-looking receipt image (perceptual hash within
+# RECEIPT_PHASH_DISTANCE bits) on the same date and amount, whatever the merchant.
+MERCHANT_KEY_SQL = "lower(trim(replace(replace(replace({}, '''', ''), '.', ''), ',', '')))"
+DUPLICATE_POLICIES = ("allow", "flag", "reject")
+RECEIPT_PHASH_DISTANCE = int(os.getenv("RECEIPT_PHASH_DISTANCE", "6"))
+
+
+# Formats the frontend date picker and the receipt extractor hand us. The
+# extractor is prompted for MM/DD/YY but models drift, so accept the neighbours too.
+DATE_FORMATS = (
+    "%Y-%m-%d", "%m/%d/%y", "%m/%d/%Y", "%m-%d-%y", "%m-%d-%Y",
+    "%Y/%m/%d", "%d %b %Y", "%b %d, %Y", "%B %d, %Y",
+)
+
+
+@functools.lru_cache(maxsize=4096)  # bulk imports repeat the same few dates
+def normalize_date(value):
+    """Converts a user or receipt supplied date into ISO YYYY-MM-DD (None if unparseable)."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    # Tolerate timestamps such as 2025-03-04T10:00:00
+    try:
+        return datetime.fromisoformat(text).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def month_bounds(when=None):
+    """Returns the first and last ISO day of the month containing `when` (default: today)."""
+    when = when or datetime.now()
+    first = when.replace(day=1)
+    next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first.strftime("%Y-%m-%d"), (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def backend():
+    """The storage backend for the current DATABASE, opened on first use."""
+    global _backend
+    current = _backend
+    if current is not None and current.url == DATABASE:
+        return current
+    with _backend_lock:
+        if _backend is None or _backend.url != DATABASE:
+            if _backend is not None:
+                _backend.close()  # DATABASE was repointed, drop the stale pool
+            _backend = storage.open_backend(DATABASE)
+        return _backend
+
+
+def dialect():
+    """"sqlite" or "postgresql", for the few queries written differently for each."""
+    return backend().dialect
+
+
+@contextmanager
+def get_connection():
+    """Borrows a pooled connection for one transaction.
+
+    Commits when the block exits cleanly, rolls back on error, and hands the
+    connection back to the pool instead of closing it.
+    """
+    pool = backend()
+    conn = pool.checkout()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.checkin(conn)
+
+
+def close_connections():
+    """Closes every pooled connection (e.g. on shutdown, or before forking); the next use opens a new pool."""
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
 
-DATABASE = "users.db"  # Load from local DB for now
+def ensure_partitions(date_isos):
+    """Prepares expenses for rows on these ISO dates (creates PostgreSQL's monthly partitions)."""
+    backend().ensure_partitions({date_iso[:7] for date_iso in date_isos})
 
 
 def init_db():
     # Initializes the database and creates the users table if it doesn't exist.
+    # SQLite only: this is migration 1 there, PostgreSQL's schema is in migrations.py.
 
-    with sqlite3.connect(DATABASE) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -28,10 +148,37 @@ def init_db():
                 amount REAL NOT NULL,
                 category TEXT NOT NULL,
                 date TEXT NOT NULL,
+                date_iso TEXT,
                 FOREIGN KEY(username) REFERENCES users(username) ON DELETE CASCADE
             )
         ''')
 
+        # Migrate databases created before date_iso existed and backfill it, so
+        # every row can be found by the (username, date_iso) range index below.
+        # Undated rows store '' rather than NULL so keyset pagination can seek on
+        # (date_iso, id) row values without special-casing NULLs.
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(expenses)")]
+        if "date_iso" not in columns:
+            cursor.execute("ALTER TABLE expenses ADD COLUMN date_iso TEXT")
+            conn.create_function("normalize_date", 1, normalize_date, deterministic=True)
+            cursor.execute("UPDATE expenses SET date_iso = COALESCE(normalize_date(date), '')")
+        cursor.execute("UPDATE expenses SET date_iso = '' WHERE date_iso IS NULL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(username, date_iso)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON expenses(username, amount)")
+
+        # Duplicate detection (see find_duplicate): one index seek on (user,
+        # merchant key, date) for the fields, one on the partial receipt index
+        # for images. The merchant key is an expression index, so rows from
+        # every insert path are covered, bulk imports included.
+        if "receipt_hash" not in columns:
+            cursor.execute("ALTER TABLE expenses ADD COLUMN receipt_hash TEXT")
+        if "duplicate_of" not in columns:
+            cursor.execute("ALTER TABLE expenses ADD COLUMN duplicate_of INTEGER")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_expenses_duplicate "
+                       f"ON expenses(username, {MERCHANT_KEY_SQL.format('name')}, date_iso)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_receipt ON expenses(username, receipt_hash) "
+                       "WHERE receipt_hash IS NOT NULL")
+
         # Thresholds table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS thresholds (
@@ -41,88 +188,180 @@ def init_db():
             )
         ''')
 
+        # Per-user, per-month spend rollups by category and by merchant. Triggers on
+        # expenses keep them current inside the same transaction as every
+        # insert/delete, so threshold checks, category breakdowns and merchant
+        # rankings read a handful of rows instead of raw expenses.
+        for table, column in ROLLUPS.items():
+            rollup_exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    username TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    {column} TEXT NOT NULL,
+                    total REAL NOT NULL DEFAULT 0,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (username, month, {column})
+                ) WITHOUT ROWID
+            ''')
+            for trigger in _rollup_triggers(table, column):
+                cursor.execute(trigger)
+            if not rollup_exists:
+                _rebuild_rollup(cursor, table, column)
+
         conn.commit()
 
 
-# Initialize the database when the module is loaded.
-init_db()
+# Undated rows (date_iso '') roll up under month '' so all-time totals still see them.
+ROLLUP_MONTH = "COALESCE(substr({row}.date_iso, 1, 7), '')"
+
+# Rollup table -> the expenses column it is keyed on (besides username and month).
+ROLLUPS = {"monthly_totals": "category", "merchant_totals": "name"}
+TRIGGER_PREFIXES = {"monthly_totals": "expenses_rollup", "merchant_totals": "expenses_merchant_rollup"}
+
+
+def _rollup_triggers(table, column):
+    prefix = TRIGGER_PREFIXES[table]
+    subtract_old = f'''
+        UPDATE {table} SET total = total - OLD.amount, count = count - 1
+        WHERE username = OLD.username AND month = {ROLLUP_MONTH.format(row="OLD")} AND {column} = OLD.{column};
+        DELETE FROM {table}
+        WHERE username = OLD.username AND month = {ROLLUP_MONTH.format(row="OLD")} AND {column} = OLD.{column}
+          AND count <= 0;'''
+    add_new = f'''
+        INSERT INTO {table} (username, month, {column}, total, count)
+        VALUES (NEW.username, {ROLLUP_MONTH.format(row="NEW")}, NEW.{column}, NEW.amount, 1)
+        ON CONFLICT(username, month, {column}) DO UPDATE SET total = total + excluded.total, count = count + 1;'''
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_insert AFTER INSERT ON expenses BEGIN{add_new}\nEND",
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_delete AFTER DELETE ON expenses BEGIN{subtract_old}\nEND",
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_update\n"
+        f"AFTER UPDATE OF username, amount, {column}, date_iso ON expenses BEGIN{subtract_old}{add_new}\nEND",
+    )
+
+
+def _rollup_aggregate(table, column):
+    return f'''
+        SELECT username, {ROLLUP_MONTH.format(row="expenses")}, {column}, SUM(amount), COUNT(*)
+        FROM expenses
+        GROUP BY 1, 2, 3
+    '''
+
+
+def _rebuild_rollup(cursor, table, column):
+    cursor.execute(f"DELETE FROM {table}")
+    cursor.execute(f"INSERT INTO {table} (username, month, {column}, total, count) "
+                   + _rollup_aggregate(table, column))
 
 
 def signup_user(username, name, email, password):
-    # Signs up a new user by inserting into the SQLite DB and returns the user ID.
+    # Signs up a new user by inserting into the DB and returns the user ID.
 
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        password_hash = passwords.hash_password(password)
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("INSERT INTO users (username, name, email, password) VALUES (?, ?, ?, ?)",
-                           (username, name, email, password))
+            cursor.execute("INSERT INTO users (username, name, email, password) VALUES (?, ?, ?, ?) RETURNING id",
+                           (username, name, email, password_hash))
+            user_id = cursor.fetchone()[0]
             conn.commit()
-            user_id = cursor.lastrowid
             return {"success": True, "message": "User registered successfully.", "user_id": user_id}
 
-    except sqlite3.IntegrityError as e:
+    except passwords.PoolBusy as e:
+        return {"success": False, "message": str(e), "busy": True}
+
+    except IntegrityError as e:
         error_message = str(e)
+        column = _unique_column(error_message)
 
-        if "UNIQUE constraint failed: users.username" in error_message:
+        if column == "username":
             return {"success": False, "message": "Username is already taken."}
-        elif "UNIQUE constraint failed: users.email" in error_message:
+        elif column == "email":
             return {"success": False, "message": "Email is already registered."}
         else:
             return {"success": False, "message": f"Database Integrity Error: {error_message}"}
 
-    except sqlite3.Error as e:
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
     except Exception as e:
         return {"success": False, "message": f"Unexpected Error: {str(e)}"}
 
 
-def signin_user_by_email(email, password):
-    # Signs in a user by checking email and password.
+# "UNIQUE constraint failed: users.email" (SQLite), "Key (email)=(...) already exists." (PostgreSQL)
+_UNIQUE_COLUMN = re.compile(r"UNIQUE constraint failed: \w+\.(\w+)|Key \((\w+)\)=")
 
-    try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, password FROM users WHERE email = ?", (email,))
-            row = cursor.fetchone()
 
-            if row and row[1] == password:
-                return {"success": True, "message": "Login successful.", "user_id": row[0]}
-            else:
-                return {"success": False, "message": "Invalid email or password."}
+def _unique_column(error_message):
+    match = _UNIQUE_COLUMN.search(error_message)
+    return (match.group(1) or match.group(2)) if match else None
 
-    except sqlite3.Error as e:
+
+def _signin(column, value, password, failure_message):
+    # Checks the password against the stored hash and upgrades legacy or outdated hashes in place.
+    try:
+        with get_connection() as conn:
+            row = conn.execute(f"SELECT id, username, password FROM users WHERE {column} = ?", (value,)).fetchone()
+
+        if not passwords.verify_password(password, row[2] if row else None):
+            return {"success": False, "message": failure_message}
+
+        user_id, username, stored = row
+        if passwords.needs_rehash(stored):
+            upgraded = passwords.hash_password(password)
+            with get_connection() as conn:
+                # Only replaces the value we verified, in case a concurrent sign-in got there first.
+                conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                             (upgraded, user_id, stored))
+                conn.commit()
+        return {"success": True, "message": "Login successful.", "user_id": user_id, "username": username}
+
+    except passwords.PoolBusy as e:
+        return {"success": False, "message": str(e), "busy": True}
+
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
     except Exception as e:
         return {"success": False, "message": f"Unexpected Error: {str(e)}"}
 
 
-def signin_user_by_username(username, password):
-    # Signs in a user by checking username and password.
+def signin_user_by_email(email, password):
+    # Signs in a user by checking email and password.
+    return _signin("email", email, password, "Invalid email or password.")
 
-    try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, password FROM users WHERE username = ?", (username,))
-            row = cursor.fetchone()
 
-            if row and row[1] == password:
-                return {"success": True, "message": "Login successful.", "user_id": row[0]}
-            else:
-                return {"success": False, "message": "Invalid username or password."}
+def signin_user_by_username(username, password):
+    # Signs in a user by checking username and password.
+    return _signin("username", username, password, "Invalid username or password.")
 
-    except sqlite3.Error as e:
-        return {"success": False, "message": f"Database Error: {str(e)}"}
 
-    except Exception as e:
-        return {"success": False, "message": f"Unexpected Error: {str(e)}"}
+def migrate_password_hashes(batch_size=500):
+    """Replaces every plaintext password left from before hashing with its hash; returns how many."""
+    migrated = 0
+    try:
+        while True:
+            with get_connection() as conn:
+                rows = conn.execute(f"SELECT id, password FROM users WHERE password NOT LIKE '{passwords.SCHEME}$%' "
+                                    "LIMIT ?", (batch_size,)).fetchall()
+            if not rows:
+                return {"success": True, "migrated": migrated}
+            hashes = passwords.hash_passwords([row[1] for row in rows])
+            with get_connection() as conn:
+                cursor = conn.executemany("UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                                          [(hashed, user_id, plain) for (user_id, plain), hashed in zip(rows, hashes)])
+                conn.commit()
+                migrated += cursor.rowcount
+
+    except DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}", "migrated": migrated}
 
 
 def get_user_info(username):
     """Fetches the full name and email of a user based on their username."""
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT name, email FROM users WHERE username = ?", (username,))
             row = cursor.fetchone()
@@ -132,74 +371,367 @@ def get_user_info(username):
             else:
                 return {"success": False, "message": "User not found."}
 
-    except sqlite3.Error as e:
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
 
-def add_expense(username, name, amount, category, date):
-    """Adds an expense for a user."""
+def phash_distance(first, second):
+    """Number of differing bits between two "dhash:<hex>" perceptual hashes."""
+    return bin(int(first[6:], 16) ^ int(second[6:], 16)).count("1")
+
+
+def find_duplicate(conn, username, name, amount, date_iso, receipt_hash=None, receipt_phash=None):
+    """Id of the first existing expense the given one duplicates, or None; at most three index seeks.
+
+    `receipt_phash` should only be given under the "flag" policy: a similar
+    image is a hint, not proof, so it also needs the same date and amount.
+    """
+    if receipt_hash:
+        row = conn.execute("SELECT id FROM expenses WHERE username = ? AND receipt_hash = ? ORDER BY id LIMIT 1",
+                           (username, receipt_hash)).fetchone()
+        if row:
+            return row[0]
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO expenses (username, name, amount, category, date) VALUES (?, ?, ?, ?, ?)",
-                           (username, name, amount, category, date))
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None
+    # Unary + keeps the planner off idx_expenses_user_amount: a popular amount
+    # matches far more of the user's rows than one merchant on one day.
+    row = conn.execute(
+        f"SELECT id FROM expenses WHERE username = ? AND {MERCHANT_KEY_SQL.format('name')} = "
+        f"{MERCHANT_KEY_SQL.format('?')} AND date_iso = ? AND +amount BETWEEN ? AND ? ORDER BY id LIMIT 1",
+        (username, name, date_iso, amount - 0.005, amount + 0.005)).fetchone()
+    if row:
+        return row[0]
+    if receipt_phash:
+        # The merchant may have been read differently off a second photo of the same receipt.
+        for expense_id, other in conn.execute(
+                "SELECT id, receipt_phash FROM expenses WHERE username = ? AND date_iso = ? "
+                "AND +amount BETWEEN ? AND ? AND receipt_phash IS NOT NULL ORDER BY id",
+                (username, date_iso, amount - 0.005, amount + 0.005)):
+            if phash_distance(receipt_phash, other) <= RECEIPT_PHASH_DISTANCE:
+                return expense_id
+    return None
+
+
+INSERT_EXPENSE_SQL = ("INSERT INTO expenses (username, name, amount, category, date, date_iso, receipt_hash, "
+                      "receipt_phash, duplicate_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+# Expenses per batched duplicate lookup; keeps each query's parameters well under SQLite's limit.
+DUPLICATE_LOOKUP_CHUNK = 500
+
+
+def _expense_row(username, expense, duplicate_of=None):
+    # Parameters for INSERT_EXPENSE_SQL from an expense dict.
+    return (username, expense["name"], expense["amount"], expense["category"], expense["date"],
+            normalize_date(expense["date"]) or "", expense.get("receipt_hash"), expense.get("receipt_phash"),
+            duplicate_of)
+
+
+def _insert_checked(conn, username, expense, on_duplicate):
+    # Inserts one expense dict under a duplicate policy; returns (new id or None, duplicate_of or None).
+    date_iso = normalize_date(expense["date"]) or ""
+    duplicate_of = None
+    if on_duplicate != "allow":
+        duplicate_of = find_duplicate(conn, username, expense["name"], expense["amount"], date_iso,
+                                      expense.get("receipt_hash"),
+                                      expense.get("receipt_phash") if on_duplicate == "flag" else None)
+        if duplicate_of is not None and on_duplicate == "reject":
+            return None, duplicate_of
+    row = conn.execute(INSERT_EXPENSE_SQL + " RETURNING id", _expense_row(username, expense, duplicate_of)).fetchone()
+    return row[0], duplicate_of
+
+
+def find_duplicates(conn, username, expenses, indexes, use_phash=False):
+    """find_duplicate for expenses[i], i in `indexes`, in a few queries per DUPLICATE_LOOKUP_CHUNK expenses.
+
+    Returns ({index: duplicate_of} for the duplicates, {index: (merchant key,
+    date_iso, amount in cents)} for every expense with a numeric amount).
+    """
+    found, keys = {}, {}
+    for start in range(0, len(indexes), DUPLICATE_LOOKUP_CHUNK):
+        chunk = indexes[start:start + DUPLICATE_LOOKUP_CHUNK]
+        hashes = sorted({expenses[i]["receipt_hash"] for i in chunk if expenses[i].get("receipt_hash")})
+        by_hash = {}
+        if hashes:
+            by_hash = dict(conn.execute(
+                f"SELECT receipt_hash, MIN(id) FROM expenses WHERE username = ? "
+                f"AND receipt_hash IN ({', '.join('?' * len(hashes))}) GROUP BY receipt_hash",
+                (username, *hashes)).fetchall())
+        values, params = [], []
+        for i in chunk:
+            expense = expenses[i]
+            if expense.get("receipt_hash") in by_hash:
+                found[i] = by_hash[expense["receipt_hash"]]
+            try:
+                amount = float(expense["amount"])
+            except (TypeError, ValueError):
+                continue
+            values.append(f"(?, {MERCHANT_KEY_SQL.format('?')}, ?, ?)")
+            params += [i, expense["name"], normalize_date(expense["date"]) or "", amount]
+        if not values:
+            continue
+        # One probe of idx_expenses_duplicate per expense, as in find_duplicate.
+        rows = conn.execute(
+            f"WITH batch(idx, merchant, date_iso, amount) AS (VALUES {', '.join(values)}) "
+            f"SELECT batch.idx, batch.merchant, batch.date_iso, batch.amount, MIN(e.id) FROM batch "
+            f"LEFT JOIN expenses e ON e.username = ? AND {MERCHANT_KEY_SQL.format('e.name')} = batch.merchant "
+            f"AND e.date_iso = batch.date_iso AND +e.amount BETWEEN batch.amount - 0.005 AND batch.amount + 0.005 "
+            f"GROUP BY batch.idx, batch.merchant, batch.date_iso, batch.amount",
+            (*params, username)).fetchall()
+        for i, merchant, date_iso, amount, duplicate_of in rows:
+            keys[i] = (merchant, date_iso, round(float(amount) * 100))
+            if duplicate_of is not None:
+                found.setdefault(i, duplicate_of)
+        prints = {i: expenses[i]["receipt_phash"] for i in chunk
+                  if use_phash and i in keys and i not in found and expenses[i].get("receipt_phash")}
+        if prints:
+            dates = sorted({keys[i][1] for i in prints})
+            candidates = conn.execute(
+                f"SELECT id, date_iso, amount, receipt_phash FROM expenses WHERE username = ? "
+                f"AND date_iso IN ({', '.join('?' * len(dates))}) AND receipt_phash IS NOT NULL ORDER BY id",
+                (username, *dates)).fetchall()
+            for i, receipt_phash in prints.items():
+                amount = float(expenses[i]["amount"])
+                for expense_id, date_iso, other_amount, other in candidates:
+                    if (date_iso == keys[i][1] and isinstance(other_amount, (int, float))
+                            and abs(other_amount - amount) <= 0.005
+                            and phash_distance(receipt_phash, other) <= RECEIPT_PHASH_DISTANCE):
+                        found[i] = expense_id
+                        break
+    return found, keys
+
+
+def _repeats_in_batch(expenses, pending, found, keys, on_duplicate):
+    # The pending indexes that may duplicate an earlier pending expense, one that will be inserted.
+    # Amounts a cent apart count, so this catches at least whatever find_duplicates would.
+    repeats, seen_keys, seen_hashes, seen_prints = [], set(), set(), {}
+    for i in pending:
+        if i in found and on_duplicate == "reject":
+            continue
+        key, receipt_hash = keys.get(i), expenses[i].get("receipt_hash")
+        receipt_phash = expenses[i].get("receipt_phash") if on_duplicate == "flag" and key else None
+        near = [(key[0], key[1], key[2] + cents) for cents in (-1, 0, 1)] if key else []
+        if (any(k in seen_keys for k in near) or (receipt_hash and receipt_hash in seen_hashes)
+                or (receipt_phash and any(phash_distance(receipt_phash, other) <= RECEIPT_PHASH_DISTANCE
+                                          for k in near for other in seen_prints.get(k[1:], ())))):
+            repeats.append(i)
+        if key:
+            seen_keys.add(key)
+            if receipt_phash:
+                seen_prints.setdefault(key[1:], []).append(receipt_phash)
+        if receipt_hash:
+            seen_hashes.add(receipt_hash)
+    return repeats
+
+
+def add_expense(username, name, amount, category, date, receipt_hash=None, on_duplicate="allow",
+                receipt_phash=None):
+    """Adds an expense for a user, checking for a duplicate first unless `on_duplicate` is "allow"."""
+    if on_duplicate not in DUPLICATE_POLICIES:
+        return {"success": False, "message": f"Invalid on_duplicate. Use one of: {', '.join(DUPLICATE_POLICIES)}."}
+    expense = {"name": name, "amount": amount, "category": category, "date": date, "receipt_hash": receipt_hash,
+               "receipt_phash": receipt_phash}
+    try:
+        ensure_partitions([normalize_date(date) or ""])
+        with get_connection() as conn:
+            if on_duplicate != "allow":
+                backend().lock(conn, username)  # no other writer between the check and the insert
+            expense_id, duplicate_of = _insert_checked(conn, username, expense, on_duplicate)
             conn.commit()
-            return {"success": True, "message": "Expense added successfully."}
 
-    except sqlite3.Error as e:
+            if expense_id is None:
+                return {"success": False, "message": f"Duplicate of expense {duplicate_of}; not added.",
+                        "duplicate": True, "duplicate_of": duplicate_of}
+            if duplicate_of is not None:
+                return {"success": True, "message": f"Expense added, but it looks like a duplicate of expense "
+                        f"{duplicate_of}.", "expense_id": expense_id, "duplicate_of": duplicate_of}
+            return {"success": True, "message": "Expense added successfully.", "expense_id": expense_id}
+
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
 
-def get_expenses(username):
-    """Fetches all expenses for a specific user."""
+def add_expenses(username, expenses, on_duplicate="allow"):
+    """Adds several expenses for a user in one transaction.
+
+    `expenses` is a list of dicts with name, amount, category and date keys,
+    and optionally receipt_hash and receipt_phash. Unless `on_duplicate` is "allow", each one is
+    checked against existing rows and those before it in the list (see
+    find_duplicates), and `duplicates` lists {"index", "duplicate_of"} for
+    each one flagged or rejected.
+    """
+    if on_duplicate not in DUPLICATE_POLICIES:
+        return {"success": False, "message": f"Invalid on_duplicate. Use one of: {', '.join(DUPLICATE_POLICIES)}."}
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, amount, category, date FROM expenses WHERE username = ?", (username,))
-            expenses = cursor.fetchall()
+        ensure_partitions([normalize_date(e["date"]) or "" for e in expenses])
+        with get_connection() as conn:
+            if on_duplicate == "allow":
+                rows = [_expense_row(username, e) for e in expenses]
+                conn.executemany(INSERT_EXPENSE_SQL, rows)
+                added, duplicates = len(rows), []
+            else:
+                backend().lock(conn, username)
+                use_phash = on_duplicate == "flag"
+                pending = list(range(len(expenses)))
+                found, keys = find_duplicates(conn, username, expenses, pending, use_phash)
+                while pending:
+                    # Expenses repeating an earlier one in the list wait until it is in, then get checked again.
+                    waiting = _repeats_in_batch(expenses, pending, found, keys, on_duplicate)
+                    skip = set(waiting)
+                    conn.executemany(INSERT_EXPENSE_SQL, [_expense_row(username, expenses[i], found.get(i))
+                                                          for i in pending
+                                                          if i not in skip and (use_phash or i not in found)])
+                    pending = waiting
+                    if pending:
+                        found.update(find_duplicates(conn, username, expenses, pending, use_phash)[0])
+                added = sum(1 for i in range(len(expenses)) if use_phash or i not in found)
+                duplicates = [{"index": i, "duplicate_of": found[i]} for i in sorted(found)]
+            conn.commit()
+            return {"success": True, "message": f"{added} expenses added successfully.", "count": added,
+                    "duplicates": duplicates}
+
+    except DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+
+def _encode_cursor(sort_value, expense_id):
+    raw = json.dumps([sort_value, expense_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
 
-            if not expenses:
-                return {"success": True, "expenses": []}  # Return empty list if no expenses found
+def _decode_cursor(cursor):
+    try:
+        sort_value, expense_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(expense_id, int):
+        raise ValueError("Invalid cursor.")
+    return sort_value, expense_id
+
+
+def get_expenses(username, limit=None, cursor=None, start_date=None, end_date=None,
+                 categories=None, search=None, sort="date_desc"):
+    """Fetches a user's expenses, optionally filtered and keyset-paginated.
+
+    Rows are ordered by `sort` (see SORT_ORDERS) with id as tiebreaker. When
+    `limit` is given the response carries a `next_cursor` to pass back for the
+    following page; without it every matching row is returned.
+    """
+    if sort not in SORT_ORDERS:
+        return {"success": False, "message": f"Invalid sort. Use one of: {', '.join(SORT_ORDERS)}."}
+    column, descending = SORT_ORDERS[sort]
+    direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+
+    where = ["username = ?"]
+    params = [username]
+    if start_date:
+        where.append("date_iso >= ?")
+        params.append(normalize_date(start_date) or start_date)
+    if end_date:
+        where.append("date_iso <= ?")
+        params.append(normalize_date(end_date) or end_date)
+    if categories:
+        where.append(f"category IN ({','.join('?' * len(categories))})")
+        params.extend(categories)
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        like = "ILIKE" if dialect() == "postgresql" else "LIKE"  # SQLite's LIKE ignores case already
+        where.append(f"name {like} ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    if cursor:
+        try:
+            sort_value, last_id = _decode_cursor(cursor)
+        except ValueError as e:
+            return {"success": False, "message": str(e)}
+        where.append(f"({column}, id) {comparison} (?, ?)")
+        params.extend([sort_value, last_id])
+
+    query = (f"SELECT id, name, amount, category, date, duplicate_of, {column} FROM expenses "
+             f"WHERE {' AND '.join(where)} ORDER BY {column} {direction}, id {direction}")
+    if limit is not None:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query += " LIMIT ?"
+        params.append(limit + 1)  # one extra row tells us whether another page exists
+
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = _encode_cursor(rows[-1][6], rows[-1][0])
 
             expense_list = [
-                {"id": row[0], "name": row[1], "amount": row[2], "category": row[3], "date": row[4]}
-                for row in expenses
+                {"id": row[0], "name": row[1], "amount": row[2], "category": row[3], "date": row[4],
+                 "duplicate_of": row[5]}
+                for row in rows
             ]
 
-            return {"success": True, "expenses": expense_list}
+            return {"success": True, "expenses": expense_list, "next_cursor": next_cursor}
 
-    except sqlite3.Error as e:
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
-def delete_expenses(expense_ids):
-    """Deletes expenses based on provided IDs."""
+def iter_expenses(username, start_date=None, end_date=None, batch_size=1000):
+    """Yields a user's expenses oldest first as (id, name, amount, category, date, date_iso) tuples.
+
+    Rows are pulled `batch_size` at a time (through a server-side cursor on
+    PostgreSQL), so memory stays constant however many rows match. The pooled
+    connection (and its read snapshot) is held until the generator is
+    exhausted or closed.
+    """
+    where = ["username = ?"]
+    params = [username]
+    if start_date:
+        where.append("date_iso >= ?")
+        params.append(normalize_date(start_date) or start_date)
+    if end_date:
+        where.append("date_iso <= ?")
+        params.append(normalize_date(end_date) or end_date)
+
+    with get_connection() as conn:
+        yield from backend().iterate(conn, f"SELECT id, name, amount, category, date, date_iso FROM expenses "
+                                           f"WHERE {' AND '.join(where)} ORDER BY date_iso, id", params, batch_size)
+
+def delete_expenses(expense_ids, username=None):
+    """Deletes expenses based on provided IDs and reports whose expenses they were.
+
+    With `username`, only that user's expenses among the IDs are deleted.
+    """
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(f"DELETE FROM expenses WHERE id IN ({','.join('?' * len(expense_ids))})", expense_ids)
+            query = f"DELETE FROM expenses WHERE id IN ({','.join('?' * len(expense_ids))})"
+            params = list(expense_ids)
+            if username is not None:
+                query += " AND username = ?"
+                params.append(username)
+            cursor.execute(query + " RETURNING username", params)
+            usernames = sorted({row[0] for row in cursor.fetchall()})
             conn.commit()
 
-            return {"success": True, "message": "Expenses deleted successfully."}
+            return {"success": True, "message": "Expenses deleted successfully.", "usernames": usernames}
 
-    except sqlite3.Error as e:
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
 def set_threshold(username, amount):
     """Set or update a user's spending threshold."""
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("INSERT INTO thresholds (username, amount) VALUES (?, ?) ON CONFLICT(username) DO UPDATE SET amount=?",
                            (username, amount, amount))
             conn.commit()
             return {"success": True, "message": "Threshold updated successfully."}
-    except sqlite3.Error as e:
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
 def get_threshold(username):
     """Retrieve a user's spending threshold."""
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT amount FROM thresholds WHERE username = ?", (username,))
             row = cursor.fetchone()
@@ -207,29 +739,70 @@ def get_threshold(username):
                 return {"success": True, "threshold": row[0]}
             else:
                 return {"success": False, "message": "No threshold set."}
-    except sqlite3.Error as e:
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
 
-def check_threshold(username):
-    """Check if the user has exceeded their threshold for the current month."""
+def get_category_totals(username, month=None):
+    """Returns a user's spend per category, all-time or for one YYYY-MM month."""
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
+            if month:
+                cursor.execute("SELECT category, total FROM monthly_totals WHERE username = ? AND month = ?",
+                               (username, month))
+            else:
+                cursor.execute("SELECT category, SUM(total) FROM monthly_totals WHERE username = ? GROUP BY category",
+                               (username,))
+            categories = {row[0]: round(row[1], 2) for row in cursor.fetchall()}
+            return {"success": True, "categories": categories, "total_spent": round(sum(categories.values()), 2)}
 
-            # Get threshold
-            cursor.execute("SELECT amount FROM thresholds WHERE username = ?", (username,))
-            row = cursor.fetchone()
-            if not row:
-                return {"success": False, "message": "No threshold set."}
-            threshold = row[0]
+    except DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
 
-            # Get total expenses for the current month
-            current_month = datetime.now().strftime("%Y-%m")
-            cursor.execute("SELECT SUM(amount) FROM expenses WHERE username = ? AND date LIKE ?", (username, f"{current_month}-%"))
-            total_spent = cursor.fetchone()[0] or 0
 
-            exceeded = total_spent > threshold
-            return {"success": True, "exceeded": exceeded, "total_spent": total_spent, "threshold": threshold}
+def rebuild_monthly_totals():
+    """Recomputes the monthly_totals and merchant_totals rollups from the raw expenses table."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            # Everyone with expenses or rollup rows (stale ones included) may see different totals after.
+            cursor.execute(" UNION ".join(["SELECT username FROM expenses"]
+                                          + [f"SELECT username FROM {table}" for table in ROLLUPS]))
+            usernames = [row[0] for row in cursor.fetchall()]
+            rows = {}
+            for table, column in ROLLUPS.items():
+                _rebuild_rollup(cursor, table, column)
+                rows[table] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            conn.commit()
+            return {"success": True, "message": "Rollups rebuilt.", "rows": rows, "usernames": usernames}
+
+    except DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
 
-    except sqlite3.Error as e:
+def verify_monthly_totals(tolerance=0.005):
+    """Compares the rollup tables against a fresh aggregate of expenses."""
+    mismatches = []
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            for table, column in ROLLUPS.items():
+                cursor.execute(_rollup_aggregate(table, column))
+                expected = {row[:3]: row[3:] for row in cursor.fetchall()}
+                cursor.execute(f"SELECT username, month, {column}, total, count FROM {table}")
+                actual = {row[:3]: row[3:] for row in cursor.fetchall()}
+
+                for key in expected.keys() | actual.keys():
+                    want_total, want_count = expected.get(key, (0, 0))
+                    have_total, have_count = actual.get(key, (0, 0))
+                    if want_count != have_count or abs(want_total - have_total) > tolerance:
+                        mismatches.append({
+                            "table": table, "username": key[0], "month": key[1], column: key[2],
+                            "expected": {"total": want_total, "count": want_count},
+                            "actual": {"total": have_total, "count": have_count},
+                        })
+
+        return {"success": True, "consistent": not mismatches, "mismatches": mismatches}
+
+    except DatabaseError as e:
         return {"success": False, "message": f"Database Error: {str(e)}"}
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it only byte-identical receipts match
+    Image = None
+
+import db_handler
+
+# Receipt fingerprints and the batch search for duplicates already stored.
+#
+# A receipt has two fingerprints. receipt_hash is the SHA-256 of the file, so
+# it only matches the very same upload again; it is the one "reject" acts on.
+# receipt_phash is a 64-bit difference hash (dHash) of the image: shrink to
+# 9x8 grayscale and record whether each pixel is brighter than its right-hand
+# neighbour. It survives re-encoding and resizing, but a tiny thumbnail of a
+# mostly white receipt says little about the text on it, so unrelated receipts
+# can come out alike. It therefore only ever flags, and only when it is within
+# db_handler.RECEIPT_PHASH_DISTANCE bits of an expense with the same date and
+# amount (see db_handler.find_duplicate). Near-uniform hashes, such as a blank
+# page gives, are dropped. Without Pillow, or for files it can't decode, there
+# is no perceptual hash.
+#
+# New expenses are checked one at a time by db_handler.find_duplicate. Rows
+# that got in earlier (before detection existed, or under the "allow" policy)
+# are found in one pass by find_duplicates(), e.g. nightly via
+# `flask find-duplicates --mark`.
+#
+# For uploads, RECEIPT_POLICY applies to the file: under "reject", a receipt
+# the user already uploaded is refused before it reaches the extractor. An
+# upload whose extracted fields match another expense is only ever flagged,
+# because two identical purchases on one day are plausible.
+DEFAULT_POLICY = os.getenv("DUPLICATE_POLICY", "flag")  # manual entries
+RECEIPT_POLICY = os.getenv("RECEIPT_DUPLICATE_POLICY", "reject")  # uploaded receipts
+MIN_PHASH_BITS = 8  # a dHash with fewer set (or clear) bits than this is too uniform to tell receipts apart
+
+
+def field_policy(receipt_policy):
+    """The policy for an upload's extracted fields, given its receipt policy."""
+    return "flag" if receipt_policy == "reject" else receipt_policy
+
+
+def receipt_hash(image_data):
+    """Exact fingerprint of a receipt file: "sha256:<hex>"."""
+    return "sha256:" + hashlib.sha256(image_data).hexdigest()
+
+
+def perceptual_hash(image_data):
+    """Perceptual fingerprint of a receipt image, "dhash:<16 hex>"; None if it can't be decoded or is near-uniform."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image.draft("L", (144, 128))  # JPEGs decode at 1/2..1/8 scale, ~15x faster for phone photos
+            small = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    if not MIN_PHASH_BITS <= bin(bits).count("1") <= 64 - MIN_PHASH_BITS:
+        return None
+    return f"dhash:{bits:016x}"
+
+
+def existing_receipts(username, hashes):
+    """Maps each of `hashes` the user already has an expense for to that expense's id."""
+    hashes = sorted(set(hashes))
+    if not hashes:
+        return {}
+    with db_handler.get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT receipt_hash, MIN(id) FROM expenses WHERE username = ? "
+            f"AND receipt_hash IN ({','.join('?' * len(hashes))}) GROUP BY receipt_hash",
+            (username, *hashes)).fetchall()
+    return dict(rows)
+
+
+# Groups of two or more expenses with the same user, merchant key, date and
+# amount in cents, or the same user and receipt. The first query walks
+# idx_expenses_duplicate in order, so the grouping needs no sort on its
+# leading columns.
+FIELD_GROUPS_SQL = f'''
+    SELECT username, MIN(id), {{id_list}}, MIN(name), date_iso, ROUND(CAST(amount AS NUMERIC), 2)
+    FROM expenses
+    WHERE {{where}}
+    GROUP BY username, {db_handler.MERCHANT_KEY_SQL.format('name')}, date_iso, ROUND(CAST(amount AS NUMERIC), 2)
+    HAVING COUNT(*) > 1
+'''
+RECEIPT_GROUPS_SQL = '''
+    SELECT username, MIN(id), {id_list}, MIN(name), MIN(date_iso), MIN(amount)
+    FROM expenses
+    WHERE receipt_hash IS NOT NULL AND {where}
+    GROUP BY username, receipt_hash
+    HAVING COUNT(*) > 1
+'''
+ID_LIST_SQL = {"sqlite": "GROUP_CONCAT(id)", "postgresql": "string_agg(CAST(id AS TEXT), ',')"}
+
+
+def find_duplicates(username=None, mark=False):
+    """Finds groups of duplicate expenses, for one user or the whole table.
+
+    Each group lists the ids in insertion order; the first is the original.
+    With `mark`, every later copy not yet marked gets duplicate_of set to it.
+    """
+    where, params = ("username = ?", (username,)) if username else ("TRUE", ())
+    id_list = ID_LIST_SQL[db_handler.dialect()]
+    try:
+        with db_handler.get_connection() as conn:
+            groups = {}
+            for sql, reason in ((FIELD_GROUPS_SQL, "same merchant, date and amount"),
+                                (RECEIPT_GROUPS_SQL, "same receipt image")):
+                rows = conn.execute(sql.format(where=where, id_list=id_list), params)
+                for owner, original, ids, name, date_iso, amount in rows:
+                    ids = sorted(int(expense_id) for expense_id in ids.split(","))
+                    group = groups.setdefault(original, {
+                        "username": owner, "original": original, "ids": ids, "name": name,
+                        "date": date_iso, "amount": amount, "reasons": []})
+                    group["ids"] = sorted(set(group["ids"]) | set(ids))
+                    group["reasons"].append(reason)
+
+            marked = 0
+            if mark:
+                updates = [(group["original"], expense_id) for group in groups.values()
+                           for expense_id in group["ids"][1:]]
+                cursor = conn.executemany("UPDATE expenses SET duplicate_of = ? WHERE id = ? AND duplicate_of IS NULL",
+                                          updates)
+                marked = max(cursor.rowcount, 0)
+                conn.commit()
+
+        ordered = sorted(groups.values(), key=lambda group: group["original"])
+        return {"success": True, "groups": ordered, "duplicates": sum(len(g["ids"]) - 1 for g in ordered),
+                "marked": marked}
+
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
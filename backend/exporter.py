@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+
+# Serializers that turn db_handler.iter_expenses() rows into byte chunks for a
+# streamed Flask response, so exports start immediately and never hold the
+# whole history in memory.
+COLUMNS = ["id", "name", "amount", "category", "date", "date_iso"]
+FLUSH_ROWS = 500  # rows per chunk handed to the WSGI server
+PARQUET_ROW_GROUP = 50000
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if name != "parquet" or pa is not None]
+
+
+def stream_ndjson(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(COLUMNS, row))))
+        if len(lines) >= FLUSH_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file object that lets a ParquetWriter's output be drained in pieces.
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_parquet(rows):
+    """Emits a Parquet file one row group at a time (the footer comes last)."""
+    schema = pa.schema([("id", pa.int64()), ("name", pa.string()), ("amount", pa.float64()),
+                        ("category", pa.string()), ("date", pa.string()), ("date_iso", pa.string())])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def flush(batch):
+        columns = list(zip(*batch))
+        writer.write_table(pa.Table.from_arrays([pa.array(col, type=field.type)
+                                                 for col, field in zip(columns, schema)], schema=schema))
+        return sink.drain()
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= PARQUET_ROW_GROUP:
+            yield flush(batch)
+            batch = []
+    if batch:
+        yield flush(batch)
+    writer.close()
+    yield sink.drain()
+
+
+STREAMERS = {"ndjson": stream_ndjson, "csv": stream_csv, "parquet": stream_parquet}
+
+
+def stream(rows, file_format):
+    """Returns (byte chunk generator, mimetype, file extension) for an export format."""
+    mimetype, extension = FORMATS[file_format]
+    return STREAMERS[file_format](rows), mimetype, extension
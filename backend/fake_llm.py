@@ -0,0 +1,150 @@
+"""A local stand-in for the Groq chat completions endpoint.
+
+Answers every POST with a canned receipt extraction so uploads can be exercised
+without an API key or network access, as one JSON body or, for "stream": true,
+as server-sent events. It can also inject slowness, throttling (429 with
+Retry-After), server errors (503) and malformed replies to exercise client
+resilience. Text-only requests (the extractor's repair calls) always get a
+clean answer:
+
+    python fake_llm.py --port 8089 --latency 1.5 --bandwidth 250000
+    python fake_llm.py --throttle-rate 0.2 --error-rate 0.1
+    python fake_llm.py --token-delay 0.02 --malformed-rate 0.3
+    GROQ_ENDPOINT=http://127.0.0.1:8089/openai/v1/chat/completions python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_RECEIPT = {"amount": 23.47, "category": "Groceries", "date": "03/14/25", "name": "Trader Joe's"}
+# Vision models like to explain themselves after the JSON.
+NOTE = ("\nThe total is the final amount charged after tax. The date was read from the header "
+        "and the category inferred from the merchant name.")
+# Ways real replies go wrong: Python-style quotes, loose values, a preamble
+# with a trailing comma, a missing field.
+MALFORMED_REPLIES = (
+    "```json\n" + repr(CANNED_RECEIPT) + "\n```",
+    json.dumps({"amount": "$23.47", "category": "Grocery", "date": "March 14, 2025", "name": "Trader Joe's"}),
+    "Here is the extracted data:\n" + json.dumps(CANNED_RECEIPT)[:-1] + ",}",
+    json.dumps({key: value for key, value in CANNED_RECEIPT.items() if key != "date"}),
+)
+CHARS_PER_TOKEN = 4
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    bandwidth = 0  # bytes/sec of simulated upload link; 0 means unlimited
+    throttle_rate = 0.0  # fraction of requests answered 429
+    error_rate = 0.0  # fraction of requests answered 503
+    malformed_rate = 0.0  # fraction of image requests answered with one of MALFORMED_REPLIES
+    token_delay = 0.0  # seconds to generate each token of the reply
+    retry_after = 1
+    content = "```json\n" + json.dumps(CANNED_RECEIPT) + "\n```" + NOTE
+
+    def do_POST(self):
+        size = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(size)
+        time.sleep(self.latency + (size / self.bandwidth if self.bandwidth else 0))
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = {}
+        messages = request.get("messages") or [{}]
+        text_only = isinstance(messages[-1].get("content"), str)
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return self._reply(429, {"error": {"message": "Rate limit reached"}},
+                               {"Retry-After": str(self.retry_after)})
+        if roll < self.throttle_rate + self.error_rate:
+            return self._reply(503, {"error": {"message": "Service unavailable"}})
+
+        if text_only:
+            content = json.dumps(CANNED_RECEIPT)
+        elif random.random() < self.malformed_rate:
+            content = random.choice(MALFORMED_REPLIES)
+        else:
+            content = self.content
+        tokens = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+        if request.get("stream"):
+            return self._stream(tokens)
+        time.sleep(self.token_delay * len(tokens))
+        self._reply(200, {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]
+        })
+
+    def _stream(self, tokens):
+        # Server-sent events, one token per event, until [DONE] or the client hangs up.
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(self.token_delay)
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_llm(host="127.0.0.1", port=0, latency=0.0, bandwidth=0, throttle_rate=0.0,
+                   error_rate=0.0, retry_after=1, malformed_rate=0.0, token_delay=0.0):
+    """Starts the fake endpoint in a daemon thread and returns (server, endpoint_url)."""
+    handler = type("Handler", (FakeLLMHandler,), {
+        "latency": latency, "bandwidth": bandwidth, "throttle_rate": throttle_rate,
+        "error_rate": error_rate, "retry_after": retry_after, "malformed_rate": malformed_rate,
+        "token_delay": token_delay,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/openai/v1/chat/completions"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--bandwidth", type=int, default=0, help="simulated upload bytes/sec (0 = unlimited)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="fraction of image requests answered with a malformed reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds to generate each reply token")
+    args = parser.parse_args()
+
+    server, endpoint = start_fake_llm(args.host, args.port, args.latency, args.bandwidth,
+                                      args.throttle_rate, args.error_rate, args.retry_after,
+                                      args.malformed_rate, args.token_delay)
+    print(f"Fake LLM listening on {endpoint}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
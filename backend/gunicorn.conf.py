@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import time
+
+# Production serving: `gunicorn -c gunicorn.conf.py app:app` from backend/.
+#
+# The master creates / migrates the schema once before forking. Each worker
+# then resumes any receipt jobs the last shutdown left behind (every job is
+# claimed by exactly one worker). On SIGTERM, workers finish in-flight
+# requests and running receipt jobs within graceful_timeout.
+#
+# Slow receipt traffic can get its own pool of gevent workers, where a worker
+# parked on the LLM costs a greenlet, not a process. Route /api/upload_* to it
+# from the reverse proxy (see README):
+#
+#   gunicorn -c gunicorn.conf.py app:app                                           # API, sync threads
+#   WORKER_CLASS=gevent BIND=127.0.0.1:5001 gunicorn -c gunicorn.conf.py app:app   # uploads
+worker_class = os.getenv("WORKER_CLASS", "gthread")
+if worker_class == "gevent":
+    # Patch before the master imports requests / ssl, or gevent warns and sockets stay blocking.
+    from gevent import monkey
+
+    monkey.patch_all()
+
+bind = os.getenv("BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Every worker, and the upload pool, writes expenses, so one worker's in-memory
+# response cache would serve stale data; keep the cache versions in the database.
+# Read when app is imported in on_starting, so set it before that.
+os.environ.setdefault("RESPONSE_CACHE_SHARED", "1")
+threads = int(os.getenv("WEB_THREADS", "4"))  # gthread only
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "200"))  # gevent only
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))  # batch uploads wait on the LLM
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))  # recycle workers to bound memory growth
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("ACCESS_LOG", "-")
+
+
+def on_starting(server):
+    # Shared by every worker (and by a second pool given the same value) so
+    # resume_pending() can tell abandoned jobs from ones a live worker owns.
+    os.environ.setdefault("SERVER_STARTED_AT", str(time.time()))
+    import app
+    import db_handler
+
+    app.init_schema()
+    db_handler.close_connections()  # database connections must not cross fork()
+
+
+def post_worker_init(worker):
+    import app
+
+    resumed = app.init_worker()
+    if resumed:
+        worker.log.info("Resumed %d receipt jobs", resumed)
+
+
+def worker_exit(server, worker):
+    import app
+
+    app.shutdown_worker()
@@ -0,0 +1,118 @@
+import functools
+import os
+import time
+
+from flask import current_app, jsonify, request
+
+import auth
+import db_handler
+
+# Idempotency keys for the write endpoints, so a client can safely retry an
+# add or upload whose response it never saw.
+#
+# A request carrying an "Idempotency-Key" header first claims (username,
+# endpoint, key) with an INSERT. The first request with a given key runs and
+# its response is stored. Retries get that stored response back, marked with
+# "Idempotent-Replayed: true", without running the view again. A retry that
+# arrives while the first request is still running gets a 409. Responses with
+# a 5xx status are not kept, so the client can retry those. Keys expire after
+# IDEMPOTENCY_TTL seconds.
+#
+# A claim whose request never finished (the worker was killed or timed out) is
+# only held for IDEMPOTENCY_LEASE seconds; after that the next retry takes it
+# over and runs the view. Keep the lease above the worker timeout.
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE", "300"))
+
+
+def init_idempotency():
+    # Creates the idempotency key table if it doesn't exist.
+    with db_handler.get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                username TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status INTEGER,
+                body BLOB,
+                mimetype TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (username, endpoint, key)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)")
+
+
+def purge_expired():
+    """Deletes keys older than TTL_SECONDS; returns how many."""
+    with db_handler.get_connection() as conn:
+        return conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?",
+                            (time.time() - TTL_SECONDS,)).rowcount
+
+
+def _claim(username, endpoint, key):
+    # Returns (claimed_at, None) if this request now owns the key, else (None, stored (status, body, mimetype)).
+    now = time.time()
+    with db_handler.get_connection() as conn:
+        conn.execute("DELETE FROM idempotency_keys WHERE username = ? AND endpoint = ? AND key = ? AND created_at < ?",
+                     (username, endpoint, key, now - TTL_SECONDS))
+        claimed = conn.execute("INSERT INTO idempotency_keys (username, endpoint, key, created_at) "
+                               "VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING", (username, endpoint, key, now)).rowcount
+        if not claimed:
+            # Take over a claim whose request died; one UPDATE, so only one retry wins it.
+            claimed = conn.execute("UPDATE idempotency_keys SET created_at = ? WHERE username = ? AND endpoint = ? "
+                                   "AND key = ? AND status IS NULL AND created_at < ?",
+                                   (now, username, endpoint, key, now - LEASE_SECONDS)).rowcount
+        if claimed:
+            return now, None
+        return None, conn.execute("SELECT status, body, mimetype FROM idempotency_keys "
+                                  "WHERE username = ? AND endpoint = ? AND key = ?", (username, endpoint, key)).fetchone()
+
+
+def _finish(username, endpoint, key, claimed_at, response):
+    # Only while the claim is still ours: after a takeover the new owner's outcome stands.
+    with db_handler.get_connection() as conn:
+        if response.status_code >= 500:
+            conn.execute("DELETE FROM idempotency_keys WHERE username = ? AND endpoint = ? AND key = ? "
+                         "AND created_at = ? AND status IS NULL", (username, endpoint, key, claimed_at))
+        else:
+            conn.execute("UPDATE idempotency_keys SET status = ?, body = ?, mimetype = ? "
+                         "WHERE username = ? AND endpoint = ? AND key = ? AND created_at = ? AND status IS NULL",
+                         (response.status_code, response.get_data(), response.mimetype, username, endpoint, key,
+                          claimed_at))
+
+
+def idempotent(view):
+    """Replays the stored response when a request repeats an Idempotency-Key (per user and endpoint)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        username = auth.current_user()
+        if not key or not username:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"success": False, "message": f"{HEADER} is longer than {MAX_KEY_LENGTH} characters."}), 400
+
+        try:
+            claimed_at, stored = _claim(username, request.endpoint, key)
+        except db_handler.DatabaseError as e:
+            return jsonify({"success": False, "message": f"Database Error: {str(e)}"}), 500
+        if stored is not None:
+            status, body, mimetype = stored
+            if status is None:
+                return jsonify({"success": False, "message": "A request with this Idempotency-Key is still "
+                                "in progress."}), 409
+            response = current_app.response_class(body, status=status, mimetype=mimetype)
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            _finish(username, request.endpoint, key, claimed_at, current_app.response_class(status=500))
+            raise
+        _finish(username, request.endpoint, key, claimed_at, response)
+        return response
+    return wrapper
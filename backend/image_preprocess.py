@@ -0,0 +1,88 @@
+import io
+import os
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are sent as uploaded
+    Image = None
+
+# Shrinks receipt photos before they are base64-encoded into the LLM payload:
+# downscale, grayscale, re-encode compactly and drop EXIF. Receipts are
+# high-contrast text, so none of this costs the model accuracy. Photos
+# compress best lossy, while scanned/screenshot receipts with flat backgrounds
+# are smaller as lossless grayscale PNG, so both are tried and the smaller wins.
+MAX_DIMENSION = int(os.getenv("RECEIPT_MAX_DIMENSION", "1600"))
+GRAYSCALE = os.getenv("RECEIPT_GRAYSCALE", "1") != "0"
+OUTPUT_FORMAT = os.getenv("RECEIPT_FORMAT", "JPEG").upper()  # JPEG or WEBP
+QUALITY = int(os.getenv("RECEIPT_QUALITY", "80"))
+ENABLED = os.getenv("RECEIPT_PREPROCESS", "1") != "0"
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png", "GIF": "image/gif"}
+
+_stats_lock = threading.Lock()
+_stats = {"images": 0, "bytes_in": 0, "bytes_out": 0, "skipped": 0}
+
+
+def sniff_mime_type(image_data):
+    """Guesses an image's MIME type from its magic bytes (defaults to image/jpeg)."""
+    if image_data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if image_data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    if image_data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/jpeg"
+
+
+def _record(bytes_in, bytes_out, skipped=False):
+    with _stats_lock:
+        _stats["images"] += 1
+        _stats["bytes_in"] += bytes_in
+        _stats["bytes_out"] += bytes_out
+        _stats["skipped"] += int(skipped)
+
+
+def preprocess(image_data):
+    """Returns (image_bytes, mime_type) ready for the extractor.
+
+    Falls back to the original bytes when Pillow is unavailable, the image
+    can't be decoded, or re-encoding wouldn't make it smaller.
+    """
+    original = (image_data, sniff_mime_type(image_data))
+    if not ENABLED or Image is None:
+        _record(len(image_data), len(image_data), skipped=True)
+        return original
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image = ImageOps.exif_transpose(image)  # bake in rotation before EXIF is dropped
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+            image = image.convert("L" if GRAYSCALE else "RGB")
+            candidates = []
+            for fmt in (OUTPUT_FORMAT, "PNG"):
+                buffer = io.BytesIO()
+                image.save(buffer, format=fmt, quality=QUALITY, optimize=True)
+                candidates.append((len(buffer.getvalue()), buffer.getvalue(), fmt))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        _record(len(image_data), len(image_data), skipped=True)
+        return original
+
+    size, processed, fmt = min(candidates, key=lambda candidate: candidate[0])
+    if size >= len(image_data):
+        _record(len(image_data), len(image_data), skipped=True)
+        return original
+
+    _record(len(image_data), size)
+    return processed, MIME_TYPES[fmt]
+
+
+def stats():
+    """Counters of images processed and payload bytes saved in this process."""
+    with _stats_lock:
+        counters = dict(_stats)
+    counters["bytes_saved"] = counters["bytes_in"] - counters["bytes_out"]
+    counters["enabled"] = ENABLED and Image is not None
+    return counters
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db_handler
+import duplicates
+import receipt_pipeline
+import response_cache
+
+# Receipt uploads are persisted as rows in the jobs table and processed by a
+# small local thread pool, so the request thread returns as soon as the image
+# is stored. Jobs left unfinished by a restart are picked up again by resume_pending().
+MAX_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_jobs():
+    # Creates the jobs table if it doesn't exist.
+    with db_handler.get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                status TEXT NOT NULL,
+                image BLOB,
+                bypass_cache INTEGER NOT NULL DEFAULT 0,
+                on_duplicate TEXT NOT NULL DEFAULT 'reject',
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if "on_duplicate" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN on_duplicate TEXT NOT NULL DEFAULT 'reject'")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+
+def _get_executor():
+    # Concurrent first uploads must all get the same pool.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="receipt-job")
+        return _executor
+
+
+def _update(job_id, status, result=None, error=None, clear_image=False):
+    with db_handler.get_connection() as conn:
+        conn.execute(
+            f"UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?"
+            f"{', image = NULL' if clear_image else ''} WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+
+def process_receipt(username, image_data, bypass_cache=False, on_stage=None,
+                    on_duplicate=duplicates.RECEIPT_POLICY):
+    """Extracts a receipt (via the cache when possible) and records it as an expense.
+
+    Returns a result dict in the db_handler style: {"success": ..., "message": ...}.
+    `on_stage` is called with "extracting" and "saving" as work progresses.
+    Under the "reject" policy, the same receipt file the user already uploaded
+    is refused before any extraction work.
+    """
+    fingerprint = duplicates.receipt_hash(image_data)
+    if on_duplicate == "reject":
+        existing = duplicates.existing_receipts(username, [fingerprint]).get(fingerprint)
+        if existing is not None:
+            return {"success": False, "message": f"This receipt was already uploaded as expense {existing}.",
+                    "duplicate": True, "duplicate_of": existing}
+
+    if on_stage:
+        on_stage("extracting")
+    extracted = receipt_pipeline.extract(image_data, bypass_cache)
+    if not extracted["success"]:
+        return extracted
+
+    if on_stage:
+        on_stage("saving")
+    details = extracted["details"]
+    result = db_handler.add_expense(
+        username=username,
+        name=details["name"],
+        amount=details["amount"],
+        category=details["category"],
+        date=details["date"],
+        receipt_hash=fingerprint,
+        on_duplicate=duplicates.field_policy(on_duplicate),
+        receipt_phash=duplicates.perceptual_hash(image_data),
+    )
+    if result["success"]:
+        response_cache.invalidate(username, "expenses")
+    result["cached"] = extracted["cached"]
+    result["expense"] = details
+    return result
+
+
+def _run(job_id):
+    with db_handler.get_connection() as conn:
+        row = conn.execute("SELECT username, image, bypass_cache, on_duplicate FROM jobs WHERE id = ?",
+                           (job_id,)).fetchone()
+    if not row or row[1] is None:
+        return
+
+    try:
+        result = process_receipt(row[0], row[1], bool(row[2]),
+                                 on_stage=lambda stage: _update(job_id, stage), on_duplicate=row[3])
+    except Exception as e:
+        _update(job_id, "failed", error=f"Unexpected Error: {str(e)}", clear_image=True)
+        return
+
+    if result.get("success"):
+        _update(job_id, "done", result=result, clear_image=True)
+    else:
+        _update(job_id, "failed", result=result, error=result.get("message"), clear_image=True)
+
+
+def submit_receipt(username, image_data, bypass_cache=False, on_duplicate=duplicates.RECEIPT_POLICY):
+    """Queues a receipt image for background extraction and returns its job id."""
+    if on_duplicate not in db_handler.DUPLICATE_POLICIES:
+        return {"success": False, "message": f"Invalid on_duplicate. Use one of: "
+                f"{', '.join(db_handler.DUPLICATE_POLICIES)}."}
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        with db_handler.get_connection() as conn:
+            conn.execute("INSERT INTO jobs (id, username, status, image, bypass_cache, on_duplicate, created_at, "
+                         "updated_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                         (job_id, username, image_data, int(bypass_cache), on_duplicate, now, now))
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+    _get_executor().submit(_run, job_id)
+    return {"success": True, "message": "Receipt queued for processing.", "job_id": job_id, "status": "queued"}
+
+
+def get_job(job_id, username):
+    """Reports the status (and result, once finished) of one of a user's jobs."""
+    try:
+        with db_handler.get_connection() as conn:
+            row = conn.execute("SELECT status, result, error, created_at, updated_at FROM jobs "
+                               "WHERE id = ? AND username = ?", (job_id, username)).fetchone()
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+    if not row:
+        return {"success": False, "message": "Job not found."}
+
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": row[0],
+        "result": json.loads(row[1]) if row[1] else None,
+        "error": row[2],
+        "created_at": row[3],
+        "updated_at": row[4],
+    }
+
+
+def resume_pending(started_at=None):
+    """Re-queues jobs that were still pending when the server last stopped.
+
+    Only jobs untouched since `started_at` (default: now) count as abandoned,
+    and each is claimed with an atomic UPDATE, so when several workers start
+    together every leftover job is resumed by exactly one of them.
+    """
+    started_at = started_at or time.time()
+    with db_handler.get_connection() as conn:
+        job_ids = [row[0] for row in conn.execute(
+            "UPDATE jobs SET updated_at = ? WHERE status IN ('queued', 'extracting', 'saving') "
+            "AND image IS NOT NULL AND updated_at < ? RETURNING id", (time.time(), started_at)).fetchall()]
+    for job_id in job_ids:
+        _get_executor().submit(_run, job_id)
+    return len(job_ids)
+
+
+def shutdown(wait=True):
+    """Stops accepting work and, by default, waits for running jobs to finish.
+
+    Jobs that haven't started are dropped from the pool but stay queued in
+    the jobs table for resume_pending() on the next start.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,244 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Shared HTTP client for the vision-LLM endpoint used by both extractors:
+# one pooled keep-alive session for plain or streamed (server-sent events)
+# completions, connect/read timeouts, retries with exponential backoff and
+# jitter on throttling and server errors, a circuit breaker that fails fast
+# while the upstream is down, and a concurrency / rate limiter so bursts of
+# uploads stay within the provider's limits.
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 = no client-side cap
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMClientError(Exception):
+    """The LLM endpoint could not produce a usable response."""
+
+    def __init__(self, message, status_code=None, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class CircuitOpenError(LLMClientError):
+    """Calls are short-circuited because the endpoint kept failing."""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial call through after `reset_seconds`."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._failures >= self.threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+
+class RateLimiter:
+    """Caps concurrent calls and (optionally) call starts per minute.
+
+    A 429 from the server pauses every caller until its Retry-After has passed.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE):
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def pause_until(self, deadline):
+        with self._lock:
+            self._next_start = max(self._next_start, deadline)
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = max(self._next_start, start + self._interval)
+        if start > now:
+            time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: uniform in [0, min(max, base * 2**attempt)]."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class LLMClient:
+    def __init__(self, max_retries=MAX_RETRIES, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 limiter=None, breaker=None):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(MAX_CONCURRENCY, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @contextmanager
+    def _response(self, url, payload, headers=None, stream=False):
+        """POSTs `payload` and yields the 200 response, holding a limiter slot until the block exits.
+
+        Raises LLMClientError once retries are exhausted or on a non-retryable
+        status, and CircuitOpenError without calling out while the breaker is open.
+        """
+        body = json.dumps(payload).encode()
+        headers = {**(headers or {}), "Content-Type": "application/json"}
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("LLM endpoint unavailable (circuit open)")
+
+            with self.limiter:
+                start = time.perf_counter()
+                metrics.LLM_BYTES.inc("sent", amount=len(body))
+                try:
+                    response = self.session.post(url, headers=headers, data=body, timeout=self.timeout, stream=stream)
+                except requests.RequestException as e:
+                    metrics.LLM_DURATION.observe(time.perf_counter() - start, e.__class__.__name__)
+                    self.breaker.record_failure()
+                    error = LLMClientError(f"LLM request failed: {e.__class__.__name__}", details=str(e))
+                    delay = backoff_delay(attempt)
+                    response = None
+
+                if response is not None:
+                    # For streamed responses this is the time to the first byte.
+                    metrics.LLM_DURATION.observe(time.perf_counter() - start, str(response.status_code))
+                    if response.status_code == 200:
+                        self.breaker.record_success()
+                        with response:
+                            yield response
+                        return
+
+                    metrics.LLM_BYTES.inc("received", amount=len(response.content))
+                    error = LLMClientError(f"Groq API error (status {response.status_code})",
+                                           response.status_code, response.text)
+                    if response.status_code not in RETRY_STATUSES:
+                        self.breaker.record_success()  # the endpoint is up, the request was rejected
+                        raise error
+
+                    retry_after = _retry_after(response)
+                    delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                    if response.status_code == 429:
+                        self.breaker.record_success()  # throttled, not broken
+                        self.limiter.pause_until(time.monotonic() + delay)
+                    else:
+                        self.breaker.record_failure()
+
+            if attempt < self.max_retries:
+                time.sleep(delay)
+
+        raise error
+
+    def post_json(self, url, payload, headers=None):
+        """POSTs `payload` and returns the decoded JSON body of a 200 response (errors as in _response)."""
+        with self._response(url, payload, headers) as response:
+            metrics.LLM_BYTES.inc("received", amount=len(response.content))
+            try:
+                return response.json()
+            except ValueError:
+                raise LLMClientError("LLM returned invalid JSON", 200, response.text)
+
+    def stream_chat(self, url, payload, headers=None):
+        """Requests a streamed chat completion and yields its content pieces as they arrive.
+
+        Retries cover the request up to the response headers; a stream that
+        breaks off later raises LLMClientError. Closing the generator early
+        closes the connection, which stops the generation upstream.
+        """
+        with self._response(url, {**payload, "stream": True}, headers, stream=True) as response:
+            try:
+                for line in response.iter_lines():
+                    metrics.LLM_BYTES.inc("received", amount=len(line))
+                    if not line.startswith(b"data:"):
+                        continue  # blank separators and SSE comments
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        return
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        raise LLMClientError("LLM stream carried invalid JSON", 200, data.decode(errors="replace"))
+                    for choice in chunk.get("choices") or ():
+                        content = (choice.get("delta") or {}).get("content")
+                        if content:
+                            yield content
+            except requests.RequestException as e:
+                raise LLMClientError(f"LLM stream broke off: {e.__class__.__name__}", 200, str(e))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide client shared by every extractor."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
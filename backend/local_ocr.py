@@ -0,0 +1,164 @@
+import functools
+import io
+import os
+import re
+from datetime import datetime
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # the OCR tier is optional; without it every receipt goes to the LLM
+    pytesseract = None
+
+from OCRLLM import expense_categories
+
+# First extraction tier: local OCR plus heuristics for the total, date,
+# merchant and category. Clean printed receipts are answered here in well
+# under a second; anything the parser isn't confident about escalates to the LLM.
+ENABLED = os.getenv("RECEIPT_LOCAL_OCR", "1") != "0"
+CONFIDENCE_THRESHOLD = float(os.getenv("RECEIPT_OCR_CONFIDENCE", "0.85"))
+
+# Keywords that map receipt text onto expense_categories (matched on word
+# boundaries against the lower-cased OCR text).
+CATEGORY_KEYWORDS = {
+    "Groceries": ["grocery", "groceries", "supermarket", "produce", "aldi", "walmart", "kroger", "safeway",
+                  "trader joe", "whole foods", "costco", "publix", "wegmans", "lidl", "food lion", "deli"],
+    "Dining & Restaurants": ["restaurant", "mcdonald", "burger", "pizza", "grill", "diner", "take-out",
+                             "takeout", "dine in", "server", "table", "chipotle", "subway", "taco", "wendy"],
+    "Food & Beverage": ["coffee", "cafe", "starbucks", "bakery", "espresso", "latte", "tea", "juice"],
+    "Transportation": ["fuel", "gasoline", "unleaded", "diesel", "shell", "chevron", "exxon", "parking",
+                       "uber", "lyft", "transit", "toll"],
+    "Healthcare": ["pharmacy", "rx", "cvs", "walgreens", "clinic", "medical", "dental", "prescription"],
+    "Utilities": ["electric", "utility", "water bill", "internet", "comcast", "verizon"],
+    "Entertainment": ["cinema", "movie", "theater", "theatre", "tickets", "concert", "amc"],
+    "Travel": ["hotel", "inn", "airline", "airport", "airbnb", "flight", "resort"],
+    "Personal Care": ["salon", "barber", "spa", "cosmetics", "sephora", "ulta"],
+    "Pets": ["petco", "petsmart", "veterinary", "pet food"],
+    "Household Maintenance & Repairs": ["hardware", "home depot", "lowe's", "ace hardware", "plumbing"],
+    "Education": ["bookstore", "tuition", "textbook"],
+    "Gifts & Donations": ["donation", "florist", "gift shop"],
+}
+CATEGORY_PATTERNS = {
+    category: re.compile(r"\b(" + "|".join(re.escape(word) for word in words) + r")\b")
+    for category, words in CATEGORY_KEYWORDS.items()
+    if category in expense_categories
+}
+
+MONEY = re.compile(r"\$?\s*(\d{1,3}(?:,\d{3})+|\d+)\.(\d{2})(?!\d)")
+# "T O T A L" is how many printers emphasise the total; collapse the spacing.
+TOTAL_LINE = re.compile(r"(grand\s*total|(?<!sub)(?<!sub )t\s?o\s?t\s?a\s?l|amount\s+due|balance\s+due)", re.I)
+DATE_PATTERNS = (
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b"), "%m/%d/%Y"),
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{2})\b"), "%m/%d/%y"),
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), "%Y-%m-%d"),
+    (re.compile(r"\b(\d{1,2})-(\d{1,2})-(\d{4})\b"), "%m-%d-%Y"),
+    (re.compile(r"\b(\d{1,2})-(\d{1,2})-(\d{2})\b"), "%m-%d-%y"),
+)
+MERCHANT_SUFFIX = re.compile(r"\b(restaurant|store|market|supermarket|cafe|pharmacy|shop|inc|llc|co\.)\b", re.I)
+BOILERPLATE = re.compile(r"(thank|welcome|survey|feedback|receipt|www\.|http|tel|phone|visit|rate us|cashier)", re.I)
+
+
+@functools.lru_cache(maxsize=1)
+def _tesseract_installed():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except (OSError, pytesseract.TesseractNotFoundError):
+        return False
+
+
+def available():
+    """True when the OCR tier is enabled and both pytesseract and the tesseract binary are present."""
+    return ENABLED and pytesseract is not None and _tesseract_installed()
+
+
+def ocr_text(image_data):
+    """Runs Tesseract over the image and returns the recognised text."""
+    with Image.open(io.BytesIO(image_data)) as image:
+        return pytesseract.image_to_string(image.convert("L"))
+
+
+def _find_total(lines):
+    totals = []
+    for line in lines:
+        if TOTAL_LINE.search(line):
+            totals.extend(float(f"{whole.replace(',', '')}.{cents}") for whole, cents in MONEY.findall(line))
+    if totals:
+        return max(totals), True
+    amounts = [float(f"{whole.replace(',', '')}.{cents}") for line in lines for whole, cents in MONEY.findall(line)]
+    return (max(amounts), False) if amounts else (None, False)
+
+
+def _find_date(text):
+    for pattern, fmt in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                return datetime.strptime(match.group(0), fmt).strftime("%m/%d/%y")
+            except ValueError:
+                continue
+    return None
+
+
+def _find_merchant(lines):
+    for line in lines[:15]:
+        if MERCHANT_SUFFIX.search(line) and not BOILERPLATE.search(line):
+            name = re.sub(r"\s*#\s*\d+.*$", "", line).strip()
+            if not MERCHANT_SUFFIX.fullmatch(name):  # a bare "Store #42" names nothing
+                return name, True
+    for line in lines[:5]:
+        letters = sum(ch.isalpha() for ch in line)
+        if letters >= 3 and letters >= len(line.replace(" ", "")) * 0.7 and not BOILERPLATE.search(line):
+            return line.strip(), False
+    return None, False
+
+
+def _find_category(text):
+    lowered = text.lower()
+    scores = {category: len(pattern.findall(lowered)) for category, pattern in CATEGORY_PATTERNS.items()}
+    best = max(scores, key=scores.get) if scores else None
+    if best and scores[best]:
+        return best, True
+    return "Miscellaneous", False
+
+
+def guess_category(text):
+    """Maps free text (a receipt, or a statement description) onto one of expense_categories."""
+    return _find_category(text)[0]
+
+
+def match_category(text):
+    """The category whose keywords appear in `text`, or None when none do."""
+    category, matched = _find_category(text)
+    return category if matched else None
+
+
+def parse_receipt_text(text):
+    """Heuristically extracts {amount, category, date, name} from OCR text.
+
+    Returns (details, confidence) where confidence is in [0, 1].
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    amount, amount_from_total = _find_total(lines)
+    date = _find_date(text)
+    name, strong_merchant = _find_merchant(lines)
+    category, category_matched = _find_category(text)
+
+    confidence = 0.0
+    confidence += 0.45 if amount_from_total else (0.15 if amount is not None else 0)
+    confidence += 0.25 if date else 0
+    confidence += 0.15 if strong_merchant else (0.05 if name else 0)
+    confidence += 0.15 if category_matched else 0
+
+    details = {"amount": amount, "category": category, "date": date, "name": name}
+    return details, round(confidence, 2)
+
+
+def extract(image_data):
+    """OCRs and parses a receipt. Returns (details, confidence), or (None, 0.0) if OCR is unavailable or fails."""
+    if not available():
+        return None, 0.0
+    try:
+        text = ocr_text(image_data)
+    except (OSError, RuntimeError, pytesseract.TesseractError):
+        return None, 0.0
+    return parse_receipt_text(text)
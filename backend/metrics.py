@@ -0,0 +1,148 @@
+import bisect
+import os
+import threading
+import time
+
+# Minimal Prometheus instrumentation: counters and histograms with labels,
+# rendered in the text exposition format on /metrics. Kept dependency-free
+# so every module (db_handler included) can record into it cheaply.
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_registry = []
+_stats_sources = []
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def register_stats(prefix, source):
+    """Exposes a stats() dict (e.g. receipt_cache.stats) as gauges named <prefix>_<key> at scrape time."""
+    _stats_sources.append((prefix, source))
+
+
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Flask request latency.",
+                          ("endpoint", "method", "status"))
+HTTP_SQL_QUERIES = Histogram("http_request_sql_queries", "SQL statements executed per request.",
+                             ("endpoint",), COUNT_BUCKETS)
+SQL_DURATION = Histogram("sql_statement_duration_seconds", "SQL statement execute() time.",
+                         ("statement",), SQL_BUCKETS)
+LLM_DURATION = Histogram("llm_request_duration_seconds", "Vision-LLM HTTP call latency per attempt.",
+                         ("status",), LLM_BUCKETS)
+LLM_BYTES = Counter("llm_bytes_total", "Bytes sent to and received from the vision-LLM endpoint.",
+                    ("direction",))
+
+
+def observe_sql(statement, seconds):
+    """Records one SQL statement; also counts it against the current request, if any."""
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "EMPTY"
+    SQL_DURATION.observe(seconds, keyword)
+    _local.sql_queries = getattr(_local, "sql_queries", 0) + 1
+
+
+def render():
+    """The whole registry in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for prefix, source in _stats_sources:
+        for key, value in source().items():
+            if isinstance(value, (bool, int, float)):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """Times every request into HTTP_DURATION / HTTP_SQL_QUERIES.
+
+    Streamed responses (exports) are timed until their headers are ready.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        _local.sql_queries = 0
+
+    @app.after_request
+    def _record(response):
+        started = g.get("metrics_started")
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            HTTP_DURATION.observe(time.perf_counter() - started, endpoint, request.method,
+                                  str(response.status_code))
+            HTTP_SQL_QUERIES.observe(getattr(_local, "sql_queries", 0), endpoint)
+        return response
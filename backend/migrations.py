@@ -0,0 +1,247 @@
+import secrets
+from datetime import datetime
+
+import auth
+import budgets
+import db_handler
+import idempotency
+import jobs
+import receipt_cache
+import response_cache
+import search
+
+# Versioned schema migrations.
+#
+# MIGRATIONS lists every schema change in order, each as one step per
+# dialect. migrate() applies the ones a database hasn't had yet and records
+# each in schema_migrations, so every database converges on the same version
+# whichever version it started at.
+#
+# Migration 1 is the schema as it stood when versioning began. On SQLite it
+# is the per-module init functions, which also upgrade databases created
+# before it; on PostgreSQL it is POSTGRES_BASELINE below. Later changes get a
+# new entry here rather than an edit to an earlier one.
+#
+# On PostgreSQL each migration runs in one transaction (DDL included) under an
+# advisory lock, so two servers starting together can't both apply it. On
+# SQLite the init functions commit as they go and are idempotent, so a rerun
+# after a crash finishes the job.
+SCHEMA_MIGRATIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+'''
+
+# expenses is range-partitioned on date_iso by month: expenses_2025_03 holds
+# '2025-03-01'..'2025-03-31' and expenses_undated the '' rows. Month partitions
+# are created on demand (db_handler.ensure_partitions). A partitioned table's
+# primary key must contain the partition key, hence (id, date_iso); ids still
+# come from one identity sequence. ISO dates and months use the "C" collation
+# so they compare bytewise, as in SQLite.
+POSTGRES_BASELINE = '''
+CREATE TABLE users (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE expenses (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    amount DOUBLE PRECISION NOT NULL,
+    category TEXT NOT NULL,
+    date TEXT NOT NULL,
+    date_iso TEXT COLLATE "C" NOT NULL DEFAULT '',
+    receipt_hash TEXT,
+    duplicate_of BIGINT,
+    PRIMARY KEY (id, date_iso)
+) PARTITION BY RANGE (date_iso);
+CREATE TABLE expenses_undated PARTITION OF expenses FOR VALUES FROM (MINVALUE) TO ('0');
+CREATE INDEX idx_expenses_user_date ON expenses(username, date_iso);
+CREATE INDEX idx_expenses_user_amount ON expenses(username, amount);
+CREATE INDEX idx_expenses_duplicate ON expenses(username, {merchant_key}, date_iso);
+CREATE INDEX idx_expenses_receipt ON expenses(username, receipt_hash) WHERE receipt_hash IS NOT NULL;
+CREATE INDEX idx_expenses_name_fts ON expenses USING GIN (to_tsvector('simple', name));
+
+CREATE TABLE thresholds (
+    username TEXT PRIMARY KEY REFERENCES users(username) ON DELETE CASCADE,
+    amount DOUBLE PRECISION NOT NULL
+);
+
+CREATE TABLE monthly_totals (
+    username TEXT NOT NULL,
+    month TEXT COLLATE "C" NOT NULL,
+    category TEXT NOT NULL,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, month, category)
+);
+
+CREATE TABLE merchant_totals (
+    username TEXT NOT NULL,
+    month TEXT COLLATE "C" NOT NULL,
+    name TEXT NOT NULL,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, month, name)
+);
+
+-- The rollup triggers of db_handler._rollup_triggers, as one row trigger.
+-- A row moved to another partition by an UPDATE arrives as a DELETE and an INSERT.
+CREATE FUNCTION expenses_rollups() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE monthly_totals SET total = total - OLD.amount, count = count - 1
+        WHERE username = OLD.username AND month = substr(OLD.date_iso, 1, 7) AND category = OLD.category;
+        DELETE FROM monthly_totals
+        WHERE username = OLD.username AND month = substr(OLD.date_iso, 1, 7) AND category = OLD.category
+          AND count <= 0;
+        UPDATE merchant_totals SET total = total - OLD.amount, count = count - 1
+        WHERE username = OLD.username AND month = substr(OLD.date_iso, 1, 7) AND name = OLD.name;
+        DELETE FROM merchant_totals
+        WHERE username = OLD.username AND month = substr(OLD.date_iso, 1, 7) AND name = OLD.name
+          AND count <= 0;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO monthly_totals (username, month, category, total, count)
+        VALUES (NEW.username, substr(NEW.date_iso, 1, 7), NEW.category, NEW.amount, 1)
+        ON CONFLICT (username, month, category) DO UPDATE
+        SET total = monthly_totals.total + excluded.total, count = monthly_totals.count + 1;
+        INSERT INTO merchant_totals (username, month, name, total, count)
+        VALUES (NEW.username, substr(NEW.date_iso, 1, 7), NEW.name, NEW.amount, 1)
+        ON CONFLICT (username, month, name) DO UPDATE
+        SET total = merchant_totals.total + excluded.total, count = merchant_totals.count + 1;
+    END IF;
+    RETURN NULL;
+END
+$$;
+CREATE TRIGGER expenses_rollups
+AFTER INSERT OR DELETE OR UPDATE OF username, amount, category, name, date_iso ON expenses
+FOR EACH ROW EXECUTE FUNCTION expenses_rollups();
+
+CREATE TABLE jobs (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    status TEXT NOT NULL,
+    image BYTEA,
+    bypass_cache INTEGER NOT NULL DEFAULT 0,
+    on_duplicate TEXT NOT NULL DEFAULT 'reject',
+    result TEXT,
+    error TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX idx_jobs_status ON jobs(status);
+
+CREATE TABLE receipt_cache (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at DOUBLE PRECISION NOT NULL,
+    last_used DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX idx_receipt_cache_last_used ON receipt_cache(last_used);
+
+CREATE TABLE budgets (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    amount DOUBLE PRECISION NOT NULL,
+    category TEXT,
+    period TEXT NOT NULL,
+    start_date TEXT COLLATE "C",
+    end_date TEXT COLLATE "C"
+);
+CREATE INDEX idx_budgets_username ON budgets(username);
+
+CREATE TABLE cache_versions (
+    username TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, scope)
+);
+
+CREATE TABLE auth_keys (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    secret TEXT NOT NULL
+);
+
+CREATE TABLE idempotency_keys (
+    username TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status INTEGER,
+    body BYTEA,
+    mimetype TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (username, endpoint, key)
+);
+CREATE INDEX idx_idempotency_created ON idempotency_keys(created_at);
+'''.format(merchant_key=db_handler.MERCHANT_KEY_SQL.format("name"))
+
+
+def _sqlite_baseline(conn):
+    # The init functions open their own connections.
+    db_handler.init_db()
+    jobs.init_jobs()
+    receipt_cache.init_cache()
+    budgets.init_budgets()
+    search.init_search()
+    response_cache.init_versions()
+    auth.init_auth()
+    idempotency.init_idempotency()
+
+
+def _postgres_baseline(conn):
+    conn.execute(POSTGRES_BASELINE)
+    conn.execute("INSERT INTO auth_keys (id, secret) VALUES (1, ?)", (secrets.token_hex(32),))
+
+
+def _receipt_phash(conn):
+    # receipt_hash held a perceptual hash that "reject" matched exactly, which
+    # refused distinct receipts that merely hashed alike. It is now the SHA-256
+    # of the file; perceptual hashes move to their own column and only flag.
+    conn.execute("ALTER TABLE expenses ADD COLUMN receipt_phash TEXT")
+    conn.execute("UPDATE expenses SET receipt_phash = receipt_hash, receipt_hash = NULL "
+                 "WHERE receipt_hash LIKE 'dhash:%'")
+
+
+# (version, name, {dialect: step(conn)})
+MIGRATIONS = [
+    (1, "baseline", {"sqlite": _sqlite_baseline, "postgresql": _postgres_baseline}),
+    (2, "receipt_phash", {"sqlite": _receipt_phash, "postgresql": _receipt_phash}),
+]
+
+
+def applied_versions():
+    """Versions already applied to the current database, oldest first."""
+    with db_handler.get_connection() as conn:
+        conn.execute(SCHEMA_MIGRATIONS_SQL)
+        return [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def migrate(target=None):
+    """Applies every pending migration up to `target` (default: all), in order; returns the versions applied."""
+    dialect = db_handler.dialect()
+    done = set(applied_versions())
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+        with db_handler.get_connection() as conn:
+            if dialect == "postgresql":
+                db_handler.backend().lock(conn, "schema_migrations")
+                if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+                    continue  # another server applied it while we waited for the lock
+            steps[dialect](conn)
+            conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?) "
+                         "ON CONFLICT (version) DO NOTHING",
+                         (version, name, datetime.now().isoformat(timespec="seconds")))
+        applied.append(version)
+    return applied
@@ -0,0 +1,143 @@
+import base64
+import functools
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Salted scrypt password hashes, computed on a dedicated thread pool.
+#
+# Hashes are stored as "scrypt$<log2 n>$<r>$<p>$<salt>$<hash>", so the cost
+# factor can be raised later: hashes made at an older cost still verify, and
+# needs_rehash() tells the sign-in path to upgrade them. Rows written before
+# passwords were hashed hold the plaintext; those verify once by constant-time
+# comparison and are rewritten on that sign-in (or all at once with
+# `flask hash-passwords`).
+#
+# scrypt releases the GIL while it runs. Capping it at WORKERS threads means a
+# burst of sign-ins queues here instead of taking every core away from the
+# request threads serving everything else, and past MAX_PENDING queued hashes
+# new ones fail fast with PoolBusy rather than piling up behind the burst.
+SCHEME = "scrypt"
+LOG2_N = int(os.getenv("PASSWORD_HASH_LOG2_N", "14"))  # n = 2**14, r = 8: 16 MiB and ~60 ms per hash
+BLOCK_SIZE = 8
+PARALLELISM = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+_stats_lock = threading.Lock()
+_stats = {"hashes": 0, "verifications": 0, "failures": 0, "busy": 0}
+
+
+class PoolBusy(Exception):
+    """More than MAX_PENDING hashes are already queued."""
+
+
+def _get_executor():
+    # Created on first use, so gunicorn's master never starts threads that a fork would lose.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="password-hash")
+        return _executor
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, log2_n, block_size, parallelism):
+    n = 1 << log2_n
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=block_size, p=parallelism,
+                          maxmem=256 * block_size * n * parallelism, dklen=HASH_BYTES)
+
+
+def _run(fn, *args):
+    # Runs fn on the hash pool and waits for it.
+    if not _pending.acquire(blocking=False):
+        _count("busy")
+        raise PoolBusy("Too many sign-ins in progress, try again shortly.")
+    try:
+        return _get_executor().submit(fn, *args).result()
+    finally:
+        _pending.release()
+
+
+def _hash(password):
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(password, salt, LOG2_N, BLOCK_SIZE, PARALLELISM)
+    return f"{SCHEME}${LOG2_N}${BLOCK_SIZE}${PARALLELISM}${_b64(salt)}${_b64(digest)}"
+
+
+def _verify(password, stored):
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    _, log2_n, block_size, parallelism, salt, digest = stored.split("$")
+    candidate = _scrypt(password, _unb64(salt), int(log2_n), int(block_size), int(parallelism))
+    return hmac.compare_digest(candidate, _unb64(digest))
+
+
+def is_hashed(stored):
+    return stored.startswith(SCHEME + "$")
+
+
+def hash_password(password):
+    """Returns a new salted hash of `password` at the current cost. Raises PoolBusy."""
+    _count("hashes")
+    return _run(_hash, password)
+
+
+def hash_passwords(passwords):
+    """Hashes many passwords across the whole pool (for bulk migration); returns them in order."""
+    return list(_get_executor().map(_hash, passwords))
+
+
+@functools.lru_cache(maxsize=1)
+def _dummy_hash():
+    return _hash(secrets.token_hex(16))
+
+
+def verify_password(password, stored):
+    """True if `password` matches `stored` (a hash, or a legacy plaintext value). Raises PoolBusy.
+
+    Pass stored=None for an unknown user: a dummy hash is checked anyway, so
+    "no such user" takes as long as "wrong password".
+    """
+    _count("verifications")
+    if stored is None:
+        _run(_verify, password, _dummy_hash())
+        ok = False
+    else:
+        ok = _run(_verify, password, stored)
+    if not ok:
+        _count("failures")
+    return ok
+
+
+def needs_rehash(stored):
+    """True for legacy plaintext values and hashes made at a different cost than the current one."""
+    return not stored.startswith(f"{SCHEME}${LOG2_N}${BLOCK_SIZE}${PARALLELISM}$")
+
+
+def stats():
+    with _stats_lock:
+        counters = dict(_stats)
+    counters["log2_n"] = LOG2_N
+    counters["workers"] = WORKERS
+    return counters
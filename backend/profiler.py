@@ -0,0 +1,87 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Opt-in sampling profiler for slow requests. With PROFILE_SLOW_MS set, one
+# background thread samples the stack of every in-flight request thread each
+# PROFILE_INTERVAL_MS. When a request finishes slower than the threshold its
+# samples are written to PROFILE_DIR in folded-stack format ("a;b;c count"
+# per line), which flamegraph.pl, speedscope and inferno render directly.
+# Fast requests just drop their samples, so the steady-state cost is one
+# sys._current_frames() call per interval.
+SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # 0 = profiler off
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_lock = threading.Lock()
+_active = {}  # thread id -> Counter of folded stacks
+_sampler = None
+
+
+def _folded(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_forever():
+    while True:
+        time.sleep(INTERVAL)
+        frames = sys._current_frames()
+        with _lock:
+            for thread_id, samples in _active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_folded(frame)] += 1
+
+
+def start_request():
+    """Starts collecting samples for the calling thread."""
+    global _sampler
+    with _lock:
+        _active[threading.get_ident()] = Counter()
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_forever, name="request-profiler", daemon=True)
+            _sampler.start()
+
+
+def finish_request(label, elapsed_ms):
+    """Stops sampling the calling thread; dumps its samples if the request was slow. Returns the file path."""
+    with _lock:
+        samples = _active.pop(threading.get_ident(), None)
+    if not samples or elapsed_ms < SLOW_MS:
+        return None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]", "_", label)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{int(elapsed_ms)}ms.folded")
+    with open(path, "w") as out:
+        for stack, count in samples.most_common():
+            out.write(f"{stack} {count}\n")
+    return path
+
+
+def init_app(app):
+    """Profiles every request when PROFILE_SLOW_MS is set; does nothing otherwise."""
+    if not SLOW_MS:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        g.profile_started = time.perf_counter()
+        start_request()
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        started = g.get("profile_started")
+        if started is not None:
+            path = finish_request(request.endpoint or "unmatched", (time.perf_counter() - started) * 1000)
+            if path:
+                app.logger.warning("Slow request %s %s; profile written to %s", request.method, request.path, path)
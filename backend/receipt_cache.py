@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import db_handler
+from receipt_extractor import MODEL, PROMPT_VERSION
+
+# Persistent, size-bounded LRU cache of parsed receipt extractions, keyed by the
+# image bytes plus model and prompt version, so re-uploads skip the LLM call.
+MAX_ENTRIES = int(os.getenv("RECEIPT_CACHE_MAX_ENTRIES", "5000"))
+ENABLED = os.getenv("RECEIPT_CACHE_ENABLED", "1") != "0"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def init_cache():
+    # Creates the receipt cache table if it doesn't exist.
+    with db_handler.get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS receipt_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_receipt_cache_last_used ON receipt_cache(last_used)")
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_key(image_data):
+    """Content address for an image: sha256 over model, prompt version and raw bytes."""
+    digest = hashlib.sha256(f"{MODEL}\0{PROMPT_VERSION}\0".encode("utf-8"))
+    digest.update(image_data)
+    return digest.hexdigest()
+
+
+def get(key):
+    """Returns the cached extraction for `key` (refreshing its LRU position) or None."""
+    if not ENABLED:
+        return None
+    try:
+        with db_handler.get_connection() as conn:
+            row = conn.execute("SELECT result FROM receipt_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE receipt_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+    except db_handler.DatabaseError:
+        row = None  # a broken cache must never block an upload
+
+    _count("hits" if row else "misses")
+    return json.loads(row[0]) if row else None
+
+
+def put(key, details):
+    """Stores a successful extraction and evicts least-recently-used entries past MAX_ENTRIES."""
+    if not ENABLED:
+        return
+    now = time.time()
+    try:
+        with db_handler.get_connection() as conn:
+            conn.execute("INSERT INTO receipt_cache (key, result, created_at, last_used) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET result = excluded.result, created_at = excluded.created_at, "
+                         "last_used = excluded.last_used", (key, json.dumps(details), now, now))
+            overflow = conn.execute("SELECT COUNT(*) FROM receipt_cache").fetchone()[0] - MAX_ENTRIES
+            if overflow > 0:
+                conn.execute("DELETE FROM receipt_cache WHERE key IN "
+                             "(SELECT key FROM receipt_cache ORDER BY last_used LIMIT ?)", (overflow,))
+    except db_handler.DatabaseError:
+        return
+
+    _count("stores")
+    if overflow > 0:
+        _count("evictions", overflow)
+
+
+def clear():
+    """Drops every cached extraction."""
+    with db_handler.get_connection() as conn:
+        conn.execute("DELETE FROM receipt_cache")
+
+
+def stats():
+    """Hit/miss counters for this process plus the current number of cached entries."""
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_ratio"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+    try:
+        with db_handler.get_connection() as conn:
+            counters["entries"] = conn.execute("SELECT COUNT(*) FROM receipt_cache").fetchone()[0]
+    except db_handler.DatabaseError:
+        counters["entries"] = None
+    counters["max_entries"] = MAX_ENTRIES
+    counters["enabled"] = ENABLED
+    return counters
@@ -1,16 +1,49 @@
-import requests
 import base64
 import json
 import re
 import os
 from dotenv import load_dotenv
 
+import db_handler
+import local_ocr
+from llm_client import LLMClientError, get_client
+from OCRLLM import expense_categories
+
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
+ENDPOINT = os.getenv("GROQ_ENDPOINT", "https://api.groq.com/openai/v1/chat/completions")
+MODEL = "llama-3.2-90b-vision-preview"
+# Text-only model that fixes up a reply which didn't parse or validate; far cheaper than re-sending the image.
+REPAIR_MODEL = os.getenv("GROQ_REPAIR_MODEL", "llama-3.1-8b-instant")
+# Bump whenever the prompt or post-processing changes so cached results are not reused.
+PROMPT_VERSION = 3
 IMAGE_PATH = "test_data/3.png"
 
+# The completion is streamed and parsed as it arrives: once the reply's JSON
+# object holds all of FIELDS the stream is closed, skipping whatever the model
+# would have written after it. The fields are then validated and normalized
+# (amount to a positive number, category onto expense_categories, date to
+# MM/DD/YY like the OCR tier). A reply that still doesn't parse or validate
+# gets one text-only repair call rather than failing the upload.
+FIELDS = ("amount", "category", "date", "name")
+PROMPT = (
+    "Extract the following details from this receipt: amount, category, date, name. "
+    "Return ONLY a single JSON object with these exact fields: "
+    "amount (the total as a number), "
+    f"category (exactly one of: {', '.join(expense_categories)}), "
+    "date (MM/DD/YY), name (the merchant). "
+    "Do not include extra text or formatting."
+)
+REPAIR_PROMPT = (
+    "This reply to a receipt extraction request was rejected ({problems}):\n\n{reply}\n\n"
+    "Return ONLY the corrected JSON object with the fields amount (a number), "
+    f"category (exactly one of: {', '.join(expense_categories)}), date (MM/DD/YY) and name. "
+    "Use null for a value the reply does not contain."
+)
+AMOUNT = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
 def encode_image(image_path):
     """Encodes the image in Base64 format."""
     with open(image_path, "rb") as f:
@@ -30,29 +63,151 @@ def extract_json_from_response(response_text):
     except json.JSONDecodeError:
         return {"error": "Extracted text is not valid JSON."}
 
-def extract_receipt_details(image_data_b64):
+
+class PartialObject:
+    """Reads the members of a JSON object from text that arrives in pieces.
+
+    feed() returns every member completed so far; anything before the opening
+    brace (a ```json fence, a preamble) is skipped. A value counts once the
+    "," or "}" after it has arrived, so a number cut off mid-stream isn't
+    taken early.
     """
-    Accepts Base64-encoded image data, calls Groq API with the Vision model,
-    and returns a JSON dict with fields: amount, category, date, name.
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self._position = None  # just past the last complete member, once the "{" is found
+        self._decoder = json.JSONDecoder()
+        self.closed = False
+
+    def feed(self, piece):
+        self.text += piece
+        if self._position is None:
+            start = self.text.find("{")
+            if start < 0:
+                return self.fields
+            self._position = start + 1
+        while not self.closed and self._next_member():
+            pass
+        return self.fields
+
+    def _skip_space(self, position):
+        while position < len(self.text) and self.text[position].isspace():
+            position += 1
+        return position
+
+    def _next_member(self):
+        text = self.text
+        position = self._skip_space(self._position)
+        if text.startswith("}", position):
+            self.closed = True
+            return None
+        try:
+            key, position = self._decoder.raw_decode(text, position)
+            position = self._skip_space(position)
+            if not text.startswith(":", position):
+                return None
+            value, position = self._decoder.raw_decode(text, self._skip_space(position + 1))
+        except json.JSONDecodeError:
+            return None  # incomplete so far, or not JSON at all
+        position = self._skip_space(position)
+        if position >= len(text) or text[position] not in ",}":
+            return None
+        if isinstance(key, str):
+            self.fields[key.strip().lower()] = value
+        self._position = position + 1 if text[position] == "," else position
+        return True
+
+
+def normalize_details(details):
+    """Validates extracted fields. Returns (normalized details, list of problems; empty if valid)."""
+    problems = []
+    normalized = {}
+
+    amount = details.get("amount")
+    if isinstance(amount, str):
+        match = AMOUNT.search(amount)
+        amount = float(match.group(0).replace(",", "")) if match else None
+    if isinstance(amount, (int, float)) and not isinstance(amount, bool) and amount > 0:
+        normalized["amount"] = round(float(amount), 2)
+    else:
+        problems.append(f"amount {details.get('amount')!r} is not a positive number")
+
+    name = details.get("name")
+    if isinstance(name, str) and name.strip():
+        normalized["name"] = name.strip()
+    else:
+        problems.append(f"name {name!r} is missing")
+
+    category = details.get("category")
+    matches = [known for known in expense_categories
+               if isinstance(category, str) and known.lower() == category.strip().lower()]
+    if matches:
+        normalized["category"] = matches[0]
+    else:
+        # "grocery store", "Coffee" and the like map the way OCR text does.
+        guessed = local_ocr.match_category(f"{category or ''} {normalized.get('name', '')}")
+        if guessed:
+            normalized["category"] = guessed
+        else:
+            problems.append(f"category {category!r} is not one of the expense categories")
+
+    iso_date = db_handler.normalize_date(details.get("date"))
+    if iso_date:
+        year, month, day = iso_date.split("-")
+        normalized["date"] = f"{month}/{day}/{year[2:]}"
+    else:
+        problems.append(f"date {details.get('date')!r} is not a date")
+    return normalized, problems
+
+
+def _stream_fields(payload):
+    # Streams a completion; returns (fields, raw reply text), stopping as soon as every field is in.
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
+    parsed = PartialObject()
+    stream = get_client().stream_chat(ENDPOINT, payload, headers)
+    try:
+        for piece in stream:
+            fields = parsed.feed(piece)
+            if all(field in fields for field in FIELDS):
+                break
+    finally:
+        stream.close()
+    fields = parsed.fields
+    if not fields:
+        # No JSON object we could follow; fall back to parsing the whole reply.
+        fallback = extract_json_from_response(parsed.text)
+        fields = {str(key).lower(): value for key, value in fallback.items()} if isinstance(fallback, dict) else {}
+        fields.pop("error", None)
+    return fields, parsed.text
+
+
+def _repair(reply, problems):
+    payload = {
+        "model": REPAIR_MODEL,
+        "messages": [{"role": "user", "content": REPAIR_PROMPT.format(problems="; ".join(problems), reply=reply)}],
+        "temperature": 0,
+        "max_tokens": 128,
+        "top_p": 1,
+    }
+    return _stream_fields(payload)[0]
+
+
+def extract_receipt_details(image_data_b64, mime_type="image/jpeg"):
+    """
+    Accepts Base64-encoded image data (of the given MIME type), calls Groq API with
+    the Vision model, and returns a JSON dict with fields: amount, category, date, name.
     """
     payload = {
-        "model": "llama-3.2-90b-vision-preview",
+        "model": MODEL,
         "messages": [
             {
                 "role": "user",
                 "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            "Extract the following details from this receipt: "
-                            "amount, category, date, name. Return ONLY a single JSON "
-                            "object with these exact fields: amount, category, date, name. "
-                            "Do not include extra text or formatting."
-                        )
-                    },
+                    {"type": "text", "text": PROMPT},
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_data_b64}"}
+                        "image_url": {"url": f"data:{mime_type};base64,{image_data_b64}"}
                     }
                 ]
             }
@@ -62,18 +217,16 @@ def extract_receipt_details(image_data_b64):
         "top_p": 1,
     }
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    response = requests.post(ENDPOINT, headers=headers, json=payload)
-    if response.status_code != 200:
-        return {"error": f"Groq API error (status {response.status_code})", "details": response.text}
-
-    response_data = response.json()
-    if "choices" not in response_data or not response_data["choices"]:
-        return {"error": "No valid choices returned from Groq API."}
-
-    raw_content = response_data["choices"][0]["message"]["content"]
-    return extract_json_from_response(raw_content)
+    try:
+        fields, reply = _stream_fields(payload)
+        details, problems = normalize_details(fields)
+        if problems:
+            repaired, repair_problems = normalize_details(_repair(reply, problems))
+            if [problem for problem in repair_problems if not problem.startswith("category ")]:
+                return {"error": "Could not read a valid receipt from the model's reply.",
+                        "details": "; ".join(repair_problems)}
+            # A category nothing maps onto isn't worth failing the upload for.
+            details = {"category": "Miscellaneous", **repaired}
+    except LLMClientError as e:
+        return {"error": str(e), "details": e.details}
+    return details
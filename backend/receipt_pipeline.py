@@ -0,0 +1,67 @@
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import image_preprocess
+import local_ocr
+import receipt_cache
+from receipt_extractor import extract_receipt_details, normalize_details
+
+# Turns raw receipt image bytes into validated {amount, category, date, name}
+# details. Tiers, cheapest first: the content-addressed cache, local OCR with
+# heuristic parsing, and finally the (preprocessed) image sent to the LLM.
+# Only complete results are cached, so a bad read is retried, not replayed.
+REQUIRED_FIELDS = ["amount", "category", "date", "name"]
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+
+
+def extract(image_data, bypass_cache=False):
+    """Extracts one receipt.
+
+    Returns {"success": True, "details": ..., "cached": ..., "tier": "cache" | "ocr" | "llm"}
+    or an error dict.
+    """
+    key = receipt_cache.cache_key(image_data)
+    details = None if bypass_cache else receipt_cache.get(key)
+    cached = details is not None
+    tier = "cache" if cached else "llm"
+
+    if not cached and local_ocr.available():
+        local_details, confidence = local_ocr.extract(image_data)
+        if local_details and confidence >= local_ocr.CONFIDENCE_THRESHOLD:
+            # Confident is not the same as complete: it has to pass the checks the LLM's reply does.
+            normalized, problems = normalize_details(local_details)
+            if not problems:
+                details, tier = normalized, "ocr"
+
+    if details is None:
+        payload, mime_type = image_preprocess.preprocess(image_data)
+        details = extract_receipt_details(base64.b64encode(payload).decode('utf-8'), mime_type)
+        if 'error' in details:
+            return {"success": False, "message": f"Error extracting receipt: {details['error']}",
+                    "details": details.get("details")}
+
+    for field in REQUIRED_FIELDS:
+        if details.get(field) is None:
+            return {"success": False, "message": f"Missing '{field}' in extracted data."}
+
+    if not cached:
+        receipt_cache.put(key, details)
+
+    return {"success": True, "details": {field: details[field] for field in REQUIRED_FIELDS}, "cached": cached,
+            "tier": tier}
+
+
+def _safe_extract(image_data, bypass_cache):
+    try:
+        return extract(image_data, bypass_cache)
+    except Exception as e:
+        return {"success": False, "message": f"Unexpected Error: {str(e)}"}
+
+
+def extract_many(images, bypass_cache=False, max_workers=BATCH_WORKERS):
+    """Extracts several receipts concurrently over a bounded thread pool, preserving input order."""
+    if not images:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(images))) as pool:
+        return list(pool.map(lambda image_data: _safe_extract(image_data, bypass_cache), images))
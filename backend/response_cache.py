@@ -0,0 +1,177 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+
+from flask import current_app, request
+
+import auth
+import db_handler
+
+# In-process TTL/LRU cache for the per-user read endpoints, with ETags.
+#
+# Every cached view declares the data scopes it reads ("profile", "expenses",
+# "budgets"). Each (username, scope) has a version number that writes bump via
+# invalidate(), and the versions are part of both the cache key and the ETag.
+# A write therefore retires exactly the responses that read the data it
+# changed, and a client whose If-None-Match still matches gets a 304 before the
+# view runs, with no query and no body to serialize.
+#
+# Versions live in this process by default. With several worker processes set
+# RESPONSE_CACHE_SHARED=1 (gunicorn.conf.py does) to keep them in the database instead:
+# every worker then sees every write, at the cost of one primary-key read per request.
+# CLI commands run in their own process, so their writes always bump the database
+# versions, which only a server with RESPONSE_CACHE_SHARED=1 reads.
+ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") != "0"
+SHARED = os.getenv("RESPONSE_CACHE_SHARED", "0") == "1"
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+SCOPES = ("profile", "expenses", "budgets")
+
+# Local versions restart at zero, so local ETags carry a per-process token to
+# never match one handed out before a restart or by another worker.
+_etag_token = "shared" if SHARED else uuid.uuid4().hex
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (expires_at, body, status, mimetype)
+_versions = {}  # (username, scope) -> version, when not SHARED
+_stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0, "evictions": 0}
+
+
+def init_versions():
+    # Creates the version table used when SHARED if it doesn't exist.
+    with db_handler.get_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                username TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (username, scope)
+            ) WITHOUT ROWID
+        ''')
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+def versions(username, scopes):
+    """Current version of each scope for a user."""
+    if not SHARED:
+        with _lock:
+            return tuple(_versions.get((username, scope), 0) for scope in scopes)
+    with db_handler.get_connection() as conn:
+        rows = dict(conn.execute(
+            f"SELECT scope, version FROM cache_versions WHERE username = ? AND scope IN ({','.join('?' * len(scopes))})",
+            (username, *scopes)).fetchall())
+    return tuple(rows.get(scope, 0) for scope in scopes)
+
+
+def invalidate(usernames, *scopes, shared=None):
+    """Retires every cached response that read any of `scopes` for the given user(s).
+
+    shared=True bumps the database versions even when this process keeps its
+    own, for writes made outside the serving process (the CLI commands).
+    """
+    if isinstance(usernames, str):
+        usernames = [usernames]
+    keys = [(username, scope) for username in set(usernames) for scope in scopes]
+    if not keys:
+        return
+    if shared is None:
+        shared = SHARED
+    if shared:
+        with db_handler.get_connection() as conn:
+            conn.executemany("INSERT INTO cache_versions (username, scope, version) VALUES (?, ?, 1) "
+                             "ON CONFLICT(username, scope) DO UPDATE SET version = cache_versions.version + 1", keys)
+    else:
+        with _lock:
+            for key in keys:
+                _versions[key] = _versions.get(key, 0) + 1
+    _count("invalidations", len(keys))
+
+
+def clear():
+    """Drops every cached response (versions are kept)."""
+    with _lock:
+        _entries.clear()
+
+
+def stats():
+    with _lock:
+        counters = dict(_stats)
+        counters["entries"] = len(_entries)
+    counters["enabled"] = ENABLED
+    counters["shared"] = SHARED
+    return counters
+
+
+def _lookup(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return entry
+
+
+def _store(key, body, status, mimetype):
+    with _lock:
+        _entries[key] = (time.monotonic() + TTL_SECONDS, body, status, mimetype)
+        _entries.move_to_end(key)
+        evicted = 0
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            evicted += 1
+        _stats["evictions"] += evicted
+
+
+def cached(*scopes):
+    """Caches a GET view's 200 responses per username and query string, and answers If-None-Match.
+
+    The view must act for auth.current_user() and read only data belonging
+    to the given scopes.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            username = auth.current_user()
+            if not ENABLED or not username:
+                return view(*args, **kwargs)
+
+            # Versions are read before the view runs: a write landing mid-request
+            # bumps them, so what we store under the old ones is never served again.
+            # The date is in the key because some views (check_threshold) depend on it.
+            key = (request.path, username, tuple(sorted(request.args.items(multi=True))),
+                   versions(username, scopes), date.today().isoformat())
+            etag = hashlib.sha1(repr((_etag_token, key)).encode()).hexdigest()[:20]
+
+            if etag in request.if_none_match:
+                _count("not_modified")
+                response = current_app.response_class(status=304)
+            else:
+                entry = _lookup(key)
+                if entry is not None:
+                    _count("hits")
+                    response = current_app.response_class(entry[1], status=entry[2], mimetype=entry[3])
+                else:
+                    _count("misses")
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    _store(key, response.get_data(), response.status_code, response.mimetype)
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"  # browsers revalidate with If-None-Match
+            return response
+        return wrapper
+    return decorator
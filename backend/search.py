@@ -0,0 +1,232 @@
+import base64
+import difflib
+import json
+import os
+import re
+import threading
+import time
+
+import db_handler
+
+# Full-text search over expense names (the merchant, for imported and
+# extracted expenses).
+#
+# expenses_fts is an external-content FTS5 index on expenses(name, username):
+# it stores only the index, and triggers on expenses update it inside the same
+# transaction as every insert and delete, like the rollups. The username is
+# indexed too, so a query only walks one user's postings, and the join back to
+# expenses checks it exactly.
+#
+# Every query term matches as a prefix ("star" finds "Starbucks"), backed by
+# 2- and 3-character prefix indexes. When the terms find nothing, each one is
+# swapped for the closest words in the index vocabulary ("starbuks" ->
+# "starbucks") and the search runs once more.
+#
+# On PostgreSQL the same queries run against a GIN index on
+# to_tsvector('simple', name) (created by migrations), ranked by ts_rank, and
+# the vocabulary is read from the merchant_totals rollup.
+FUZZY_CUTOFF = 0.75
+FUZZY_ALTERNATIVES = 3
+VOCAB_TTL_SECONDS = float(os.getenv("SEARCH_VOCAB_TTL", "300"))
+SORTS = ("relevance", *db_handler.SORT_ORDERS)
+RELEVANCE = {
+    "sqlite": "bm25(expenses_fts, 1.0, 0.0), e.date_iso DESC, e.id DESC",
+    "postgresql": "ts_rank(to_tsvector('simple', e.name), query) DESC, e.date_iso DESC, e.id DESC",
+}
+
+_vocab_lock = threading.Lock()
+_vocab = {"loaded_at": None, "by_length": {}}
+
+
+def init_search():
+    # Creates the FTS index and its triggers if they don't exist, indexing existing expenses once (SQLite).
+    with db_handler.get_connection() as conn:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'expenses_fts'").fetchone()
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+                name, username,
+                content = 'expenses', content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )
+        ''')
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts_vocab USING fts5vocab(expenses_fts, 'col')")
+        # External content: a delete must hand FTS5 the old values to remove.
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+                INSERT INTO expenses_fts (rowid, name, username) VALUES (NEW.id, NEW.name, NEW.username);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+                INSERT INTO expenses_fts (expenses_fts, rowid, name, username)
+                VALUES ('delete', OLD.id, OLD.name, OLD.username);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF name, username ON expenses BEGIN
+                INSERT INTO expenses_fts (expenses_fts, rowid, name, username)
+                VALUES ('delete', OLD.id, OLD.name, OLD.username);
+                INSERT INTO expenses_fts (rowid, name, username) VALUES (NEW.id, NEW.name, NEW.username);
+            END
+        ''')
+        if not exists:
+            conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+        conn.commit()
+
+
+def rebuild_index():
+    """Re-indexes every expense from scratch and compacts the index; returns the row count."""
+    try:
+        with db_handler.get_connection() as conn:
+            if db_handler.dialect() == "sqlite":  # PostgreSQL keeps its GIN index current itself
+                conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+                conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('optimize')")
+                conn.commit()
+            rows = conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+        _vocab["loaded_at"] = None
+        return {"success": True, "indexed": rows}
+
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
+
+
+def tokenize(text):
+    # Close enough to unicode61 for building queries: lowercase runs of letters and digits.
+    return re.findall(r"\w+", text.lower())
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _tsquery(alternatives):
+    # The PostgreSQL equivalent of _match_expression's name clause.
+    groups = []
+    for options in alternatives:
+        groups.append("(" + " | ".join([f"'{options[0]}':*"] + [f"'{option}'" for option in options[1:]]) + ")")
+    return " & ".join(groups)
+
+
+def _match_expression(username, alternatives):
+    # alternatives: one list per query term; the first entry is the term itself, matched as a prefix.
+    groups = []
+    for options in alternatives:
+        group = " OR ".join([_quote(options[0]) + "*"] + [_quote(option) for option in options[1:]])
+        groups.append(f"({group})")
+    return f"username : {_quote(username)} AND name : ({' AND '.join(groups)})"
+
+
+def _vocabulary():
+    # Distinct words in expense names, grouped by length; reloaded every VOCAB_TTL_SECONDS.
+    with _vocab_lock:
+        loaded_at = _vocab["loaded_at"]
+        if loaded_at is None or time.monotonic() - loaded_at > VOCAB_TTL_SECONDS:
+            by_length = {}
+            with db_handler.get_connection() as conn:
+                if db_handler.dialect() == "postgresql":
+                    names = conn.execute("SELECT DISTINCT name FROM merchant_totals")
+                    terms = {term for (name,) in names for term in tokenize(name)}
+                else:
+                    terms = [term for (term,) in conn.execute("SELECT term FROM expenses_fts_vocab WHERE col = 'name'")]
+                for term in terms:
+                    by_length.setdefault(len(term), []).append(term)
+            _vocab["by_length"], _vocab["loaded_at"] = by_length, time.monotonic()
+        return _vocab["by_length"]
+
+
+def suggest(term):
+    """The indexed words closest to `term` (by difflib ratio), best first."""
+    by_length = _vocabulary()
+    candidates = [word for length in range(len(term) - 2, len(term) + 3) for word in by_length.get(length, ())]
+    return difflib.get_close_matches(term, candidates, n=FUZZY_ALTERNATIVES, cutoff=FUZZY_CUTOFF)
+
+
+def _encode_offset(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("ascii")
+
+
+def _decode_offset(cursor):
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"]
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor.")
+    return offset
+
+
+def _run(conn, username, alternatives, order_by, limit, offset):
+    if db_handler.dialect() == "postgresql":
+        return conn.execute(f'''
+            SELECT e.id, e.name, e.amount, e.category, e.date
+            FROM expenses e, to_tsquery('simple', ?) query
+            WHERE e.username = ? AND to_tsvector('simple', e.name) @@ query
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+        ''', (_tsquery(alternatives), username, limit + 1, offset)).fetchall()
+
+    # CROSS JOIN keeps the index as the outer loop. Ordered by date, the planner
+    # would otherwise walk the user's (username, date_iso) index and re-run the
+    # MATCH for every row.
+    return conn.execute(f'''
+        SELECT e.id, e.name, e.amount, e.category, e.date
+        FROM expenses_fts
+        CROSS JOIN expenses e ON e.id = expenses_fts.rowid
+        WHERE expenses_fts MATCH ? AND e.username = ?
+        ORDER BY {order_by}
+        LIMIT ? OFFSET ?
+    ''', (_match_expression(username, alternatives), username, limit + 1, offset)).fetchall()
+
+
+def search_expenses(username, query, limit=50, cursor=None, sort="relevance", fuzzy=True):
+    """Finds a user's expenses whose name contains words starting with every term of `query`.
+
+    Results are ranked by BM25 (newest first among equals) or ordered by any
+    get_expenses sort, and paginated with `next_cursor`. If nothing matches
+    and `fuzzy` is set, misspelled terms are replaced by their closest indexed
+    words; `corrections` maps each replaced term to the words tried.
+    """
+    if sort not in SORTS:
+        return {"success": False, "message": f"Invalid sort. Use one of: {', '.join(SORTS)}."}
+    terms = tokenize(query or "")
+    if not terms:
+        return {"success": False, "message": "Search query must contain a letter or digit."}
+    try:
+        offset = _decode_offset(cursor) if cursor else 0
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    limit = max(1, min(int(limit), db_handler.MAX_PAGE_SIZE))
+
+    if sort == "relevance":
+        order_by = RELEVANCE[db_handler.dialect()]
+    else:
+        column, descending = db_handler.SORT_ORDERS[sort]
+        direction = "DESC" if descending else "ASC"
+        order_by = f"e.{column} {direction}, e.id {direction}"
+
+    corrections = {}
+    try:
+        with db_handler.get_connection() as conn:
+            rows = _run(conn, username, [[term] for term in terms], order_by, limit, offset)
+            if not rows and fuzzy:
+                alternatives = []
+                for term in terms:
+                    similar = [word for word in suggest(term) if word != term]
+                    if similar:
+                        corrections[term] = similar
+                    alternatives.append([term] + similar)
+                if corrections:
+                    rows = _run(conn, username, alternatives, order_by, limit, offset)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_offset(offset + limit)
+        expense_list = [
+            {"id": row[0], "name": row[1], "amount": row[2], "category": row[3], "date": row[4]}
+            for row in rows
+        ]
+        return {"success": True, "expenses": expense_list, "next_cursor": next_cursor, "corrections": corrections}
+
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}"}
@@ -0,0 +1,234 @@
+import csv
+import functools
+import io
+import re
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+import db_handler
+from local_ocr import guess_category
+
+# Streams bank / credit-card statements (CSV or OFX) into the expenses table.
+# Files are parsed row by row and written in CHUNK_SIZE executemany
+# transactions, so memory stays flat no matter how large the statement is.
+CHUNK_SIZE = 5000
+
+# Header names (lower-cased) recognised in CSV exports, most specific first.
+CSV_COLUMNS = {
+    "date": ["transaction date", "trans. date", "posting date", "posted date", "date"],
+    "name": ["description", "payee", "merchant", "name", "memo", "details"],
+    "amount": ["amount", "transaction amount"],
+    "debit": ["debit", "withdrawal", "withdrawals"],
+    "category": ["category"],
+}
+
+# Statement descriptions repeat constantly; keyword matching each one is the
+# hottest step of an import, so remember the answers.
+_guess_category = functools.lru_cache(maxsize=8192)(guess_category)
+
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def parse_amount(value):
+    """Parses '$1,234.56', '-12.00' or '(12.00)' into a Decimal (None if blank or invalid)."""
+    if value is None:
+        return None
+    text = str(value).strip().replace("$", "").replace(",", "")
+    if not text:
+        return None
+    negative = text.startswith("(") and text.endswith(")")
+    try:
+        amount = Decimal(text.strip("()"))
+    except InvalidOperation:
+        return None
+    return -amount if negative else amount
+
+
+def _pick_column(fieldnames, candidates):
+    lowered = {name.strip().lower(): name for name in fieldnames if name}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+def iter_csv(stream, debits_negative=True):
+    """Yields raw {date, name, amount, category} transactions from a CSV text stream.
+
+    With a single signed amount column, `debits_negative` says whether spending
+    shows up as negative numbers (most bank exports) or positive ones (most
+    card exports). Credits / refunds are skipped; amounts come out positive.
+    """
+    reader = csv.DictReader(stream)
+    columns = {key: _pick_column(reader.fieldnames or [], names) for key, names in CSV_COLUMNS.items()}
+    if not columns["date"] or not columns["name"] or not (columns["amount"] or columns["debit"]):
+        raise ValueError("CSV needs date, description and amount (or debit) columns.")
+
+    for row in reader:
+        if columns["debit"]:
+            amount = parse_amount(row.get(columns["debit"]))
+            if amount is None and columns["amount"]:
+                amount = parse_amount(row.get(columns["amount"]))
+            amount = abs(amount) if amount else None
+        else:
+            amount = parse_amount(row.get(columns["amount"]))
+            if amount is not None:
+                amount = -amount if debits_negative else amount
+        yield {
+            "date": row.get(columns["date"]),
+            "name": row.get(columns["name"]),
+            "amount": amount,
+            "category": row.get(columns["category"]) if columns["category"] else None,
+        }
+
+
+def iter_ofx(stream, read_size=65536):
+    """Yields raw transactions from an OFX (SGML v1 or XML v2) text stream.
+
+    Reads the file in fixed-size pieces and tokenises tags incrementally, so
+    neither line layout nor file size matters. Debits (negative TRNAMT) come
+    out as positive amounts; credits come out negative and are skipped on import.
+    """
+    buffer = ""
+    transaction = None
+    while True:
+        piece = stream.read(read_size)
+        buffer += piece
+        # Keep a possibly incomplete trailing tag for the next round.
+        cut = len(buffer) if not piece else max(buffer.rfind("<"), 0)
+        for closing, tag, value in OFX_TAG.findall(buffer[:cut]):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and transaction is not None:
+                    amount = parse_amount(transaction.get("TRNAMT"))
+                    posted = transaction.get("DTPOSTED", "")
+                    yield {
+                        "date": f"{posted[0:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) >= 8 else None,
+                        "name": transaction.get("NAME") or transaction.get("MEMO"),
+                        "amount": -amount if amount is not None else None,
+                        "category": None,
+                    }
+                    transaction = None
+                elif not closing:
+                    transaction = {}
+            elif transaction is not None and not closing and value.strip():
+                transaction[tag] = value.strip()
+        buffer = buffer[cut:]
+        if not piece:
+            return
+
+
+def normalize_transaction(raw, default_category=None):
+    """Validates a parsed transaction and shapes it for db_handler; returns None to skip it."""
+    amount = raw.get("amount")
+    date_iso = db_handler.normalize_date(raw.get("date"))
+    name = (raw.get("name") or "").strip()
+    if amount is None or amount <= 0 or not date_iso or not name:
+        return None
+    category = (raw.get("category") or "").strip() or default_category or _guess_category(name)
+    return {"name": name, "amount": float(amount), "category": category, "date": date_iso, "date_iso": date_iso}
+
+
+def _merchant_keys(conn, names):
+    # db_handler.MERCHANT_KEY_SQL of each name, worked out by the database so it matches stored rows exactly.
+    keys = {}
+    names = sorted(names)
+    for start in range(0, len(names), 500):
+        batch = names[start:start + 500]
+        keys.update(conn.execute(
+            f"WITH names(name) AS (VALUES {', '.join(['(?)'] * len(batch))}) "
+            f"SELECT name, {db_handler.MERCHANT_KEY_SQL.format('name')} FROM names", batch).fetchall())
+    return keys
+
+
+def _existing_counts(conn, username, dates):
+    # {date_iso: Counter of (amount, merchant key)} over the user's rows on those days.
+    counts = {date: Counter() for date in dates}
+    dates = sorted(dates)
+    for start in range(0, len(dates), 500):
+        batch = dates[start:start + 500]
+        rows = conn.execute(
+            f"SELECT date_iso, amount, {db_handler.MERCHANT_KEY_SQL.format('name')} FROM expenses "
+            f"WHERE username = ? AND date_iso IN ({','.join('?' * len(batch))})",
+            [username, *batch])
+        for row in rows:
+            counts[row[0]][(round(row[1], 2), row[2])] += 1
+    return counts
+
+
+def _insert_chunk(username, chunk, counts, occurrences):
+    # A row is a duplicate while the file has had no more rows with its day, amount and merchant key than the
+    # user already had; two identical coffees on one statement are two expenses. `occurrences` maps each day of
+    # the latest chunk to (existing counts, file counts). Statements are in date order, so a day is dropped
+    # once a chunk goes by without it; were it to come back, it is checked against everything recorded by then.
+    dates = {row["date_iso"] for row in chunk}
+    db_handler.ensure_partitions(dates)
+    with db_handler.get_connection() as conn:
+        for date in set(occurrences) - dates:
+            del occurrences[date]
+        existing = _existing_counts(conn, username, dates - set(occurrences))
+        occurrences.update((date, (existing[date], Counter())) for date in existing)
+        merchants = _merchant_keys(conn, {row["name"] for row in chunk})
+        rows = []
+        for row in chunk:
+            recorded, seen = occurrences[row["date_iso"]]
+            key = (round(row["amount"], 2), merchants[row["name"]])
+            seen[key] += 1
+            if seen[key] <= recorded[key]:
+                counts["duplicates"] += 1
+                continue
+            rows.append((username, row["name"], row["amount"], row["category"], row["date"], row["date_iso"]))
+        conn.executemany("INSERT INTO expenses (username, name, amount, category, date, date_iso) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    counts["imported"] += len(rows)
+
+
+def import_statement(username, stream, file_format, debits_negative=True, default_category=None,
+                     chunk_size=CHUNK_SIZE):
+    """Imports a CSV or OFX statement for a user from a text stream.
+
+    Returns counts of rows parsed, imported, skipped (credits or unparseable)
+    and duplicates (already recorded: re-importing an overlapping statement
+    adds only the transactions that are new).
+    """
+    if file_format == "csv":
+        transactions = iter_csv(stream, debits_negative)
+    elif file_format == "ofx":
+        transactions = iter_ofx(stream)
+    else:
+        return {"success": False, "message": "Unsupported format. Use csv or ofx."}
+
+    counts = {"parsed": 0, "imported": 0, "skipped": 0, "duplicates": 0}
+    occurrences = {}  # see _insert_chunk
+    chunk = []
+    try:
+        for raw in transactions:
+            counts["parsed"] += 1
+            row = normalize_transaction(raw, default_category)
+            if row is None:
+                counts["skipped"] += 1
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                _insert_chunk(username, chunk, counts, occurrences)
+                chunk = []
+        if chunk:
+            _insert_chunk(username, chunk, counts, occurrences)
+
+    except (ValueError, csv.Error) as e:
+        return {"success": False, "message": f"Could not parse statement: {str(e)}", **counts}
+    except db_handler.DatabaseError as e:
+        return {"success": False, "message": f"Database Error: {str(e)}", **counts}
+
+    return {"success": True, "message": f"Imported {counts['imported']} expenses.", **counts}
+
+
+def detect_format(filename):
+    """Guesses csv / ofx from a file name (QFX is OFX under another name)."""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return {"csv": "csv", "ofx": "ofx", "qfx": "ofx"}.get(extension)
+
+
+def open_text(binary_stream):
+    """Wraps an uploaded binary stream for incremental text decoding (UTF-8, BOM tolerant)."""
+    return io.TextIOWrapper(binary_stream, encoding="utf-8-sig", errors="replace", newline="")
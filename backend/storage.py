@@ -0,0 +1,329 @@
+import functools
+import os
+import queue
+import re
+import sqlite3
+import time
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+except ImportError:  # psycopg2 is optional; without it only SQLite databases can be opened
+    psycopg2 = None
+
+import metrics
+
+# Storage backends behind db_handler.get_connection().
+#
+# db_handler.DATABASE (env DATABASE_URL) picks one: a file path or sqlite:///
+# URL opens SQLite, a postgresql:// URL opens PostgreSQL. Either way callers get
+# a pooled connection with the sqlite3 interface the rest of the code is
+# written against: conn.execute() / executemany() with "?" placeholders,
+# cursors with fetchone() / fetchmany() / rowcount, and `with conn:` committing
+# or rolling back. Inserts that need the new id use RETURNING, which both
+# dialects support, instead of lastrowid.
+#
+# What SQL can't paper over is in the backend: the write lock taken before a
+# check-then-insert (lock()), streaming large results (iterate()), and creating
+# the monthly partitions of expenses on PostgreSQL (ensure_partitions()).
+# Queries that differ by dialect branch on `backend.dialect`.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+STATEMENT_CACHE_SIZE = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",       # readers no longer block the writer
+    "PRAGMA synchronous=NORMAL",     # safe with WAL, avoids an fsync per commit
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",    # memory-map up to 256 MB of the DB file
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Catch these rather than sqlite3.Error so handlers work on either backend.
+DatabaseError = (sqlite3.Error, psycopg2.Error) if psycopg2 else (sqlite3.Error,)
+IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError) if psycopg2 else (sqlite3.IntegrityError,)
+
+if psycopg2:
+    # Match what sqlite3 hands back: floats for NUMERIC (ROUND(), SUM() over
+    # integers) and bytes for BYTEA rather than Decimal and memoryview.
+    psycopg2.extensions.register_type(psycopg2.extensions.new_type(
+        psycopg2.extensions.DECIMAL.values, "FLOAT_NUMERIC",
+        lambda value, cursor: float(value) if value is not None else None))
+    psycopg2.extensions.register_type(psycopg2.extensions.new_type(
+        psycopg2.BINARY.values, "BYTES",
+        lambda value, cursor: bytes(psycopg2.BINARY(value, cursor)) if value is not None else None))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Reports every statement's execute() time to metrics.
+
+    For SELECTs that covers planning and the first step; later fetches are not timed.
+    """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_sql(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    # The Connection.execute shortcuts would use a plain cursor; route them through TimedCursor.
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class Backend:
+    """A pool of connections to one database.
+
+    Connections are long-lived and shared across request threads, so every
+    checkout skips the connect cost. Up to POOL_SIZE idle ones are kept.
+    """
+
+    dialect = None
+
+    def __init__(self, url):
+        self.url = url
+        self._pool = queue.LifoQueue(maxsize=POOL_SIZE)
+        self._closed = False
+
+    def connect(self):
+        raise NotImplementedError
+
+    def usable(self, conn):
+        return True
+
+    def checkout(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def checkin(self, conn):
+        if self._closed or not self.usable(conn):
+            conn.close()
+            return
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """Closes every idle connection; ones still checked out are closed when returned."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+    def lock(self, conn, key):
+        """Starts a write transaction no other writer of `key` can interleave with."""
+        raise NotImplementedError
+
+    def iterate(self, conn, sql, params, batch_size):
+        """Yields the rows of a query, holding at most `batch_size` of them in memory."""
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def ensure_partitions(self, months):
+        """Makes sure expenses can take rows dated in each YYYY-MM month (or '' for undated)."""
+
+
+class SQLiteBackend(Backend):
+    dialect = "sqlite"
+
+    def __init__(self, url):
+        super().__init__(url)
+        self.path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+
+    def connect(self):
+        # Opens a new tuned connection to the database file.
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE,
+                               factory=TimedConnection if metrics.ENABLED else sqlite3.Connection)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def lock(self, conn, key):
+        # SQLite has one writer at a time anyway; take the lock now rather than at the first write.
+        conn.execute("BEGIN IMMEDIATE")
+
+
+_MONTH = re.compile(r"\d{4}-\d{2}")
+# String literals, "?" placeholders and stray "%"s, which psycopg2 would read as placeholders.
+_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\?|%")
+_INSERT_VALUES = re.compile(r"^(\s*INSERT\b.*\bVALUES\s*)(\((?:\s*%s\s*,)*\s*%s\s*\))\s*$", re.I | re.S)
+
+
+@functools.lru_cache(maxsize=1024)
+def _to_pyformat(sql):
+    # "?" -> "%s" outside literals; "%" -> "%%" everywhere, literals included.
+    return _PLACEHOLDER.sub(lambda m: "%s" if m.group(0) == "?" else m.group(0).replace("%", "%%"), sql)
+
+
+class PostgresCursor:
+    """A psycopg2 cursor that takes sqlite3-style "?" placeholders."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, parameters=()):
+        self.__dict__.pop("rowcount", None)  # left over from an executemany() on this cursor
+        start = time.perf_counter()
+        try:
+            if parameters:
+                self._cursor.execute(_to_pyformat(sql), tuple(parameters))
+            else:
+                self._cursor.execute(sql)
+        finally:
+            if metrics.ENABLED:
+                metrics.observe_sql(sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        rows = [tuple(parameters) for parameters in seq_of_parameters]
+        try:
+            statement = _to_pyformat(sql)
+            plain_insert = _INSERT_VALUES.match(statement)
+            if plain_insert and rows:
+                # One multi-row INSERT per page instead of a round trip per row.
+                psycopg2.extras.execute_values(self._cursor, plain_insert.group(1) + "%s", rows,
+                                               template=plain_insert.group(2), page_size=1000)
+                self.rowcount = len(rows)
+            else:
+                self._cursor.executemany(statement, rows)
+                self.rowcount = self._cursor.rowcount
+        finally:
+            if metrics.ENABLED:
+                metrics.observe_sql(sql, time.perf_counter() - start)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class PostgresConnection:
+    """A psycopg2 connection with the sqlite3 shortcuts db_handler relies on."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self):
+        return PostgresCursor(self.raw.cursor())
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.raw.commit()
+        elif not self.raw.closed:
+            self.raw.rollback()
+        return False
+
+
+class PostgresBackend(Backend):
+    """PostgreSQL via psycopg2.
+
+    expenses is range-partitioned by month on date_iso (see migrations), so a
+    month's partition has to exist before its first row arrives:
+    ensure_partitions() creates missing ones, each under an advisory lock so
+    concurrent workers don't race, and remembers which exist.
+    """
+
+    dialect = "postgresql"
+
+    def __init__(self, url):
+        if psycopg2 is None:
+            raise RuntimeError("DATABASE_URL points at PostgreSQL but psycopg2 is not installed.")
+        super().__init__(url)
+        self._partitions = set()
+
+    def connect(self):
+        return PostgresConnection(psycopg2.connect(self.url, application_name="expense-tracker"))
+
+    def usable(self, conn):
+        # Drop connections the server closed or that were left mid-transaction.
+        return not conn.raw.closed and conn.raw.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def lock(self, conn, key):
+        # Serializes writers of the same key until this transaction ends; others carry on.
+        conn.execute("SELECT pg_advisory_xact_lock(hashtext(?))", (key,))
+
+    def iterate(self, conn, sql, params, batch_size):
+        # A named (server-side) cursor: rows arrive batch_size at a time instead of all at once.
+        cursor = conn.raw.cursor(name=f"iterate_{id(conn)}_{time.monotonic_ns()}")
+        cursor.itersize = batch_size
+        try:
+            cursor.execute(_to_pyformat(sql) if params else sql, tuple(params) if params else None)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            if not conn.raw.closed:
+                cursor.close()
+
+    def ensure_partitions(self, months):
+        missing = sorted(month for month in set(months) - self._partitions if _MONTH.fullmatch(month))
+        if not missing:
+            return
+        conn = self.checkout()
+        try:
+            with conn:
+                self.lock(conn, "expenses_partitions")
+                for month in missing:
+                    year, number = int(month[:4]), int(month[5:7])
+                    following = f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+                    conn.execute(f"CREATE TABLE IF NOT EXISTS expenses_{year:04d}_{number:02d} PARTITION OF expenses "
+                                 f"FOR VALUES FROM ('{month}') TO ('{following}')")
+        finally:
+            self.checkin(conn)
+        self._partitions.update(missing)
+
+
+def open_backend(url):
+    """The backend for a DATABASE / DATABASE_URL value."""
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresBackend(url)
+    return SQLiteBackend(url)
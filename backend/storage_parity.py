@@ -0,0 +1,100 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import analytics
+import budgets
+import datagen
+import db_handler
+import duplicates
+import migrations
+import search
+
+# One workload over the storage-facing calls (db_handler, search, budgets,
+# analytics, duplicates), run against whatever db_handler.DATABASE points at.
+# Results are normalized so SQLite and PostgreSQL can be compared call by call:
+# `python benchmark.py storage` times both, tests/test_storage_parity.py checks them.
+
+
+def _rounded(value):
+    # Floats to cents, recursively: SQLite and PostgreSQL sum doubles in different orders.
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_rounded(item) for item in value]
+    return value
+
+
+def run_workload(users, rows):
+    """Runs the workload against the current DATABASE; returns label -> (normalized result, ms)."""
+    search._vocab["loaded_at"] = None  # the vocabulary is per database
+    outcomes = {}
+
+    def run(label, fn, normalize=_rounded):
+        start = time.perf_counter()
+        result = fn()
+        outcomes[label] = (normalize(result), (time.perf_counter() - start) * 1000)
+        return result
+
+    run("migrate", migrations.migrate, normalize=lambda result: None)
+    run(f"datagen ({rows} rows)", lambda: datagen.generate(users, rows))
+    user = "user0"
+    run("signup (taken email)", lambda: db_handler.signup_user("dup", "Dup", "user1@example.com", "password"))
+    run("add_expense, allow", lambda: db_handler.add_expense(user, "Kroger", 12.34, "Groceries", "2025-06-02"))
+    run("add_expense, flag", lambda: db_handler.add_expense(
+        user, "KROGER ", 12.34, "Groceries", "06/02/2025", on_duplicate="flag"))
+    run("add_expense, reject", lambda: db_handler.add_expense(
+        user, "kroger", 12.34, "Groceries", "2025-06-02", on_duplicate="reject"))
+    run("add_expense, undated", lambda: db_handler.add_expense(user, "Cash", 5.0, "Miscellaneous", "sometime"))
+    run("add_expenses (100 rows)", lambda: db_handler.add_expenses(user, [
+        {"name": f"Batch {i}", "amount": i + 0.5, "category": "Groceries", "date": f"2026-0{i % 3 + 1}-15"}
+        for i in range(100)]))
+
+    page = run("get_expenses, page 1", lambda: db_handler.get_expenses(user, 50, sort="amount_desc"))
+    run("get_expenses, page 2", lambda: db_handler.get_expenses(user, 50, cursor=page["next_cursor"],
+                                                                sort="amount_desc"))
+    run("get_expenses, date range", lambda: db_handler.get_expenses(
+        user, start_date="2024-02-01", end_date="2024-02-29"))
+    run("get_expenses, name filter", lambda: db_handler.get_expenses(user, search="TRADER"))
+    run("iter_expenses, 2025", lambda: sum(1 for _ in db_handler.iter_expenses(user, "2025-01-01", "2025-12-31")))
+    for term in ("star", "home depot", "starbuks"):
+        # Relevance ties break differently (BM25 vs. ts_rank), so only the matching set has to agree.
+        run(f"search {term!r}, relevance", lambda: search.search_expenses(user, term, limit=500),
+            normalize=lambda result: sorted(expense["id"] for expense in result["expenses"]))
+        run(f"search {term!r}, by date", lambda: search.search_expenses(user, term, limit=100, sort="date_desc"))
+
+    run("set_threshold", lambda: db_handler.set_threshold(user, 5000))
+    run("check_budgets, threshold only", lambda: budgets.check_budgets(user, today=datetime(2025, 3, 15).date()))
+    run("get_category_totals", lambda: db_handler.get_category_totals(user, "2024-07"))
+    run("add_budget", lambda: budgets.add_budget(user, "Food", 400, "monthly", "Groceries"))
+    run("check_budgets", lambda: budgets.check_budgets(user, today=datetime(2025, 3, 15).date()))
+    # Neither query orders its rows, so compare the results sorted.
+    run("check_all_budgets", lambda: budgets.check_all_budgets(today=datetime(2025, 3, 15).date(), exceeded_only=False),
+        normalize=lambda result: _rounded({**result, "budgets": sorted(
+            result["budgets"], key=lambda budget: (budget["username"], budget["id"] or 0))}))
+    run("get_analytics", lambda: analytics.get_analytics(user, end_month="2025-12"))
+    run("find_duplicates", lambda: duplicates.find_duplicates())
+    run("delete_expenses", lambda: db_handler.delete_expenses(
+        [expense["id"] for expense in page["expenses"][:10]], user))
+    run("verify_monthly_totals", db_handler.verify_monthly_totals)
+    return outcomes
+
+
+@contextmanager
+def postgres_schema(url):
+    """Yields a DATABASE URL for a scratch schema in the PostgreSQL database at `url`, dropped afterwards."""
+    import psycopg2
+
+    schema = f"parity_{os.getpid()}"
+    admin = psycopg2.connect(url)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    try:
+        yield f"{url}{'&' if '?' in url else '?'}options=-csearch_path%3D{schema}"
+    finally:
+        db_handler.close_connections()  # pooled connections may still sit in the schema
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other by bare name, as when run from backend/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_handler  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A Flask test client over a fresh SQLite database in tmp_path."""
+    import app
+    import auth
+
+    monkeypatch.setattr(db_handler, "DATABASE", str(tmp_path / "users.db"))
+    monkeypatch.setattr(auth, "_keys", None)  # the generated signing key lives in the database
+    app.init_schema()
+    yield app.app.test_client()
+    db_handler.close_connections()
+
+
+@pytest.fixture
+def users(client):
+    """Signs up alice and bob; returns {username: bearer headers}."""
+    import auth
+
+    headers = {}
+    for username in ("alice", "bob"):
+        client.post("/api/signup", json={"username": username, "name": username.title(),
+                                         "email": f"{username}@example.com", "password": "password1"})
+        headers[username] = {"Authorization": f"Bearer {auth.issue_token(username)[0]}"}
+    return headers
@@ -0,0 +1,46 @@
+import auth
+import db_handler
+
+
+def _add(username):
+    return db_handler.add_expense(username, "Corner Store", 4.25, "Groceries", "2026-01-02")["expense_id"]
+
+
+def test_request_without_token_is_rejected(client, users):
+    expense_id = _add("bob")
+    assert client.get("/api/get_expenses?username=bob").status_code == 401
+    response = client.post("/api/delete_expenses", json={"username": "bob", "expense_ids": [expense_id]})
+    assert response.status_code == 401
+    assert len(db_handler.get_expenses("bob")["expenses"]) == 1
+
+
+def test_token_cannot_act_for_another_user(client, users):
+    expense_id = _add("bob")
+    response = client.post("/api/delete_expenses", json={"username": "bob", "expense_ids": [expense_id]},
+                           headers=users["alice"])
+    assert response.status_code == 403
+    assert client.get("/api/get_expenses?username=bob", headers=users["alice"]).status_code == 403
+
+
+def test_token_user_is_the_acting_user(client, users):
+    response = client.post("/api/add_expense", json={"name": "Cafe", "amount": 3.5, "category": "Food",
+                                                     "date": "2026-01-03"}, headers=users["alice"])
+    assert response.status_code == 200 and response.json["success"]
+    expenses = client.get("/api/get_expenses", headers=users["alice"]).json["expenses"]
+    assert [expense["name"] for expense in expenses] == ["Cafe"]
+    # Ids of someone else's expenses are left alone.
+    bobs = _add("bob")
+    client.post("/api/delete_expenses", json={"expense_ids": [bobs]}, headers=users["alice"])
+    assert len(db_handler.get_expenses("bob")["expenses"]) == 1
+
+
+def test_invalid_token_is_rejected(client, users):
+    response = client.get("/api/get_expenses", headers={"Authorization": "Bearer not.a-token"})
+    assert response.status_code == 401
+
+
+def test_opt_out_for_legacy_clients(client, users, monkeypatch):
+    monkeypatch.setattr(auth, "REQUIRED", False)
+    _add("bob")
+    response = client.get("/api/get_expenses?username=bob")
+    assert response.status_code == 200 and len(response.json["expenses"]) == 1
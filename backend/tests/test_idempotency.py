@@ -0,0 +1,51 @@
+import time
+
+import db_handler
+import idempotency
+
+EXPENSE = {"name": "Corner Store", "amount": 4.25, "category": "Groceries", "date": "2026-01-02",
+           "on_duplicate": "allow"}
+
+
+def _post(client, headers, key):
+    return client.post("/api/add_expense", json=EXPENSE, headers={**headers, "Idempotency-Key": key})
+
+
+def _claim_left_behind(key, age):
+    # What a worker killed between claiming a key and finishing the request leaves in the table.
+    with db_handler.get_connection() as conn:
+        conn.execute("INSERT INTO idempotency_keys (username, endpoint, key, created_at) VALUES (?, ?, ?, ?)",
+                     ("alice", "add_expense", key, time.time() - age))
+
+
+def test_retry_replays_the_stored_response(client, users):
+    first = _post(client, users["alice"], "k1")
+    retry = _post(client, users["alice"], "k1")
+    assert retry.json == first.json and retry.headers["Idempotent-Replayed"] == "true"
+    assert len(db_handler.get_expenses("alice")["expenses"]) == 1
+
+
+def test_live_claim_gets_409(client, users):
+    _claim_left_behind("k2", age=1)
+    assert _post(client, users["alice"], "k2").status_code == 409
+    assert db_handler.get_expenses("alice")["expenses"] == []
+
+
+def test_dead_claimant_is_taken_over_after_the_lease(client, users):
+    _claim_left_behind("k3", age=idempotency.LEASE_SECONDS + 1)
+    response = _post(client, users["alice"], "k3")
+    assert response.status_code == 200 and response.json["success"]
+    assert "Idempotent-Replayed" not in response.headers
+    assert _post(client, users["alice"], "k3").headers["Idempotent-Replayed"] == "true"
+    assert len(db_handler.get_expenses("alice")["expenses"]) == 1
+
+
+def test_overtaken_claimant_does_not_overwrite(client, users):
+    claimed_at, _ = idempotency._claim("alice", "add_expense", "k4")
+    with db_handler.get_connection() as conn:
+        conn.execute("UPDATE idempotency_keys SET created_at = ? WHERE key = 'k4'",
+                     (claimed_at - idempotency.LEASE_SECONDS - 1,))
+    response = _post(client, users["alice"], "k4")  # takes the claim over
+    late = client.application.response_class('{"late": true}', status=200, mimetype="application/json")
+    idempotency._finish("alice", "add_expense", "k4", claimed_at, late)
+    assert _post(client, users["alice"], "k4").json == response.json
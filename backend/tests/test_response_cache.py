@@ -0,0 +1,26 @@
+import app
+import db_handler
+import response_cache
+
+
+def _import(tmp_path, username):
+    statement = tmp_path / "statement.csv"
+    statement.write_text("Date,Description,Amount\n2026-01-05,Corner Store,-4.25\n")
+    return app.app.test_cli_runner().invoke(args=["import-statement", username, str(statement)])
+
+
+def test_cli_import_reaches_a_shared_server(client, users, tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "SHARED", True)
+    assert client.get("/api/get_expenses", headers=users["alice"]).json["expenses"] == []
+
+    assert _import(tmp_path, "alice").exit_code == 0
+    assert len(client.get("/api/get_expenses", headers=users["alice"]).json["expenses"]) == 1
+
+
+def test_cli_writes_bump_database_versions_without_shared(client, users, tmp_path):
+    # The CLI process isn't the server, so its own in-memory versions would reach no one.
+    assert not response_cache.SHARED
+    assert _import(tmp_path, "alice").exit_code == 0
+    with db_handler.get_connection() as conn:
+        assert conn.execute("SELECT version FROM cache_versions WHERE username = 'alice' AND scope = 'expenses'"
+                            ).fetchone()[0] == 1
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import db_handler
+import storage_parity
+
+# The storage_parity workload on SQLite and, given BENCH_POSTGRES_URL, on a
+# scratch schema in that PostgreSQL database: each backend on its own, then
+# every call's result compared between the two.
+POSTGRES_URL = os.getenv("BENCH_POSTGRES_URL")
+USERS = 5
+ROWS = 2000
+
+
+def _run_on(database):
+    previous = db_handler.DATABASE
+    db_handler.DATABASE = database
+    try:
+        return storage_parity.run_workload(USERS, ROWS)
+    finally:
+        db_handler.DATABASE = previous
+        db_handler.close_connections()
+
+
+@pytest.fixture(scope="module")
+def sqlite_outcomes(tmp_path_factory):
+    return _run_on(str(tmp_path_factory.mktemp("sqlite") / "parity.db"))
+
+
+@pytest.fixture(scope="module")
+def postgresql_outcomes():
+    if not POSTGRES_URL:
+        pytest.skip("set BENCH_POSTGRES_URL=postgresql://... to test against PostgreSQL")
+    with storage_parity.postgres_schema(POSTGRES_URL) as url:
+        return _run_on(url)
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def outcomes(request):
+    return {label: result for label, (result, _) in request.getfixturevalue(f"{request.param}_outcomes").items()}
+
+
+def test_writes_succeed(outcomes):
+    for label in ("add_expense, allow", "add_expense, flag", "add_expenses (100 rows)", "set_threshold",
+                  "add_budget", "delete_expenses"):
+        assert outcomes[label]["success"], (label, outcomes[label])
+    assert outcomes["add_expenses (100 rows)"]["count"] == 100
+
+
+def test_duplicate_policies(outcomes):
+    assert outcomes["add_expense, flag"]["duplicate_of"] == outcomes["add_expense, allow"]["expense_id"]
+    rejected = outcomes["add_expense, reject"]
+    assert not rejected["success"] and rejected["duplicate_of"] == outcomes["add_expense, allow"]["expense_id"]
+    assert not outcomes["signup (taken email)"]["success"]
+
+
+def test_pages_do_not_overlap(outcomes):
+    first, second = outcomes["get_expenses, page 1"], outcomes["get_expenses, page 2"]
+    assert len(first["expenses"]) == 50
+    assert not {e["id"] for e in first["expenses"]} & {e["id"] for e in second["expenses"]}
+
+
+def test_rollups_match_expenses(outcomes):
+    assert outcomes["verify_monthly_totals"]["consistent"], outcomes["verify_monthly_totals"]["mismatches"]
+
+
+def test_postgresql_matches_sqlite(sqlite_outcomes, postgresql_outcomes):
+    differences = {label: {"sqlite": expected, "postgresql": postgresql_outcomes[label][0]}
+                   for label, (expected, _) in sqlite_outcomes.items()
+                   if postgresql_outcomes[label][0] != expected}
+    assert not differences
@@ -18,6 +18,7 @@ function App() {
   const handleLogout = () => {
     setLoggedInUser(null);
     localStorage.removeItem("loggedInUser");
+    localStorage.removeItem("authToken");
   };
 
   return (
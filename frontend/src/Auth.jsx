@@ -26,7 +26,8 @@ const Auth = () => {
 
       const data = await response.json();
       if (data.success) {
-        localStorage.setItem("loggedInUser", formData.username);
+        localStorage.setItem("loggedInUser", data.username);
+        localStorage.setItem("authToken", data.token);
         navigate("/home");
       } else {
         setMessage(data.message);
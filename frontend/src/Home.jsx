@@ -2,6 +2,9 @@ import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import "./Home.css";
 import logo from "./assets/logo.png";
+import { authHeaders } from "./authHeaders";
+
+const PAGE_SIZE = 50;
 
 const Home = () => {
   const navigate = useNavigate();
@@ -11,7 +14,10 @@ const Home = () => {
   const [expenses, setExpenses] = useState([]);
   const [filteredExpenses, setFilteredExpenses] = useState([]);
   const [searchQuery, setSearchQuery] = useState("");
-  const [isAscending, setIsAscending] = useState(true);
+  const [isAscending, setIsAscending] = useState(false);
+  const [byRelevance, setByRelevance] = useState(false);
+  const [searchCorrection, setSearchCorrection] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
   const [isSidebarOpen, setIsSidebarOpen] = useState(false);
 
   // States for add/delete/upload functionality
@@ -29,6 +35,7 @@ const Home = () => {
   const [monthlySpent, setMonthlySpent] = useState(0); // NEW: For threshold check
   const [spendingLimit, setSpendingLimit] = useState(0);
   const [thresholdExceeded, setThresholdExceeded] = useState(false);
+  const [categoriesMap, setCategoriesMap] = useState({});
 
   useEffect(() => {
     if (!username) {
@@ -36,6 +43,7 @@ const Home = () => {
     } else {
       fetchUserInfo();
       fetchExpenses();
+      fetchCategoryTotals();
       checkThreshold();
       
       // Check if Upload Modal should be opened after navigating to Home
@@ -50,7 +58,8 @@ const Home = () => {
   const fetchUserInfo = async () => {
     try {
       const response = await fetch(
-        `http://127.0.0.1:5000/api/get_user_info?username=${username}`
+        `http://127.0.0.1:5000/api/get_user_info?username=${username}`,
+        { headers: authHeaders() }
       );
       const data = await response.json();
       if (data.success) {
@@ -61,15 +70,32 @@ const Home = () => {
     }
   };
 
-  // Fetch all expenses
-  const fetchExpenses = async () => {
+  // Fetch one page of expenses; search and sort run on the server.
+  // A search query goes to the full-text endpoint, ranked by relevance
+  // until the user sorts by date.
+  const fetchExpenses = async ({
+    query = searchQuery,
+    ascending = isAscending,
+    relevance = byRelevance,
+    cursor = null,
+  } = {}) => {
+    const dateSort = ascending ? "date_asc" : "date_desc";
+    const params = new URLSearchParams({
+      username,
+      limit: PAGE_SIZE,
+      sort: query && relevance ? "relevance" : dateSort,
+    });
+    if (query) params.append("q", query);
+    if (cursor) params.append("cursor", cursor);
+    const endpoint = query ? "search_expenses" : "get_expenses";
+
     try {
       const response = await fetch(
-        `http://127.0.0.1:5000/api/get_expenses?username=${username}`
+        `http://127.0.0.1:5000/api/${endpoint}?${params}`,
+        { headers: authHeaders() }
       );
       const data = await response.json();
       if (data.success) {
-        // Format and sort by date desc
         const formattedExpenses = data.expenses.map((expense) => {
           const dateObj = new Date(expense.date);
           const formattedDate = `${
@@ -82,25 +108,43 @@ const Home = () => {
           return {
             ...expense,
             date: formattedDate,
-            timestamp: dateObj.getTime(),
           };
         });
 
-        // Sort newest first by default
-        formattedExpenses.sort((a, b) => b.timestamp - a.timestamp);
-        setExpenses(formattedExpenses);
-        setFilteredExpenses(formattedExpenses);
+        // Append when loading the next page, replace otherwise
+        const merge = (prev) =>
+          cursor ? [...prev, ...formattedExpenses] : formattedExpenses;
+        setExpenses(merge);
+        setFilteredExpenses(merge);
+        setNextCursor(data.next_cursor);
+        const corrected = Object.values(data.corrections || {}).map((words) => words[0]);
+        setSearchCorrection(corrected.length ? `Showing results for "${corrected.join(" ")}"` : "");
       }
     } catch (error) {
       console.error("Error fetching expenses:", error);
     }
   };
 
+  // Fetch per-category totals (served from the backend rollup)
+  const fetchCategoryTotals = async () => {
+    try {
+      const response = await fetch(
+        `http://127.0.0.1:5000/api/get_category_totals?username=${username}`,
+        { headers: authHeaders() }
+      );
+      const data = await response.json();
+      if (data.success) {
+        setCategoriesMap(data.categories);
+      }
+    } catch (error) {
+      console.error("Error fetching category totals:", error);
+    }
+  };
 
   // NEW: Check if the user has exceeded the spending threshold
   const checkThreshold = async () => {
     try {
-      const response = await fetch(`http://127.0.0.1:5000/api/check_threshold?username=${username}`);
+      const response = await fetch(`http://127.0.0.1:5000/api/check_threshold?username=${username}`, { headers: authHeaders() });
       const data = await response.json();
 
       if (data.success) {
@@ -115,25 +159,28 @@ const Home = () => {
 
   // SORT by date
   const handleSort = () => {
-    const sortedExpenses = [...filteredExpenses].sort((a, b) =>
-      isAscending ? b.timestamp - a.timestamp : a.timestamp - b.timestamp
-    );
-    setFilteredExpenses(sortedExpenses);
-    setIsAscending(!isAscending);
+    const ascending = !isAscending;
+    setIsAscending(ascending);
+    setByRelevance(false);
+    fetchExpenses({ ascending, relevance: false });
   };
 
   // SEARCH by name
   const handleSearch = () => {
-    const filtered = expenses.filter((expense) =>
-      expense.name.toLowerCase().includes(searchQuery.toLowerCase())
-    );
-    setFilteredExpenses(filtered);
+    setByRelevance(true);
+    fetchExpenses({ query: searchQuery, relevance: true });
   };
 
   // RESET search
   const handleReset = () => {
-    setFilteredExpenses(expenses);
     setSearchQuery("");
+    setByRelevance(false);
+    fetchExpenses({ query: "", relevance: false });
+  };
+
+  // LOAD the next page of transactions
+  const handleLoadMore = () => {
+    fetchExpenses({ cursor: nextCursor });
   };
 
   // Input changes in "Add Transaction" form
@@ -147,19 +194,28 @@ const Home = () => {
     setMessage("");
 
     const payload = { ...formData, username };
+    // One key per submission, so a retried request can't add the expense twice
+    const idempotencyKey = crypto.randomUUID();
 
     try {
       const response = await fetch("http://127.0.0.1:5000/api/add_expense", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: authHeaders({
+          "Content-Type": "application/json",
+          "Idempotency-Key": idempotencyKey,
+        }),
         body: JSON.stringify(payload),
       });
 
       const data = await response.json();
       if (data.success) {
         await fetchExpenses(); // Refresh
+        fetchCategoryTotals();
         setFormData({ name: "", amount: "", category: "", date: "" });
         setIsModalOpen(false);
+        if (data.duplicate_of) {
+          alert(data.message);
+        }
       } else {
         setMessage(data.message);
       }
@@ -180,6 +236,7 @@ const Home = () => {
   const handleLogout = () => {
     // remove the username from localStorage
     localStorage.removeItem("loggedInUser");
+    localStorage.removeItem("authToken");
   
     // redirect user to the /signin page
     navigate("/signin");
@@ -196,8 +253,8 @@ const Home = () => {
     try {
       const response = await fetch("http://127.0.0.1:5000/api/delete_expenses", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ expense_ids: selectedExpenses }),
+        headers: authHeaders({ "Content-Type": "application/json" }),
+        body: JSON.stringify({ username, expense_ids: selectedExpenses }),
       });
 
       const data = await response.json();
@@ -209,6 +266,7 @@ const Home = () => {
           prev.filter((exp) => !selectedExpenses.includes(exp.id))
         );
         setSelectedExpenses([]);
+        fetchCategoryTotals();
       } else {
         alert(data.message);
       }
@@ -230,17 +288,45 @@ const Home = () => {
     try {
       const response = await fetch("http://127.0.0.1:5000/api/upload_expense", {
         method: "POST",
+        headers: authHeaders({ "Idempotency-Key": crypto.randomUUID() }),
         body: uploadForm,
       });
       const data = await response.json();
       setUploadMessage(data.message);
 
       if (data.success) {
+        pollUploadStatus(data.job_id);
+      }
+    } catch (error) {
+      setUploadMessage("Error uploading receipt.");
+    }
+  };
+
+  // Poll the background receipt job until it finishes
+  const pollUploadStatus = async (jobId) => {
+    try {
+      const response = await fetch(
+        `http://127.0.0.1:5000/api/upload_status?username=${username}&job_id=${jobId}`,
+        { headers: authHeaders() }
+      );
+      const data = await response.json();
+      if (!data.success) {
+        setUploadMessage(data.message);
+      } else if (data.status === "done") {
+        setUploadMessage(data.result.message);
         await fetchExpenses();
+        fetchCategoryTotals();
         setTimeout(() => setIsUploadModalOpen(false), 1000);
+      } else if (data.status === "failed") {
+        setUploadMessage(data.error);
+      } else {
+        setUploadMessage(
+          data.status === "saving" ? "Saving expense..." : "Reading receipt..."
+        );
+        setTimeout(() => pollUploadStatus(jobId), 1000);
       }
     } catch (error) {
-      setUploadMessage("Error uploading receipt.");
+      setUploadMessage("Error checking upload status.");
     }
   };
 
@@ -248,12 +334,6 @@ const Home = () => {
   // STACKED BAR BY CATEGORY
   // ----------------------------------------------------------------------------------
 
-  const categoriesMap = expenses.reduce((acc, expense) => {
-    const cat = expense.category || "Uncategorized";
-    acc[cat] = (acc[cat] || 0) + parseFloat(expense.amount);
-    return acc;
-  }, {});
-
   const totalSpent = Object.values(categoriesMap).reduce((sum, val) => sum + val, 0);
 
   const colorPalette = [
@@ -427,6 +507,7 @@ const Home = () => {
       {/* Transactions Table */}
       <div className="expense-table-container">
         <h3>Transactions</h3>
+        {searchCorrection && <p className="search-correction">{searchCorrection}</p>}
         <table>
           <thead>
             <tr>
@@ -440,7 +521,11 @@ const Home = () => {
           <tbody>
             {filteredExpenses.length > 0 ? (
               filteredExpenses.map((expense, index) => (
-                <tr key={index}>
+                <tr
+                  key={index}
+                  className={expense.duplicate_of ? "possible-duplicate" : undefined}
+                  title={expense.duplicate_of ? "Possible duplicate" : undefined}
+                >
                   <td>
                     <input
                       type="checkbox"
@@ -463,6 +548,11 @@ const Home = () => {
             )}
           </tbody>
         </table>
+        {nextCursor && (
+          <button className="control-btn load-more-btn" onClick={handleLoadMore}>
+            Load more
+          </button>
+        )}
       </div>
 
       {/* Add / Delete Buttons */}
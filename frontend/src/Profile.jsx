@@ -2,6 +2,7 @@ import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import "./Profile.css"; // Ensure correct path
 import logo from "./assets/logo.png"; // Ensure correct path
+import { authHeaders } from "./authHeaders";
 
 const Profile = () => {
   const navigate = useNavigate();
@@ -22,7 +23,7 @@ const Profile = () => {
 
   const fetchUserProfile = async () => {
     try {
-      const response = await fetch(`http://127.0.0.1:5000/api/get_user_info?username=${username}`);
+      const response = await fetch(`http://127.0.0.1:5000/api/get_user_info?username=${username}`, { headers: authHeaders() });
       const data = await response.json();
       if (data.success) {
         setUserInfo({ name: data.name, username: username, email: data.email });
@@ -37,7 +38,7 @@ const Profile = () => {
     try {
       const response = await fetch("http://127.0.0.1:5000/api/update_profile", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: authHeaders({ "Content-Type": "application/json" }),
         body: JSON.stringify({ 
           username, 
           name: editedUserInfo.name, 
@@ -61,6 +62,7 @@ const Profile = () => {
 
   const handleLogout = () => {
     localStorage.removeItem("loggedInUser");
+    localStorage.removeItem("authToken");
     navigate("/");
   };
 
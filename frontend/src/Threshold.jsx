@@ -2,6 +2,7 @@ import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import "./Threshold.css"; 
 import logo from "./assets/logo.png"; // Ensure correct path
+import { authHeaders } from "./authHeaders";
 
 const Threshold = () => {
   const navigate = useNavigate();
@@ -18,7 +19,7 @@ const Threshold = () => {
     if (!username) return;
 
     try {
-      const response = await fetch(`http://127.0.0.1:5000/api/get_threshold?username=${username}`);
+      const response = await fetch(`http://127.0.0.1:5000/api/get_threshold?username=${username}`, { headers: authHeaders() });
       const data = await response.json();
       if (data.success) {
         setThreshold(data.threshold);
@@ -35,7 +36,7 @@ const Threshold = () => {
     try {
       const response = await fetch("http://127.0.0.1:5000/api/set_threshold", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: authHeaders({ "Content-Type": "application/json" }),
         body: JSON.stringify({ username, amount: parseFloat(threshold) }),
       });
 
@@ -48,6 +49,7 @@ const Threshold = () => {
 
   const handleLogout = () => {
     localStorage.removeItem("loggedInUser");
+    localStorage.removeItem("authToken");
     navigate("/");
   };
 
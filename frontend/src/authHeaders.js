@@ -0,0 +1,5 @@
+// Adds the session token from /api/signin, so the backend knows who is asking.
+export const authHeaders = (headers = {}) => {
+  const token = localStorage.getItem("authToken");
+  return token ? { ...headers, Authorization: `Bearer ${token}` } : headers;
+};